@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+## This script times the data-heavy helpers of the examples on synthetic inputs of increasing size
+## and writes the results, with the peak memory allocated by each call, to a JSON report, i.e.
+## ./ci/run_benchmarks.py --max-rows 1000000 --report benchmarks.json [BENCHMARK ...]
+## Inputs are generated on the fly; the Instron files are modelled on RT-loadtofail_10e-3.txt.
+## With --baseline, the report is compared to an earlier one and the script exits non-zero when a
+## benchmark got slower, or allocated more, by more than --tolerance.
+
+from __future__ import print_function
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from timeit import default_timer
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "citrination_api_examples"),
+                os.path.join(ROOT, "citrination_api_examples", "clients_sequence"),
+                os.path.join(ROOT, "synthetic_data_examples")]
+
+# time comparisons below this many seconds are timer noise
+TIME_FLOOR = 0.001
+SIZES = (10**3, 10**4, 10**5, 10**6, 10**7)
+BENCHMARKS = []
+
+INSTRON_HEADER = (
+    "MTS793|MPT|ENU|1|2|.|/|:|1|0|0|A\n"
+    "\n"
+    "Data Acquisition\t\t\t\t\t\tTime:\t102.54224\tSec\t7/5/2010 1:24:13 PM\n"
+    "Axial Displacement\tAxial Force\tAxial Strain\tTime\n"
+    "mm\tN\tmm/mm\tSec\n"
+)
+
+
+def benchmark(name, sizes=SIZES):
+    """ register a benchmark; the decorated setup(size, data_dir) returns the untimed state and the call to time """
+    def register(setup):
+        BENCHMARKS.append((name, sizes, setup))
+        return setup
+    return register
+
+
+def instron_file(data_dir, rows, seed=0, chunk_size=100000):
+    """ synthetic load-to-failure export with the given number of rows, written once per size """
+    path = os.path.join(data_dir, "loadtofail_{}.txt".format(rows))
+    if os.path.exists(path):
+        return path
+    rng = np.random.RandomState(seed)
+    with open(path, "w") as f:
+        f.write(INSTRON_HEADER)
+        for start in range(0, rows, chunk_size):
+            i = np.arange(start, min(start + chunk_size, rows), dtype=np.float64)
+            strain = 0.05 * i / rows - 0.1867 + rng.normal(0, 2e-5, len(i))
+            # elastic rise to a plateau near 4 kN, with load cell noise
+            force = 4000 * np.tanh((strain + 0.1867) / 0.01) + rng.normal(0, 1.0, len(i))
+            displacement = 25.0 * (strain + 0.1867)
+            np.savetxt(f, np.column_stack((displacement, force, strain, 0.1 * i + 0.1389)),
+                       fmt="%.8g", delimiter="\t")
+    return path
+
+
+@benchmark("thermo_extract_data")
+def thermo_extract_data(size, data_dir):
+    from thermo_mechanical_analysis import Thermo
+    thermo = Thermo(instron_file(data_dir, size))
+    return thermo.extract_data
+
+
+@benchmark("thermo_calc_elastic_modulus")
+def thermo_calc_elastic_modulus(size, data_dir):
+    from thermo_mechanical_analysis import Thermo
+    thermo = Thermo(instron_file(data_dir, size))
+    thermo.extract_data()
+
+    def run():
+        thermo.strain = thermo.data[:, 2]  # calc_elastic_modulus replaces it with the smoothed strain
+        thermo.calc_elastic_modulus()
+    return run
+
+
+@benchmark("thermo_html_section")
+def thermo_html_section(size, data_dir):
+    from thermo_mechanical_analysis import Thermo
+    thermo = Thermo(instron_file(data_dir, size))
+    thermo.extract_data()
+    thermo.calc_elastic_modulus()
+    return thermo.html_section
+
+
+@benchmark("smooth_spline")
+def smooth_spline(size, data_dir):
+    from thermo_mechanical_analysis import smooth_spline
+    y = np.cumsum(np.random.RandomState(0).normal(size=size))
+    return lambda: smooth_spline(y, 51, 3)
+
+
+@benchmark("write_dataset_from_func", sizes=SIZES[:4])
+def write_dataset_from_func(size, data_dir):
+    from sequential_learning_wrappers import write_dataset_from_func
+    x = np.random.RandomState(0).normal(3.0, 1.0, size=(size, 2))
+    path = os.path.join(data_dir, "dataset.json")
+
+    def toy_func(rows):
+        return np.sum(np.square(rows), axis=1)
+    return lambda: write_dataset_from_func(toy_func, path, x, vectorized=True, indent=None)
+
+
+@benchmark("create_clusters")
+def create_clusters(size, data_dir):
+    from synthetic_data import create_clusters
+    return lambda: create_clusters(size, 4, seed=0)
+
+
+@benchmark("write_cluster_csv", sizes=SIZES[:4])
+def write_cluster_csv(size, data_dir):
+    from synthetic_data import create_clusters, write_cluster_csv
+    x, y = create_clusters(size, 4, seed=0)
+    path = os.path.join(data_dir, "cluster_data.csv")
+    return lambda: write_cluster_csv(path, x, y)
+
+
+@benchmark("write_clusters_chunked", sizes=SIZES[:4])
+def write_clusters_chunked(size, data_dir):
+    from synthetic_data import write_clusters
+    path = os.path.join(data_dir, "cluster_data_chunked.csv")
+    return lambda: write_clusters(path, size, 4, seed=0, chunk_size=10**5)
+
+
+def _projection(size):
+    from citrination_client.models.projection import Projection
+    rng = np.random.RandomState(0)
+    xy = rng.normal(scale=30.0, size=(size, 2))
+    return Projection(xy[:, 0].tolist(), xy[:, 1].tolist(), rng.uniform(0, 5, size).tolist(),
+                      [""] * size, ["1/1/{}".format(i) for i in range(size)])
+
+
+@benchmark("tsne_index_build")
+def tsne_index_build(size, data_dir):
+    from projection_index import ProjectionIndex
+    projection = _projection(size)
+    return lambda: ProjectionIndex(projection)
+
+
+@benchmark("tsne_most_similar")
+def tsne_most_similar(size, data_dir):
+    from projection_index import ProjectionIndex
+    index = ProjectionIndex(_projection(size))
+    # the ten nearest neighbors of a thousand materials, as in TsneDemo
+    rows = np.random.RandomState(1).randint(0, size, 1000)
+    return lambda: index.most_similar(rows, 10)
+
+
+def measure(name, size, setup, data_dir, repeat, max_time):
+    """ best and median wall time over up to repeat calls, then the peak memory of one more call """
+    run = setup(size, data_dir)
+    times = []
+    while len(times) < repeat and sum(times) < max_time:
+        start = default_timer()
+        run()
+        times.append(default_timer() - start)
+    # traced separately, since tracing slows allocation down; only memory allocated by the call counts
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "name": name,
+        "rows": size,
+        "repeat": len(times),
+        "seconds": round(min(times), 6),
+        "median_seconds": round(float(np.median(times)), 6),
+        "rows_per_second": round(size / min(times), 1) if min(times) > 0 else None,
+        "peak_bytes": peak,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """ benchmarks slower or allocating more than the baseline by more than tolerance, as printable lines """
+    previous = dict(((r["name"], r["rows"]), r) for r in baseline["benchmarks"])
+    regressions = []
+    for result in results:
+        old = previous.get((result["name"], result["rows"]))
+        if old is None:
+            continue
+        for key in ("seconds", "peak_bytes"):
+            if key == "seconds" and max(old[key], result[key]) < TIME_FLOOR:
+                continue
+            if old[key] and result[key] > old[key] * (1 + tolerance):
+                regressions.append("{} rows={}: {} {} -> {} ({:+.0%})".format(
+                    result["name"], result["rows"], key, old[key], result[key], result[key] / old[key] - 1))
+    return regressions
+
+
+def get_options():
+    parser = argparse.ArgumentParser(description="Time the example helpers on synthetic inputs")
+    parser.add_argument("benchmarks", nargs="*", default=["*"], help="names or glob patterns of benchmarks to run")
+    parser.add_argument("-n", "--max-rows", type=int, default=10**6, help="largest input size to run")
+    parser.add_argument("--repeat", type=int, default=5, help="timed calls per benchmark and size")
+    parser.add_argument("--max-time", type=float, default=10.0,
+                        help="stop repeating once a benchmark has taken this many seconds")
+    parser.add_argument("-r", "--report", default=None, help="JSON file to write the report to")
+    parser.add_argument("-b", "--baseline", default=None, help="earlier report to compare against")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.2, help="allowed relative slowdown or growth")
+    parser.add_argument("-d", "--data-dir", default=None,
+                        help="directory to keep the generated inputs in between runs, defaults to a temporary one")
+    parser.add_argument("-l", "--list", action="store_true", help="list the benchmarks and exit")
+    return parser.parse_args()
+
+
+def main():
+    options = get_options()
+    if options.list:
+        for name, sizes, _ in BENCHMARKS:
+            print("{} {}".format(name, " ".join(str(size) for size in sizes)))
+        return
+
+    selected = [(name, sizes, setup) for name, sizes, setup in BENCHMARKS
+                if any(fnmatch.fnmatch(name, pattern) for pattern in options.benchmarks)]
+    data_dir = options.data_dir or tempfile.mkdtemp(prefix="benchmarks_")
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+    results = []
+    try:
+        for name, sizes, setup in selected:
+            for size in sizes:
+                if size > options.max_rows:
+                    continue
+                result = measure(name, size, setup, data_dir, options.repeat, options.max_time)
+                print("{:<28} {:>9} rows {:>10.4f}s {:>14,.0f} rows/s {:>8.1f} MB peak".format(
+                    name, size, result["seconds"], result["rows_per_second"] or 0, result["peak_bytes"] / 1e6))
+                sys.stdout.flush()
+                results.append(result)
+    finally:
+        if options.data_dir is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "benchmarks": results,
+    }
+    if options.report is not None:
+        with open(options.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if options.baseline is not None:
+        with open(options.baseline) as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+        if regressions:
+            print("Regressions against {}:".format(options.baseline))
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("No regressions against {}".format(options.baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,549 @@
+#!/usr/bin/env python
+
+## This script runs quick correctness checks of the example helpers, offline, i.e.
+## ./ci/run_checks.py [CHECK ...]
+## Checks needing the API run against the local mock server in clients_sequence/mock_citrination.py.
+## It exits non-zero if any check fails.
+
+from __future__ import print_function
+
+import argparse
+import fnmatch
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+from contextlib import contextmanager
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "citrination_api_examples"),
+                os.path.join(ROOT, "citrination_api_examples", "clients_sequence")]
+
+CHECKS = []
+
+
+def check(name):
+    """ register a check; the decorated function raises AssertionError on failure """
+    def register(func):
+        CHECKS.append((name, func))
+        return func
+    return register
+
+
+@contextmanager
+def mock_client(**mock_options):
+    """ a CitrinationClient talking to a fresh mock server, in a temporary working directory """
+    from citrination_client import CitrinationClient
+    from mock_citrination import MockCitrination
+    workdir = tempfile.mkdtemp(prefix="checks_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with MockCitrination(**mock_options) as mock:
+            yield CitrinationClient(api_key="mock", site=mock.url), mock
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_async(coroutine):
+    """ runs a coroutine to completion on a fresh event loop; asyncio.run needs Python 3.7 """
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def toy_func(inputs):
+    return float(np.sum(np.square(inputs)))
+
+
+SL_INPUTS = ["Property x1", "Property x2"]
+
+
+def sl_campaign(client, name, seed=0, num_initial=20, **settings):
+    """ uploads a toy dataset, builds a view on it and returns the keyword arguments of sl_scheduler.run_campaign """
+    from sequential_learning_wrappers import build_view_and_get_id, upload_data_and_get_id, write_dataset_from_func
+    filename = "{}.json".format(name)
+    write_dataset_from_func(toy_func, filename, np.random.RandomState(seed).normal(loc=3.0, size=(num_initial, 2)))
+    dataset_id = upload_data_and_get_id(client, name, filename)
+    view_id = build_view_and_get_id(client, dataset_id, SL_INPUTS, ["Property y"], name, wait_time=0.01)
+    campaign = dict(view_id=str(view_id), dataset_id=str(dataset_id), num_candidates_per_iter=5, design_effort=5,
+                    num_sl_iterations=2, input_properties=SL_INPUTS, target=["Property y", "Min"],
+                    true_function=toy_func, score_type="MLI")
+    campaign.update(settings)
+    return campaign
+
+
+@check("search_cache_round_trip")
+def search_cache_round_trip():
+    from search_cache import CachedSearchClient, SearchCache
+    from sequential_learning_wrappers import (_dataset_query, _iter_dataset_hits, upload_data_and_get_id,
+                                              write_dataset_from_func)
+    with mock_client() as (client, _):
+        write_dataset_from_func(toy_func, "data.json", np.random.RandomState(0).normal(size=(30, 2)))
+        dataset_id = upload_data_and_get_id(client, "checks", "data.json")
+        live = client.search.pif_search(_dataset_query(dataset_id, 10, 0))
+        client.search = CachedSearchClient(client.search, SearchCache("searches.sqlite"))
+        client.search.pif_search(_dataset_query(dataset_id, 10, 0))
+        cached = client.search.pif_search(_dataset_query(dataset_id, 10, 0))
+        assert client.search.hits == 1, "second search was not served from the cache"
+        assert cached.total_num_hits == live.total_num_hits, (cached.total_num_hits, live.total_num_hits)
+        assert cached.max_score == live.max_score, (cached.max_score, live.max_score)
+        assert cached.as_dictionary()["hits"] == live.as_dictionary()["hits"]
+        assert len(list(_iter_dataset_hits(client, dataset_id, page_size=10))) == 30
+
+
+@check("prediction_cache_retrain")
+def prediction_cache_retrain():
+    from batch_predict import PredictionCache, predict, predicted_arrays
+    from sequential_learning_wrappers import build_view_and_get_id, upload_data_and_get_id, write_dataset_from_func
+    rng = np.random.RandomState(0)
+    candidates = [{"Property x1": str(x1), "Property x2": str(x2)} for x1, x2 in rng.normal(size=(20, 2))]
+    with mock_client() as (client, mock):
+        def predict_calls():
+            return mock.call_summary().get("submit_prediction", (0, 0.0))[0]
+        write_dataset_from_func(toy_func, "data.json", rng.normal(size=(30, 2)))
+        dataset_id = upload_data_and_get_id(client, "checks", "data.json")
+        view_id = str(build_view_and_get_id(client, dataset_id, ["Property x1", "Property x2"], ["Property y"],
+                                            "checks", wait_time=0.01))
+        cache = PredictionCache("predictions.sqlite")
+        before = predicted_arrays(predict(client, view_id, candidates, cache=cache), "Property y")[0]
+        calls = predict_calls()
+        predict(client, view_id, candidates, cache=cache)
+        assert predict_calls() == calls, "unchanged view was not served from the cache"
+
+        # the mock moves the view's updated_at on every retrain; this only checks that predict re-keys the cache when
+        # the view metadata changes, whether real Citrination metadata does so is the assumption of view_model_version
+        write_dataset_from_func(toy_func, "more.json", rng.normal(loc=2.0, size=(30, 2)))
+        upload_data_and_get_id(client, "", "more.json", given_dataset_id=dataset_id)
+        client.models.retrain(view_id)
+        after = predicted_arrays(predict(client, view_id, candidates, cache=cache), "Property y")[0]
+        assert predict_calls() > calls, "retrained view was served from the cache"
+        assert not np.allclose(before, after), "predictions did not change after the retrain"
+
+
+@check("sliding_modulus_sample_file")
+def sliding_modulus_sample_file():
+    from thermo_mechanical_analysis import Thermo, sliding_modulus, smooth_spline
+    thermo = Thermo(os.path.join(ROOT, "citrination_api_examples", "RT-loadtofail_10e-3.txt"))
+    thermo.extract_data()
+    peak = int(np.argmax(thermo.stress))
+    for strain in (thermo.strain, smooth_spline(thermo.strain, 51, 3)):
+        for window in (50, 100, 200, 400):
+            for criterion in ("r2", "stderr"):
+                slope, _, _, _, first, last = sliding_modulus(strain, thermo.stress, window, criterion=criterion)
+                # the elastic modulus of the sample is about 7e4 MPa, its plateau has slopes below 1e4
+                assert 5e4 < slope < 1.2e5, (window, criterion, slope, first, last)
+                assert last <= peak, (window, criterion, first, last, peak)
+
+
+@check("load_curve_malformed_line")
+def load_curve_malformed_line():
+    from thermo_mechanical_analysis import load_curve
+    row = "0.1 1.5 0.01 0.5\n"
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "curve.txt")
+        for line, message in (("0.2 1.6 0.02\n", "3 fields instead of 4"),
+                              ("0.2 1.6 0.02 0.6 9.0\n", "5 fields instead of 4"),
+                              ("0.2 abc 0.02 0.6\n", "not a number")):
+            with open(path, "w") as f:
+                f.write("Test header\n" + row * 3 + line + row * 3)
+            try:
+                load_curve(path)
+            except ValueError as e:
+                assert "line 5: " + message in str(e) and line.strip() in str(e), str(e)
+            else:
+                raise AssertionError("malformed line {!r} was read".format(line))
+        # runs of blanks between the fields, CRLF line ends and extra columns in every row are fine
+        with open(path, "w") as f:
+            f.write("Test header\r\n" + "  0.1   1.5\t0.01  0.5  7\r\n" * 3)
+        assert load_curve(path).tolist() == [[0.1, 1.5, 0.01, 0.5, 0.5]] * 3
+    finally:
+        shutil.rmtree(directory)
+
+
+@check("run_directory_bad_files")
+def run_directory_bad_files():
+    import csv
+    from thermo_mechanical_analysis import run_directory
+    directory = tempfile.mkdtemp()
+    try:
+        shutil.copy(os.path.join(ROOT, "citrination_api_examples", "RT-loadtofail_10e-3.txt"),
+                    os.path.join(directory, "good.txt"))
+        with open(os.path.join(directory, "empty.txt"), "w") as f:
+            f.write("Test header\nno data\n")
+        with open(os.path.join(directory, "short_row.txt"), "w") as f:
+            f.write("Test header\n0.1 1.5 0.01 0.5\n0.2 1.6 0.02\n")
+        for jobs in (1, 2):
+            with open(run_directory(directory, os.path.join(directory, "out"), jobs=jobs)) as f:
+                results = {os.path.basename(row["file"]): row for row in csv.DictReader(f)}
+            assert sorted(results) == ["empty.txt", "good.txt", "short_row.txt"], sorted(results)
+            assert not results["good.txt"]["error"] and float(results["good.txt"]["elastic_modulus"]) > 0
+            assert "empty.txt: no data rows" in results["empty.txt"]["error"], results["empty.txt"]["error"]
+            assert "short_row.txt, line 3" in results["short_row.txt"]["error"], results["short_row.txt"]["error"]
+    finally:
+        shutil.rmtree(directory)
+
+
+@check("smooth_spline_short_signal")
+def smooth_spline_short_signal():
+    from thermo_mechanical_analysis import smooth_spline
+    rng = np.random.RandomState(0)
+    for n in (10, 25, 26, 50, 51, 200):
+        y = rng.normal(size=n)
+        results = []
+        for chunk_size in (None, 4, 100):
+            for signal in (y, np.vstack((y, 2 * y))):
+                try:
+                    results.append(smooth_spline(signal, 51, 3, chunk_size=chunk_size))
+                except ValueError:
+                    results.append(None)
+        # a window of 51 mirrors 25 samples at each end, shorter signals are refused on every path
+        if n <= 25:
+            assert all(result is None for result in results), n
+            continue
+        for result in results:
+            assert result is not None and result.shape[-1] == n, n
+            assert np.allclose(result.reshape(-1, n)[0], results[0]), n
+
+
+@check("pif_columns_mixed_values")
+def pif_columns_mixed_values():
+    import subprocess
+    from pif_columns import extract_columns, property_column
+    records = [{"uid": "a", "properties": [{"name": "x", "scalars": [{"value": "1.5"}]}, {"name": "y", "scalars": 2}]},
+               {"uid": "b", "properties": [{"name": "x", "scalars": "n/a"}]},
+               {"system": {"uid": "c", "properties": [{"name": "x", "scalars": {"value": 2.5}}]}, "extracted": {"e": "3"}}]
+    columns = extract_columns(iter(records), properties=["x", "y"], extracted=["e"], fields=["uid"])
+    assert columns["x"].dtype == object and columns["x"].tolist() == [1.5, "n/a", 2.5], columns["x"]
+    assert columns["y"].dtype == np.float64 and columns["y"][0] == 2 and np.isnan(columns["y"][1:]).all()
+    assert columns["e"].dtype == np.float64 and np.isnan(columns["e"][:2]).all() and columns["e"][2] == 3
+    assert columns["uid"].tolist() == ["a", "b", "c"]
+    x = property_column(records, "x")
+    assert x[0] == 1.5 and np.isnan(x[1]) and x[2] == 2.5, x
+    # the SL wrappers import pif_columns, which must not need pandas
+    assert subprocess.call([sys.executable, "-c", "import sys, pif_columns; sys.exit('pandas' in sys.modules)"],
+                           cwd=os.path.join(ROOT, "citrination_api_examples", "clients_sequence")) == 0, \
+        "importing pif_columns imported pandas"
+
+
+@check("best_value_nan")
+def best_value_nan():
+    from sequential_learning_wrappers import _best_value
+    nan = float("nan")
+    # a NaN baseline, as from a dataset without numeric outputs, must not win or depend on the ordering
+    for values in ([nan, 3.0, 1.0], [3.0, nan, 1.0], [3.0, 1.0, nan]):
+        assert _best_value(values, ["y", "Min"]) == 1.0, values
+        assert _best_value(values, ["y", "Max"]) == 3.0, values
+    assert np.isnan(_best_value([nan, nan], ["y", "Min"]))
+    assert np.isnan(_best_value([], ["y", "Max"]))
+
+
+@check("bulk_download_complete_part")
+def bulk_download_complete_part():
+    from bulk_download import PART_SUFFIX, download_file
+    from sequential_learning_wrappers import upload_data_and_get_id, write_dataset_from_func
+    with mock_client() as (client, _):
+        write_dataset_from_func(toy_func, "data.json", np.random.RandomState(0).normal(size=(30, 2)))
+        dataset_id = upload_data_and_get_id(client, "checks", "data.json")
+        dataset_file = client.data.get_dataset_files(dataset_id)[0]
+        with open("data.json", "rb") as f:
+            content = f.read()
+        local_path = os.path.join("downloads", dataset_file.path.lstrip("/"))
+        part_path = local_path + PART_SUFFIX
+        assert download_file(dataset_file, "downloads") == len(content)
+
+        # a run stopped after the last chunk but before the rename leaves the whole file in the .part
+        os.replace(local_path, part_path)
+        assert download_file(dataset_file, "downloads", verify=True) == 0, "complete .part was downloaded again"
+        assert not os.path.exists(part_path)
+        with open(local_path, "rb") as f:
+            assert f.read() == content
+
+        # a .part longer than the remote file is no prefix of it and is dropped for the retry
+        os.remove(local_path)
+        with open(part_path, "wb") as f:
+            f.write(content + b"stale")
+        try:
+            download_file(dataset_file, "downloads")
+            raise AssertionError("oversized .part was promoted")
+        except IOError:
+            pass
+        assert not os.path.exists(part_path)
+        assert download_file(dataset_file, "downloads") == len(content)
+
+
+@check("upload_files_fail_fast")
+def upload_files_fail_fast():
+    from time import time
+    from sequential_learning_wrappers import upload_data_and_get_id, upload_files, write_dataset_from_func
+    with mock_client() as (client, _):
+        write_dataset_from_func(toy_func, "data.json", np.random.RandomState(0).normal(size=(10, 2)))
+        dataset_id = upload_data_and_get_id(client, "checks", "data.json")
+        # replacing a file keeps the file count, and must still verify
+        assert upload_data_and_get_id(client, "", "data.json", given_dataset_id=dataset_id) == dataset_id
+
+        start = time()
+        report = upload_files(client, dataset_id, ["data.json", "missing.json"], retries=3, backoff=5.0)
+        assert time() - start < 2.0, "a missing file was retried"
+        assert report.successes == ["data.json"], report.successes
+        assert list(report.failures) == ["missing.json"] and "ValueError" in report.failures["missing.json"]
+
+
+class StaleIngestClient(object):
+    """ a fake client whose ingest status reads "Finished" from the previous upload for `stale` seconds, then
+    "Processing" until `ready` seconds """
+
+    def __init__(self, stale, ready):
+        from time import time
+        self.data = self
+        self.start, self.stale, self.ready, self.checks = time(), stale, ready, 0
+
+    def get_ingest_status(self, dataset_id):
+        from time import time
+        self.checks += 1
+        elapsed = time() - self.start
+        return "Finished" if elapsed < self.stale or elapsed >= self.ready else "Processing"
+
+
+@check("wait_on_ingest_initial_delay")
+def wait_on_ingest_initial_delay():
+    from time import time
+    from async_waiters import wait_on_ingest
+    from sequential_learning_wrappers import _wait_on_ingest
+    client = StaleIngestClient(stale=0.05, ready=0.3)
+    _wait_on_ingest(client, 1, 0.1, print_output=False)
+    assert time() - client.start >= 0.3, "returned on the previous upload's status"
+
+    client = StaleIngestClient(stale=0.05, ready=0.3)
+    run_async(wait_on_ingest(client, 1, interval=0.1))
+    assert time() - client.start >= 0.3, "returned on the previous upload's status"
+
+
+@check("sl_scheduler_design_files")
+def sl_scheduler_design_files():
+    import glob
+    from sl_scheduler import run_campaigns
+    with mock_client() as (client, _):
+        campaigns = [sl_campaign(client, "campaign{}".format(i), seed=i) for i in range(2)]
+        temp_dirs = set(glob.glob(os.path.join(tempfile.gettempdir(), "sl_design_*")))
+        results = run_async(run_campaigns(client, campaigns, wait_time=0.01))
+        assert not [r for r in results if isinstance(r, Exception)], results
+        assert not glob.glob("design-*.json"), "design files were left in the working directory"
+        assert set(glob.glob(os.path.join(tempfile.gettempdir(), "sl_design_*"))) == temp_dirs, "temporary files left"
+        for campaign in campaigns:
+            designs = [path for path in client.data.list_files(campaign["dataset_id"]) if "design-" in path]
+            assert len(designs) == 2 and all(path.startswith("design-") for path in designs), designs
+
+
+class CountingCheck(object):
+    """ a status check that turns True on call number `done_after`, recording how many calls run at once """
+
+    def __init__(self, done_after=None, seconds=0.0):
+        import threading
+        self.done_after, self.seconds = done_after, seconds
+        self.calls = self.running = self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        from time import sleep
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            calls = self.calls
+        sleep(self.seconds)
+        with self._lock:
+            self.running -= 1
+        return self.done_after is not None and calls >= self.done_after
+
+
+@check("poll_timeout")
+def poll_timeout():
+    from time import time
+    from async_waiters import poll, poll_async
+    for wait in (lambda check, **kw: poll(check, **kw), lambda check, **kw: run_async(poll_async(check, **kw))):
+        check_ = CountingCheck()
+        start = time()
+        try:
+            wait(check_, interval=0.05, timeout=0.3, description="never", initial_delay=0.05)
+            raise AssertionError("no TimeoutError")
+        except TimeoutError as e:
+            assert "never" in str(e), e
+        # the last sleep is cut to the deadline, so the wait ends after one more check
+        assert 0.3 <= time() - start < 0.45, time() - start
+        assert check_.calls >= 3, check_.calls
+
+        # the initial delay counts against the timeout too
+        start = time()
+        try:
+            wait(CountingCheck(), interval=0.05, timeout=0.1, initial_delay=1.0)
+            raise AssertionError("no TimeoutError")
+        except TimeoutError:
+            pass
+        assert time() - start < 0.25, time() - start
+
+
+@check("poll_backoff")
+def poll_backoff():
+    from itertools import islice
+    from async_waiters import backoff_delays, poll
+    from instrumentation import recording
+    assert list(islice(backoff_delays(1.0, max_interval=8.0, jitter=0), 6)) == [1, 2, 4, 8, 8, 8]
+    assert list(islice(backoff_delays(1.0, factor=3.0, jitter=0), 5)) == [1, 3, 9, 16, 16]
+    for i, delay in enumerate(islice(backoff_delays(1.0, max_interval=4.0, jitter=0.1), 50)):
+        assert 0.9 * min(2 ** i, 4) <= delay <= 1.1 * min(2 ** i, 4), (i, delay)
+
+    check_ = CountingCheck(done_after=5)
+    with recording() as recorder:
+        poll(check_, interval=0.02, max_interval=0.08, jitter=0)
+    assert check_.calls == 5, check_.calls
+    sleeps = [event[3] for event in recorder.events if event[0] == "poll.sleep"]
+    assert len(sleeps) == 4, sleeps
+    for expected, slept in zip([0.02, 0.04, 0.08, 0.08], sleeps):
+        assert expected <= slept < expected + 0.05, sleeps
+
+
+@check("poll_async_concurrency_limit")
+def poll_async_concurrency_limit():
+    import asyncio
+    from time import time
+    from async_waiters import poll_async, wait_all
+
+    async def waits():
+        checks = [CountingCheck(done_after=2, seconds=0.05) for _ in range(6)]
+        await wait_all(*[poll_async(c, interval=0.01) for c in checks])
+
+    # without a limit the waits overlap: 12 checks of 0.05s take about two rounds, not twelve
+    start = time()
+    run_async(waits())
+    assert time() - start < 0.4, time() - start
+
+    # the checks run in the default executor; a semaphore bounds how many are in flight
+    counter = CountingCheck(done_after=12, seconds=0.02)
+
+    async def shared():
+        # created in the coroutine, so it belongs to the running loop on every Python 3 version
+        limit = asyncio.Semaphore(2)
+        await wait_all(*[poll_async(counter, interval=0.01, limit=limit) for _ in range(6)])
+
+    run_async(shared())
+    assert counter.calls >= 12, counter.calls
+    assert counter.max_running == 2, counter.max_running
+
+
+@check("run_campaigns_concurrent")
+def run_campaigns_concurrent():
+    from time import time
+    from sl_scheduler import run_campaigns
+    with mock_client(ingest_time=0.05, train_time=0.1, design_time=0.3) as (client, mock):
+        campaigns = [sl_campaign(client, "campaign{}".format(i), seed=i, num_sl_iterations=1) for i in range(4)]
+        start = time()
+        single = run_async(run_campaigns(client, campaigns[:1], wait_time=0.02))
+        one = time() - start
+        start = time()
+        results = run_async(run_campaigns(client, campaigns, wait_time=0.02, max_concurrent_calls=4))
+        four = time() - start
+        assert not [r for r in single + results if isinstance(r, Exception)], single + results
+        assert all(len(predicted) == len(measured) == 1 for predicted, measured in results), results
+        # the campaigns' design runs and trainings overlap instead of running back to back
+        assert four < 2 * one, (one, four)
+        submits = sorted(t for name, t, _ in mock.calls if name == "submit_design_run")[-4:]
+        assert submits[-1] - submits[0] < 0.3, submits
+
+
+@check("run_campaigns_error_isolation")
+def run_campaigns_error_isolation():
+    from citrination_client import ResourceNotFoundException
+    from sl_scheduler import run_campaigns
+
+    def broken_func(inputs):
+        raise ValueError("broken true function")
+
+    with mock_client(design_time=0.2) as (client, _):
+        good = sl_campaign(client, "good", seed=0)
+        broken = sl_campaign(client, "broken", seed=1, true_function=broken_func)
+        slow = sl_campaign(client, "slow", seed=2, timeout=0.05)
+        missing = dict(good, view_id="999")
+        results = run_async(run_campaigns(client, [good, broken, slow, missing], wait_time=0.02))
+        predicted, measured = results[0]
+        assert len(predicted) == len(measured) == 2, results[0]
+        assert isinstance(results[1], ValueError) and "broken" in str(results[1]), results[1]
+        assert isinstance(results[2], TimeoutError), results[2]
+        assert isinstance(results[3], ResourceNotFoundException), results[3]
+
+
+@check("mock_job_durations")
+def mock_job_durations():
+    from time import sleep, time
+    from citrination_client.models.design import Target
+    from async_waiters import data_view_ready, design_run_finished, ingest_finished
+    from sequential_learning_wrappers import upload_files, write_dataset_from_func
+    with mock_client(latency=0.05, ingest_time=0.3, train_time=0.3, design_time=0.3) as (client, mock):
+        campaign = sl_campaign(client, "jobs")
+        dataset_id, view_id = campaign["dataset_id"], campaign["view_id"]
+
+        start = time()
+        write_dataset_from_func(toy_func, "more.json", np.random.RandomState(1).normal(size=(5, 2)))
+        upload_files(client, dataset_id, "more.json")
+        assert time() - start >= 0.05, "the request latency was not applied"
+        assert not ingest_finished(client, dataset_id), "ingest finished at once"
+        sleep(0.3)
+        assert ingest_finished(client, dataset_id)
+
+        client.models.retrain(view_id)
+        assert not data_view_ready(client, view_id), "retrained view was ready at once"
+        sleep(0.3)
+        assert data_view_ready(client, view_id)
+
+        run_id = client.models.submit_design_run(view_id, 5, 5, Target("Property y", "Min")).uuid
+        assert not design_run_finished(client, view_id, run_id), "design run finished at once"
+        sleep(0.3)
+        assert design_run_finished(client, view_id, run_id)
+        assert len(client.models.get_design_run_results(view_id, run_id).best_materials) == 5
+
+        calls = mock.call_summary()
+        assert calls["ingest_status"][0] >= 2 and calls["retrain"][0] == 1, calls
+        assert calls["ingest_status"][1] >= 0.05 * calls["ingest_status"][0], calls
+
+
+def get_options():
+    parser = argparse.ArgumentParser(description="Run correctness checks of the example helpers")
+    parser.add_argument("checks", nargs="*", default=["*"], help="names or glob patterns of checks to run")
+    parser.add_argument("-l", "--list", action="store_true", help="list the checks and exit")
+    return parser.parse_args()
+
+
+def main():
+    options = get_options()
+    if options.list:
+        for name, _ in CHECKS:
+            print(name)
+        return
+
+    failed = []
+    for name, func in CHECKS:
+        if not any(fnmatch.fnmatch(name, pattern) for pattern in options.checks):
+            continue
+        try:
+            func()
+            print("{:<36} ok".format(name))
+        except Exception:
+            print("{:<36} FAILED".format(name))
+            traceback.print_exc()
+            failed.append(name)
+        sys.stdout.flush()
+    if failed:
+        print("Failed checks: {}".format(" ".join(failed)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+## This script executes jupyter notebooks in parallel, one kernel per notebook,
+## and writes a JSON report with the wall time of every cell, i.e.
+## ./ci/run_notebooks.py --kernel python3 --report report.json NOTEBOOK [NOTEBOOK ...]
+## The kernel is swapped in memory, so no temporary notebooks are written.
+## A cell can override the per-cell timeout with {"timeout": seconds} in its metadata.
+## With --site, the notebooks talk to that Citrination deployment instead of the public
+## site, e.g. a local mock server for running offline.
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import re
+import sys
+from multiprocessing import Pool
+from timeit import default_timer
+
+import nbformat
+from nbconvert.preprocessors import ExecutePreprocessor
+
+PUBLIC_SITE = "https://citrination.com"
+
+
+class TimedExecutePreprocessor(ExecutePreprocessor):
+    """ ExecutePreprocessor that records the wall time of each code cell """
+
+    def __init__(self, **kwargs):
+        super(TimedExecutePreprocessor, self).__init__(**kwargs)
+        self.cell_times = []
+
+    def preprocess_cell(self, cell, resources, index):
+        if cell.cell_type != "code":
+            return super(TimedExecutePreprocessor, self).preprocess_cell(cell, resources, index)
+        default_timeout = self.timeout
+        self.timeout = cell.metadata.get("timeout", default_timeout)
+        start = default_timer()
+        try:
+            return super(TimedExecutePreprocessor, self).preprocess_cell(cell, resources, index)
+        finally:
+            self.timeout = default_timeout
+            self.cell_times.append({
+                "index": index,
+                "seconds": round(default_timer() - start, 4),
+                "source": cell.source.split("\n", 1)[0][:80],
+            })
+
+
+def notebook_path(name):
+    """ accept notebooks with or without the .ipynb extension, as test_notebooks.sh did """
+    return name if name.endswith(".ipynb") else name + ".ipynb"
+
+
+def prepare(notebook, kernel, site=None):
+    """ set the kernel and, optionally, point the notebook at another site, in memory """
+    notebook.metadata.setdefault("kernelspec", {})["name"] = kernel
+    if site is not None:
+        for cell in notebook.cells:
+            if cell.cell_type == "code":
+                cell.source = cell.source.replace(PUBLIC_SITE, site)
+    return notebook
+
+
+def error_summary(error):
+    """ one line describing why a notebook failed, without terminal colors """
+    lines = [line for line in re.sub(r"\x1b\[[0-9;]*m", "", str(error)).splitlines() if line.strip("- ")]
+    if not lines:
+        return type(error).__name__
+    # timeouts explain themselves on the first line, errors from the kernel on the last
+    return "{}: {}".format(type(error).__name__, lines[0] if "timed out" in lines[0] else lines[-1])
+
+
+def run_notebook(args):
+    """ execute one notebook in its own kernel; runs in a worker process """
+    path, kernel, timeout, site = args
+    if site is not None:
+        # prepare points the cells at site; the notebooks still read a key, which the kernel inherits from this worker
+        os.environ.setdefault("CITRINATION_API_KEY", "offline")
+    result = {"notebook": path, "kernel": kernel, "status": "ok", "error": None}
+    start = default_timer()
+    executor = TimedExecutePreprocessor(timeout=timeout, kernel_name=kernel)
+    try:
+        notebook = prepare(nbformat.read(path, as_version=4), kernel, site)
+        executor.preprocess(notebook, {"metadata": {"path": os.path.dirname(os.path.abspath(path))}})
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = error_summary(e)
+    result["seconds"] = round(default_timer() - start, 4)
+    result["cells"] = executor.cell_times
+    return result
+
+
+def get_options():
+    parser = argparse.ArgumentParser(description="Execute notebooks in parallel and report per-cell timings")
+    parser.add_argument("notebooks", nargs="+", help="notebooks to run, with or without .ipynb")
+    parser.add_argument("-k", "--kernel", default="python3", help="kernel to run every notebook with")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="notebooks executed at once")
+    parser.add_argument("-t", "--timeout", type=int, default=300, help="timeout in seconds for each cell")
+    parser.add_argument("-r", "--report", default=None, help="JSON file to write the report to")
+    parser.add_argument("-s", "--site", default=None,
+                        help="Citrination site to use instead of {}, e.g. http://localhost:8000".format(PUBLIC_SITE))
+    return parser.parse_args()
+
+
+def main():
+    options = get_options()
+    jobs = [(notebook_path(name), options.kernel, options.timeout, options.site) for name in options.notebooks]
+    start = default_timer()
+    pool = Pool(processes=max(1, min(options.jobs, len(jobs))))
+    try:
+        results = []
+        for result in pool.imap_unordered(run_notebook, jobs):
+            print("{} {} in {:.1f}s{}".format(result["notebook"], result["status"], result["seconds"],
+                                              ": " + result["error"] if result["error"] else ""))
+            sys.stdout.flush()
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+
+    # report in the order given on the command line
+    order = dict((job[0], i) for i, job in enumerate(jobs))
+    results.sort(key=lambda result: order[result["notebook"]])
+    report = {"kernel": options.kernel, "seconds": round(default_timer() - start, 4), "notebooks": results}
+    if options.report is not None:
+        with open(options.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = [result["notebook"] for result in results if result["status"] != "ok"]
+    if failed:
+        print("Failed notebooks: " + ", ".join(failed))
+        sys.exit(1)
+    print("{} notebooks were evaluated successfully".format(len(results)))
+
+
+if __name__ == "__main__":
+    main()
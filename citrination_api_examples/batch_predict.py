@@ -0,0 +1,192 @@
+'''
+Batched, concurrent and cached predictions from a Citrination data view, as used in ExperimentalDesign.ipynb.
+Candidates are split into chunks that are predicted concurrently, and results are memoized on disk keyed on
+(view id, model version, candidate), so screening the same formulas again does not call the API. Unless the caller
+passes one, the model version is a hash of the view's metadata. The API does not document a model version or promise
+that this metadata changes on retrain, so pass model_version explicitly (or clear the cache) after retraining a view.
+'''
+
+import hashlib
+import json
+import sqlite3
+from multiprocessing.pool import ThreadPool
+from time import time
+
+import numpy as np
+from citrination_client.models.predicted_value import PredictedValue
+from citrination_client.models.prediction_result import PredictionResult
+
+
+class PredictionCache(object):
+    '''On-disk LRU cache of prediction results, backed by SQLite
+
+    :param path: SQLite file, created if missing
+    :type path: str
+    :param max_entries: Entries kept; the least recently used are evicted beyond this
+    :type max_entries: int
+    '''
+
+    def __init__(self, path, max_entries=100000):
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS predictions "
+                         "(key TEXT PRIMARY KEY, result TEXT NOT NULL, used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS predictions_used ON predictions (used)")
+
+    def get_many(self, keys):
+        '''Cached results for the given keys; missing keys are left out
+
+        :param keys: Keys from cache_key
+        :type keys: List[str]
+        :return: Key to {descriptor key: [value, loss]}
+        :rtype: dict
+        '''
+
+        found = {}
+        keys = list(keys)
+        # stay under SQLite's limit on bound parameters
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            rows = self._db.execute(
+                "SELECT key, result FROM predictions WHERE key IN ({})".format(",".join("?" * len(batch))),
+                batch).fetchall()
+            found.update((key, json.loads(result)) for key, result in rows)
+        if found:
+            now = time()
+            with self._db:
+                self._db.executemany("UPDATE predictions SET used = ? WHERE key = ?",
+                                     [(now, key) for key in found])
+        return found
+
+    def put_many(self, items):
+        '''Stores results and evicts the least recently used entries over max_entries
+
+        :param items: (key, {descriptor key: [value, loss]}) pairs
+        :type items: Iterable[Tuple[str, dict]]
+        '''
+
+        now = time()
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)",
+                                 [(key, json.dumps(result), now) for key, result in items])
+            excess = self._db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._db.execute("DELETE FROM predictions WHERE key IN "
+                                 "(SELECT key FROM predictions ORDER BY used LIMIT ?)", (excess,))
+
+    def close(self):
+        self._db.close()
+
+
+def cache_key(view_id, model_version, candidate):
+    '''Hash of a candidate canonicalized with sorted keys, scoped to a view and model version'''
+
+    canonical = json.dumps([str(view_id), model_version, candidate], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def view_model_version(client, view_id):
+    '''Hash of a data view's metadata from DataViewsClient.get
+
+    This assumes the metadata stays the same between calls while the model is unchanged, and changes when the view is
+    edited or retrained, e.g. through an updated timestamp. Citrination does not document either, so a stale model can
+    still be served from the cache if a retrain leaves the metadata as it was; pass model_version to predict to be sure.
+
+    :param client: Client object
+    :type client: CitrinationClient
+    :param view_id: Data view ID
+    :type view_id: str
+    :rtype: str
+    '''
+
+    metadata = client.data_views.get(str(view_id))
+    canonical = json.dumps(metadata, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def _to_result(values):
+    result = PredictionResult()
+    for key, (value, loss) in values.items():
+        result.add_value(key, PredictedValue(key, value, loss))
+    return result
+
+
+def _from_result(result):
+    return {key: [result.get_value(key).value, result.get_value(key).loss] for key in result.all_keys()}
+
+
+def predict(client, view_id, candidates, chunk_size=100, max_workers=4, cache=None,
+            model_version=None, method="scalar"):
+    '''Predicts candidates in concurrent chunks, reusing cached results
+
+    :param client: Client object
+    :type client: CitrinationClient
+    :param view_id: Data view to predict with
+    :type view_id: str
+    :param candidates: Inputs, one dict per candidate
+    :type candidates: List[dict]
+    :param chunk_size: Candidates per predict call
+    :type chunk_size: int
+    :param max_workers: Predict calls in flight at once
+    :type max_workers: int
+    :param cache: Cache to read from and write to, defaults to no caching
+    :type cache: PredictionCache
+    :param model_version: Anything identifying the trained model, defaults to view_model_version when caching, see
+        its caveat
+    :type model_version: str
+    :param method: Passed on to client.models.predict
+    :type method: str
+    :return: One result per candidate, in order
+    :rtype: List[PredictionResult]
+    '''
+
+    if cache is not None and model_version is None:
+        model_version = view_model_version(client, view_id)
+    keys = [cache_key(view_id, model_version, c) for c in candidates]
+    cached = cache.get_many(set(keys)) if cache is not None else {}
+
+    # predict each distinct uncached candidate once
+    pending = {}
+    for key, candidate in zip(keys, candidates):
+        if key not in cached and key not in pending:
+            pending[key] = candidate
+    pending_keys = list(pending)
+    chunks = [pending_keys[i:i + chunk_size] for i in range(0, len(pending_keys), chunk_size)]
+
+    def predict_chunk(chunk):
+        return client.models.predict(view_id, [pending[key] for key in chunk], method=method)
+
+    predicted = {}
+    pool = ThreadPool(processes=max(1, max_workers))
+    try:
+        for chunk, results in zip(chunks, pool.map(predict_chunk, chunks)):
+            predicted.update((key, _from_result(result)) for key, result in zip(chunk, results))
+    finally:
+        pool.close()
+        pool.join()
+    if cache is not None and predicted:
+        cache.put_many(predicted.items())
+
+    cached.update(predicted)
+    return [_to_result(cached[key]) for key in keys]
+
+
+def predicted_arrays(predictions, key):
+    '''Predicted values and losses of one descriptor as float arrays, NaN where missing
+
+    :param predictions: Results from predict
+    :type predictions: List[PredictionResult]
+    :param key: Descriptor key, e.g. "Property ZT"
+    :type key: str
+    :return: 2-tuple: array of values; array of losses
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    '''
+
+    values = np.full(len(predictions), np.nan)
+    losses = np.full(len(predictions), np.nan)
+    for i, p in enumerate(predictions):
+        predicted = p.get_value(key)
+        if predicted is not None:
+            values[i] = float(predicted.value)
+            losses[i] = float(predicted.loss) if predicted.loss is not None else np.nan
+    return values, losses
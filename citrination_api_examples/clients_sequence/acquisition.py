@@ -0,0 +1,91 @@
+'''
+Vectorized acquisition functions for ranking candidate materials locally from their predicted means and uncertainties.
+Scores are computed for a whole candidate pool in one pass, and `top_k` picks a batch with a partial sort, so large pools can be
+screened locally and only the short list sent on to Citrination.
+Higher scores are always better; for a "Min" target the predictions are negated before scoring.
+'''
+
+import numpy as np
+from scipy.special import ndtr
+
+METHODS = ("MEI", "MLI", "PI", "EI", "UCB")
+
+
+def candidate_predictions(candidates, target_name):
+    '''Extracts predicted means and uncertainties from design run candidates
+
+    :param candidates: best_materials or next_experiments of a design run
+    :type candidates: List[dict]
+    :param target_name: Name of the output property
+    :type target_name: str
+    :return: 2-tuple: array of means; array of uncertainties
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    '''
+
+    uncertainty_name = "Uncertainty in {}".format(target_name)
+    means = np.array([float(m["descriptor_values"][target_name]) for m in candidates])
+    uncertainties = np.array([float(m["descriptor_values"][uncertainty_name]) for m in candidates])
+    return means, uncertainties
+
+
+def acquisition_scores(means, uncertainties, best, goal="Max", method="EI", kappa=2.0):
+    '''Scores candidates for the next experiment
+
+    MEI ranks by predicted value, MLI/PI by the probability of improving on best,
+    EI by the expected improvement over best and UCB by mean + kappa * uncertainty.
+
+    :param means: Predicted values
+    :type means: np.ndarray
+    :param uncertainties: Predicted standard deviations
+    :type uncertainties: np.ndarray
+    :param best: Best value measured so far
+    :type best: float
+    :param goal: "Min" or "Max"
+    :type goal: str
+    :param method: One of METHODS
+    :type method: str
+    :param kappa: Exploration weight of UCB
+    :type kappa: float
+    :return: Score per candidate, higher is better
+    :rtype: np.ndarray
+    '''
+
+    sign = -1.0 if goal == "Min" else 1.0
+    improvement = sign * (np.asarray(means, dtype=np.float64) - best)
+    sigma = np.asarray(uncertainties, dtype=np.float64)
+
+    if method == "MEI":
+        return improvement
+    if method == "UCB":
+        return improvement + kappa * sigma
+    if method not in METHODS:
+        raise ValueError("Unknown acquisition method {}, expected one of {}".format(method, METHODS))
+
+    # a certain prediction improves by exactly its improvement
+    certain = sigma <= 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(certain, 0.0, improvement / sigma)
+    cdf = ndtr(z)
+    if method in ("MLI", "PI"):
+        return np.where(certain, (improvement > 0).astype(np.float64), cdf)
+    pdf = np.exp(-0.5 * z * z) / np.sqrt(2 * np.pi)
+    return np.where(certain, np.maximum(improvement, 0.0), improvement * cdf + sigma * pdf)
+
+
+def top_k(scores, k):
+    '''Indices of the k best scores, best first, with an O(n) partial sort
+
+    :param scores: Score per candidate, higher is better
+    :type scores: np.ndarray
+    :param k: Batch size
+    :type k: int
+    :return: Indices into scores
+    :rtype: np.ndarray
+    '''
+
+    scores = np.asarray(scores)
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+    batch = np.argpartition(-scores, k - 1)[:k]
+    return batch[np.argsort(-scores[batch], kind="mergesort")]
@@ -0,0 +1,222 @@
+'''
+Status polling for the Citrination jobs used in the sequential learning wrappers (dataset ingest, data view services and design runs).
+Polls wait an optional initial delay, check, then back off exponentially with jitter up to a maximum interval, and give up
+after an overall timeout. The wait_on_* helpers wait one interval before their first check, as right after an upload or a
+retrain the server can still report the previous job as finished.
+The coroutines run the blocking client calls in a thread pool, so many datasets, views and design runs can be awaited at once with `wait_all`.
+The synchronous `poll` shares the same policy for code that is not running an event loop.
+'''
+
+import asyncio
+import random
+from time import monotonic, sleep
+
+from instrumentation import span
+
+
+def backoff_delays(interval, max_interval=None, factor=2.0, jitter=0.1):
+    '''Yields successive delays between status polls
+
+    :param interval: First delay in seconds
+    :type interval: float
+    :param max_interval: Cap on the delay, defaults to 16 * interval
+    :type max_interval: float
+    :param factor: Growth factor of the delay after each poll
+    :type factor: float
+    :param jitter: Relative random spread applied to each delay
+    :type jitter: float
+    :return: Infinite generator of delays in seconds
+    :rtype: Iterator[float]
+    '''
+
+    if max_interval is None:
+        max_interval = interval * 16
+    delay = interval
+    while True:
+        yield min(delay, max_interval) * (1 + random.uniform(-jitter, jitter))
+        delay = min(delay * factor, max_interval)
+
+
+def ingest_finished(client, dataset_id, print_output=False):
+    '''Checks whether the latest upload to a dataset has been ingested
+
+    :param client: Client object
+    :type client: CitrinationClient
+    :param dataset_id: Dataset ID
+    :type dataset_id: int
+    :param print_output: Whether or not to print outputs
+    :type print_output: bool
+    :return: True once ingest has finished
+    :rtype: bool
+    '''
+
+    if client.data.get_ingest_status(dataset_id) == "Finished":
+        return True
+    if print_output:
+        print("Waiting for data ingest to complete...")
+    return False
+
+
+def data_view_ready(client, view_id, print_output=False):
+    '''Checks whether the design and predict services of a view are ready
+
+    :param client: Client object
+    :type client: CitrinationClient
+    :param view_id: View ID
+    :type view_id: int
+    :param print_output: Whether or not to print outputs
+    :type print_output: bool
+    :return: True once both services are ready
+    :rtype: bool
+    '''
+
+    design_status = client.data_views.get_data_view_service_status(view_id)
+    if (design_status.experimental_design.ready and
+            design_status.predict.event.normalized_progress == 1.0):
+        if print_output:
+            print("Design ready")
+        return True
+    if print_output:
+        print("Waiting for design services...")
+    return False
+
+
+def design_run_finished(client, view_id, design_id, print_output=False):
+    '''Checks whether a design run has finished
+
+    :param client: Client object
+    :type client: CitrinationClient
+    :param view_id: View ID
+    :type view_id: int
+    :param design_id: Design run ID
+    :type design_id: str
+    :param print_output: Whether or not to print outputs
+    :type print_output: bool
+    :return: True once the run has finished
+    :rtype: bool
+    '''
+
+    status = client.models.get_design_run_status(view_id, design_id).status
+    if print_output:
+        print("Design run status: {}".format(status))
+    return status == "Finished"
+
+
+def _first_delay(initial_delay, timeout):
+    return initial_delay if timeout is None else max(0, min(initial_delay, timeout))
+
+
+def poll(check, interval=2, timeout=None, description="job", initial_delay=0, **backoff):
+    '''Calls check until it returns True, sleeping between calls
+
+    :param check: Zero-argument status check
+    :type check: Callable[[], bool]
+    :param interval: First delay in seconds between checks
+    :type interval: float
+    :param timeout: Overall time limit in seconds, including the initial delay, defaults to no limit
+    :type timeout: float
+    :param description: Name of the awaited job for the timeout message
+    :type description: str
+    :param initial_delay: Seconds to wait before the first check
+    :type initial_delay: float
+    :param backoff: max_interval, factor and jitter for backoff_delays
+    :raises TimeoutError: if check is still False after timeout seconds
+    '''
+
+    deadline = None if timeout is None else monotonic() + timeout
+    if initial_delay:
+        with span("poll.sleep", "idle"):
+            sleep(_first_delay(initial_delay, timeout))
+    for delay in backoff_delays(interval, **backoff):
+        if check():
+            return
+        if deadline is not None:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Timed out after {}s waiting on {}".format(timeout, description))
+            delay = min(delay, remaining)
+        with span("poll.sleep", "idle"):
+            sleep(delay)
+
+
+async def poll_async(check, interval=2, timeout=None, description="job", limit=None, initial_delay=0, **backoff):
+    '''Awaits check until it returns True; the coroutine form of poll
+
+    check is a blocking call, so it runs in the event loop's default thread
+    pool and other waits progress while the API responds.
+
+    :param check: Zero-argument status check
+    :type check: Callable[[], bool]
+    :param interval: First delay in seconds between checks
+    :type interval: float
+    :param timeout: Overall time limit in seconds, including the initial delay, defaults to no limit
+    :type timeout: float
+    :param description: Name of the awaited job for the timeout message
+    :type description: str
+    :param limit: Semaphore bounding concurrent API calls, defaults to no bound
+    :type limit: asyncio.Semaphore
+    :param initial_delay: Seconds to wait before the first check
+    :type initial_delay: float
+    :param backoff: max_interval, factor and jitter for backoff_delays
+    :raises TimeoutError: if check is still False after timeout seconds
+    '''
+
+    loop = asyncio.get_event_loop()
+    deadline = None if timeout is None else monotonic() + timeout
+    if initial_delay:
+        with span("poll.sleep", "idle"):
+            await asyncio.sleep(_first_delay(initial_delay, timeout))
+    for delay in backoff_delays(interval, **backoff):
+        if limit is None:
+            done = await loop.run_in_executor(None, check)
+        else:
+            async with limit:
+                done = await loop.run_in_executor(None, check)
+        if done:
+            return
+        if deadline is not None:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Timed out after {}s waiting on {}".format(timeout, description))
+            delay = min(delay, remaining)
+        with span("poll.sleep", "idle"):
+            await asyncio.sleep(delay)
+
+
+async def wait_on_ingest(client, dataset_id, interval=2, timeout=None, print_output=False, limit=None,
+                         initial_delay=None, **backoff):
+    '''Awaits the ingest of a dataset, see poll_async for the arguments; initial_delay defaults to interval'''
+
+    await poll_async(lambda: ingest_finished(client, dataset_id, print_output),
+                     interval, timeout, "ingest of dataset {}".format(dataset_id), limit,
+                     interval if initial_delay is None else initial_delay, **backoff)
+
+
+async def wait_on_data_view(client, view_id, interval=2, timeout=None, print_output=False, limit=None,
+                            initial_delay=None, **backoff):
+    '''Awaits the services of a data view, see poll_async for the arguments; initial_delay defaults to interval'''
+
+    await poll_async(lambda: data_view_ready(client, view_id, print_output),
+                     interval, timeout, "data view {}".format(view_id), limit,
+                     interval if initial_delay is None else initial_delay, **backoff)
+
+
+async def wait_on_design_run(client, view_id, design_id, interval=2, timeout=None, print_output=False,
+                             limit=None, initial_delay=None, **backoff):
+    '''Awaits a design run, see poll_async for the arguments; initial_delay defaults to interval'''
+
+    await poll_async(lambda: design_run_finished(client, view_id, design_id, print_output),
+                     interval, timeout, "design run {}".format(design_id), limit,
+                     interval if initial_delay is None else initial_delay, **backoff)
+
+
+async def wait_all(*waits):
+    '''Awaits many waits concurrently, e.g.
+
+        await wait_all(wait_on_ingest(client, 1), wait_on_data_view(client, 2))
+
+    :param waits: Coroutines from the wait_on_* functions
+    :raises TimeoutError: as soon as any of the waits times out
+    '''
+
+    await asyncio.gather(*waits)
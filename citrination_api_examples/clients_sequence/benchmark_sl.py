@@ -0,0 +1,156 @@
+'''
+Times the sequential learning loop of 5_sequential_learning_api_tutorial against mock_citrination, with no network and
+no account needed. Every run uses the same seed, dataset and simulated service durations, so differences between runs
+come from the client side: the wrappers, the client library and the polling interval.
+
+    python benchmark_sl.py --iterations 5 --latency 0.02 --design_time 0.5
+
+The report gives the wall time of each SL iteration, the number of calls and server time per endpoint, and the wrapper
+overhead, i.e. the wall time not spent waiting on the service (its latency and job durations) or sleeping between polls.
+The wrappers' own spans (see instrumentation) are included per call and stage, and --trace writes them as a Chrome trace.
+'''
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from time import monotonic
+
+import numpy as np
+from citrination_client import CitrinationClient
+
+from instrumentation import recording
+from mock_citrination import MockCitrination
+from sequential_learning_wrappers import (build_view_and_get_id, run_sequential_learning,
+                                          upload_data_and_get_id, write_dataset_from_func)
+
+INPUTS = ["Property x1", "Property x2"]
+TARGET = ["Property y", "Min"]
+
+
+def toy_func(inputs):
+    return np.sum(np.square(inputs))
+
+
+def _iteration_times(mock, start, end):
+    # an iteration starts with its design run submission, so the submissions split the loop
+    submits = sorted(t for name, t, _ in mock.calls if name == "submit_design_run" and t >= start)
+    bounds = submits + [end]
+    return [b - a for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def benchmark(iterations=5, num_initial=20, num_candidates=10, effort=10, wait_time=0.05, score_type="MLI",
+              seed=0, trace_file=None, **mock_options):
+    '''Runs the tutorial's SL loop against a fresh mock service
+
+    :param iterations: SL iterations
+    :type iterations: int
+    :param num_initial: Records in the initial dataset
+    :type num_initial: int
+    :param num_candidates: Candidates per design run
+    :type num_candidates: int
+    :param effort: Design effort
+    :type effort: int
+    :param wait_time: Polling interval of the wrappers in seconds
+    :type wait_time: float
+    :param score_type: MLI or MEI
+    :type score_type: str
+    :param seed: Seed of the initial dataset and the mock's design runs
+    :type seed: int
+    :param trace_file: Write a Chrome trace of the SL loop's client calls and stages to this file
+    :type trace_file: str
+    :param mock_options: Passed on to MockCitrination, e.g. latency or design_time
+    :return: Timings, see the module docstring
+    :rtype: dict
+    '''
+
+    workdir = tempfile.mkdtemp(prefix="benchmark_sl_")
+    cwd = os.getcwd()
+    os.chdir(workdir)  # run_sequential_learning writes its design files to the working directory
+    try:
+        with MockCitrination(seed=seed, **mock_options) as mock:
+            client = CitrinationClient(api_key="mock", site=mock.url)
+            toy_x = np.random.RandomState(seed).normal(loc=3.0, scale=1.0, size=(num_initial, 2))
+            write_dataset_from_func(toy_func, "initial.json", toy_x)
+
+            setup_start = monotonic()
+            dataset_id = upload_data_and_get_id(client, "benchmark", "initial.json", create_new_version=True)
+            view_id = build_view_and_get_id(client, dataset_id, INPUTS, [TARGET[0]], "benchmark",
+                                            wait_time=wait_time)
+            sl_start = monotonic()
+            with recording() as recorder:
+                predicted, measured = run_sequential_learning(
+                    client=client, view_id=str(view_id), dataset_id=str(dataset_id),
+                    num_candidates_per_iter=num_candidates, design_effort=effort, wait_time=wait_time,
+                    num_sl_iterations=iterations, input_properties=INPUTS, target=TARGET,
+                    print_output=False, true_function=toy_func, score_type=score_type)
+            sl_end = monotonic()
+
+            calls = mock.call_summary()
+            sl_calls = [(name, t, seconds) for name, t, seconds in mock.calls if t >= sl_start]
+            server_seconds = sum(seconds for _, _, seconds in sl_calls)
+            polls = sum(1 for name, _, _ in sl_calls
+                        if name in ("ingest_status", "data_view_status", "design_run_status"))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if trace_file is not None:
+        recorder.write_chrome_trace(trace_file)
+    sl_seconds = sl_end - sl_start
+    slept = recorder.idle_seconds()
+    iteration_seconds = _iteration_times(mock, sl_start, sl_end)
+    return {
+        "setup_seconds": round(sl_start - setup_start, 4),
+        "sl_seconds": round(sl_seconds, 4),
+        "iterations_per_second": round(iterations / sl_seconds, 4),
+        "iteration_seconds": [round(s, 4) for s in iteration_seconds],
+        "server_seconds": round(server_seconds, 4),
+        "polls": polls,
+        "sleep_seconds": round(slept, 4),
+        "overhead_seconds": round(sl_seconds - server_seconds - slept, 4),
+        "calls": dict((name, {"count": count, "seconds": round(seconds, 4)})
+                      for name, (count, seconds) in sorted(calls.items())),
+        "spans": recorder.summary(),
+        "best_predicted": predicted,
+        "best_measured": measured,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SL wrappers against a local mock Citrination")
+    parser.add_argument("-n", "--iterations", type=int, default=5, help="SL iterations")
+    parser.add_argument("--num_initial", type=int, default=20, help="records in the initial dataset")
+    parser.add_argument("--num_candidates", type=int, default=10, help="candidates per design run")
+    parser.add_argument("--effort", type=int, default=10, help="design effort")
+    parser.add_argument("-w", "--wait_time", type=float, default=0.05, help="polling interval in seconds")
+    parser.add_argument("--score_type", default="MLI", choices=["MLI", "MEI"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-l", "--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--ingest_time", type=float, default=0.0, help="seconds an upload takes to ingest")
+    parser.add_argument("--train_time", type=float, default=0.0, help="seconds a data view takes to train")
+    parser.add_argument("--design_time", type=float, default=0.0, help="seconds a design run takes")
+    parser.add_argument("-o", "--out", default=None, help="JSON file to write the report to")
+    parser.add_argument("-t", "--trace", default=None, help="Chrome trace file to write the SL loop's spans to")
+    options = parser.parse_args()
+
+    report = benchmark(iterations=options.iterations, num_initial=options.num_initial,
+                       num_candidates=options.num_candidates, effort=options.effort,
+                       wait_time=options.wait_time, score_type=options.score_type, seed=options.seed,
+                       latency=options.latency, ingest_time=options.ingest_time,
+                       train_time=options.train_time, design_time=options.design_time,
+                       trace_file=options.trace)
+    print("{} SL iterations in {:.3f}s ({:.2f}/s): server {:.3f}s, sleeping {:.3f}s over {} polls, "
+          "wrapper overhead {:.3f}s".format(
+              len(report["iteration_seconds"]), report["sl_seconds"], report["iterations_per_second"],
+              report["server_seconds"], report["sleep_seconds"], report["polls"], report["overhead_seconds"]))
+    for name, stats in report["calls"].items():
+        print("  {:<22} {:>5} calls {:>9.4f}s".format(name, stats["count"], stats["seconds"]))
+    if options.out is not None:
+        with open(options.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
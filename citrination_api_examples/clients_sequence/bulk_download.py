@@ -0,0 +1,249 @@
+'''
+Bulk retrieval for the data client tutorial. Dataset files are fetched over a bounded thread pool and streamed to disk in
+fixed-size chunks. A file whose local copy already has the remote size (and, with verify, the MD5 of the S3 ETag) is
+skipped, and a partial download left in <path>.part by an interrupted run is resumed with a Range request, so rerunning
+after a failure only fetches what is missing. PIFs are retrieved by uid with concurrent get_pif calls.
+
+    files = client.data.get_dataset_files(dataset_id)
+    report = download_dataset_files(files, destination="./downloads/", max_workers=8)
+    pifs = get_pifs(client, dataset_id, ["uid_1", "uid_2"])
+'''
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from time import sleep
+
+import requests
+
+from instrumentation import instrument_client, span
+
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+PART_SUFFIX = ".part"
+
+_sessions = threading.local()
+
+
+def _session():
+    # one connection pool per worker thread, since requests.Session is not documented as thread-safe
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    return session
+
+
+def file_md5(path, block_size=1 << 20):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _etag_md5(response):
+    # S3 ETags are the MD5 of the object, except after multipart uploads, which add a "-<parts>" suffix
+    etag = response.headers.get("ETag", "").strip('"')
+    return etag.lower() if re.match(r"^[0-9a-fA-F]{32}$", etag) else None
+
+
+def _remote_size(response):
+    content_range = response.headers.get("Content-Range", "")
+    if "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    return int(length) if length is not None and response.status_code == 200 else None
+
+
+def _makedirs(directory):
+    # os.makedirs has no exist_ok on Python 2, and another worker may create the directory first
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+
+
+def _replace(source, target):
+    # os.replace is Python 3 only, and os.rename does not overwrite an existing file on Windows
+    if hasattr(os, "replace"):
+        os.replace(source, target)
+    else:
+        if os.path.exists(target):
+            os.remove(target)
+        os.rename(source, target)
+
+
+def _is_current(path, size, md5, verify):
+    if size is None or not os.path.isfile(path) or os.path.getsize(path) != size:
+        return False
+    return not verify or md5 is None or file_md5(path) == md5
+
+
+def download_file(dataset_file, destination=".", chunk_size=1 << 20, verify=False, timeout=60):
+    '''Downloads one dataset file unless its local copy is current, resuming a partial download
+
+    :param dataset_file: File from DataClient.get_dataset_files
+    :type dataset_file: DatasetFile
+    :param destination: Local directory, the file's dataset path is kept below it
+    :type destination: str
+    :param chunk_size: Bytes read and written at a time
+    :type chunk_size: int
+    :param verify: Also compare the MD5 of local files with the ETag, when it is one
+    :type verify: bool
+    :param timeout: Seconds to wait on the connection or between received chunks
+    :type timeout: float
+    :return: Bytes transferred, None if the file was skipped
+    :rtype: int
+    :raises IOError: if the transfer was cut short or the checksum does not match
+    '''
+
+    local_path = os.path.join(destination, dataset_file.path.lstrip("/"))
+    part_path = local_path + PART_SUFFIX
+    directory = os.path.dirname(local_path)
+    if directory:
+        _makedirs(directory)
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    headers = {"Range": "bytes={}-".format(offset)} if offset else {}
+
+    with span("download_file", "client") as timer, \
+            _session().get(dataset_file.url, headers=headers, stream=True, timeout=timeout) as response:
+        size = _remote_size(response)
+        md5 = _etag_md5(response)
+        transferred = 0
+        if response.status_code == 416:
+            # nothing past the partial file: it is complete if a run stopped between its last chunk and the rename,
+            # otherwise it is no prefix of the remote file and the next attempt starts over
+            if size != offset:
+                os.remove(part_path)
+                raise IOError("Partial download of {} does not match the remote file".format(dataset_file.path))
+        else:
+            response.raise_for_status()
+            if _is_current(local_path, size, md5, verify):
+                if offset:
+                    os.remove(part_path)
+                return None
+            if response.status_code != 206:
+                offset = 0
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size):
+                    f.write(chunk)
+                    transferred += len(chunk)
+            timer.add_bytes(transferred)
+
+    written = os.path.getsize(part_path)
+    if size is not None and written != size:
+        raise IOError("Received {} of {} bytes of {}".format(written, size, dataset_file.path))
+    if verify and md5 is not None and file_md5(part_path) != md5:
+        os.remove(part_path)
+        raise IOError("Checksum of {} does not match its ETag".format(dataset_file.path))
+    _replace(part_path, local_path)
+    return transferred
+
+
+class DownloadReport(object):
+    '''Per-file outcome and throughput of download_dataset_files'''
+
+    def __init__(self, downloaded, skipped, failures, num_bytes, seconds):
+        self.downloaded = downloaded
+        self.skipped = skipped
+        self.failures = failures
+        self.num_bytes = num_bytes
+        self.seconds = seconds
+        self.files_per_second = len(downloaded) / seconds if seconds else 0.0
+        self.mb_per_second = num_bytes / 1e6 / seconds if seconds else 0.0
+
+    def __repr__(self):
+        return "Downloaded {} files ({:.2f} MB) in {:.2f}s: {:.1f} files/s, {:.2f} MB/s, {} skipped, {} failed".format(
+            len(self.downloaded), self.num_bytes / 1e6, self.seconds,
+            self.files_per_second, self.mb_per_second, len(self.skipped), len(self.failures))
+
+
+def download_dataset_files(dataset_files, destination=".", max_workers=8, chunk_size=1 << 20, retries=3,
+                           backoff=1.0, verify=False):
+    '''Downloads dataset files over a bounded thread pool, skipping current files and retrying failed ones
+
+    A drop-in for DataClient.download_files that can be rerun after an interruption.
+
+    :param dataset_files: Files from DataClient.get_dataset_files
+    :type dataset_files: List[DatasetFile]
+    :param destination: Local directory, the files' dataset paths are kept below it
+    :type destination: str
+    :param max_workers: Files downloaded concurrently
+    :type max_workers: int
+    :param chunk_size: Bytes read and written at a time
+    :type chunk_size: int
+    :param retries: Retries per file after a failed attempt, each resuming the partial download
+    :type retries: int
+    :param backoff: Wait in seconds before the first retry, doubling after each
+    :type backoff: float
+    :param verify: Also compare the MD5 of files with the ETag, see download_file
+    :type verify: bool
+    :return: Downloaded, skipped and failed files with the last error, and throughput
+    :rtype: DownloadReport
+    '''
+
+    if not isinstance(dataset_files, list):
+        dataset_files = [dataset_files]
+
+    def download_one(dataset_file):
+        for attempt in range(retries + 1):
+            try:
+                return download_file(dataset_file, destination, chunk_size, verify), None
+            except Exception as e:
+                error = "{}: {}".format(type(e).__name__, e)
+            if attempt < retries:
+                with span("download.retry_sleep", "idle"):
+                    sleep(backoff * 2 ** attempt)
+        return None, error
+
+    downloaded, skipped, failures, num_bytes = [], [], OrderedDict(), 0
+    start = monotonic()
+    pool = ThreadPool(processes=max(1, max_workers))
+    try:
+        outcomes = pool.map(download_one, dataset_files)
+    finally:
+        pool.close()
+        pool.join()
+    for dataset_file, (transferred, error) in zip(dataset_files, outcomes):
+        if error is not None:
+            failures[dataset_file.path] = error
+        elif transferred is None:
+            skipped.append(dataset_file.path)
+        else:
+            downloaded.append(dataset_file.path)
+            num_bytes += transferred
+    return DownloadReport(downloaded, skipped, failures, num_bytes, monotonic() - start)
+
+
+def get_pifs(client, dataset_id, uids, dataset_version=None, max_workers=8):
+    '''Retrieves PIFs by uid with concurrent DataClient.get_pif calls
+
+    :param client: Client object
+    :type client: CitrinationClient
+    :param dataset_id: Dataset ID
+    :type dataset_id: int
+    :param uids: uids of the PIFs
+    :type uids: List[str]
+    :param dataset_version: Dataset version to look in, defaults to the latest
+    :type dataset_version: int
+    :param max_workers: Lookups in flight at a time
+    :type max_workers: int
+    :return: The PIFs, in the order of uids
+    :rtype: List[Pif]
+    '''
+
+    client = instrument_client(client)
+    pool = ThreadPool(processes=max(1, max_workers))
+    try:
+        return pool.map(lambda uid: client.data.get_pif(dataset_id, uid, dataset_version), uids)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,260 @@
+'''
+Timing of the sequential learning wrappers: every Citrination client call, every local stage (dataset writing, uploads,
+screening) and every sleep between status polls is recorded as a span while a Recorder is active.
+
+    with recording() as recorder:
+        run_sequential_learning(client, ...)
+    print(recorder.report())
+    recorder.write_json("sl_timings.json")
+    recorder.write_chrome_trace("sl_trace.json")  # open in chrome://tracing or https://ui.perfetto.dev
+
+Spans have a category: "client" for API calls, "stage" for local work and the wrappers themselves, and "idle" for
+time spent sleeping between polls or retries. When no Recorder is active, span returns a shared no-op object and
+instrument_client returns the client unchanged, so the cost is one global lookup per span.
+'''
+
+import json
+import os
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+# upper bounds in milliseconds of the latency histogram buckets; the last bucket is unbounded
+HISTOGRAM_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+_recorder = None
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add_bytes(self, nbytes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span(object):
+    '''One timed call or stage, recorded when the with block exits'''
+
+    def __init__(self, recorder, name, category, nbytes=0):
+        self.recorder = recorder
+        self.name = name
+        self.category = category
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start = monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.recorder.record(self.name, self.category, self.start, monotonic() - self.start, self.nbytes,
+                             None if exc_type is None else exc_type.__name__)
+        return False
+
+    def add_bytes(self, nbytes):
+        self.nbytes += nbytes
+
+
+class Recorder(object):
+    '''Collects spans from any thread'''
+
+    def __init__(self):
+        self.events = []
+        self.origin = monotonic()
+        self._lock = threading.Lock()
+
+    def span(self, name, category="client", nbytes=0):
+        return Span(self, name, category, nbytes)
+
+    def record(self, name, category, start, seconds, nbytes=0, error=None):
+        with self._lock:
+            self.events.append((name, category, start, seconds, nbytes, error, threading.current_thread().ident))
+
+    def idle_seconds(self):
+        '''Time spent sleeping between polls and retries'''
+
+        return sum(event[3] for event in self.events if event[1] == "idle")
+
+    def summary(self):
+        '''Per span name: category, count, errors, total/mean/min/max/p50/p95 seconds, bytes and latency histogram
+
+        :rtype: OrderedDict
+        '''
+
+        grouped = OrderedDict()
+        for name, category, _, seconds, nbytes, error, _ in sorted(self.events, key=lambda event: event[2]):
+            grouped.setdefault(name, (category, [], [0], [0]))
+            grouped[name][1].append(seconds)
+            grouped[name][2][0] += nbytes
+            grouped[name][3][0] += error is not None
+
+        summary = OrderedDict()
+        for name, (category, durations, nbytes, errors) in grouped.items():
+            ordered = sorted(durations)
+            histogram = [0] * (len(HISTOGRAM_MS) + 1)
+            for seconds in durations:
+                histogram[bisect_left(HISTOGRAM_MS, seconds * 1000)] += 1
+            summary[name] = OrderedDict([
+                ("category", category),
+                ("count", len(durations)),
+                ("errors", errors[0]),
+                ("seconds", round(sum(durations), 6)),
+                ("mean_seconds", round(sum(durations) / len(durations), 6)),
+                ("min_seconds", round(ordered[0], 6)),
+                ("p50_seconds", round(ordered[len(ordered) // 2], 6)),
+                ("p95_seconds", round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 6)),
+                ("max_seconds", round(ordered[-1], 6)),
+                ("bytes", nbytes[0]),
+                ("histogram_ms", OrderedDict(
+                    ("<={}".format(bound) if i < len(HISTOGRAM_MS) else ">{}".format(HISTOGRAM_MS[-1]), count)
+                    for i, (bound, count) in enumerate(zip(HISTOGRAM_MS + (None,), histogram)) if count)),
+            ])
+        return summary
+
+    def to_dict(self):
+        return OrderedDict([
+            ("wall_seconds", round(monotonic() - self.origin, 6)),
+            ("idle_seconds", round(self.idle_seconds(), 6)),
+            ("calls", self.summary()),
+        ])
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+    def write_chrome_trace(self, path):
+        '''Writes the spans in the Trace Event Format of chrome://tracing and Perfetto, one track per thread'''
+
+        pid = os.getpid()
+        events = [{
+            "name": name, "cat": category, "ph": "X", "pid": pid, "tid": tid,
+            "ts": round((start - self.origin) * 1e6, 1), "dur": round(seconds * 1e6, 1),
+            "args": dict(([("bytes", nbytes)] if nbytes else []) + ([("error", error)] if error else [])),
+        } for name, category, start, seconds, nbytes, error, tid in self.events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
+
+    def report(self):
+        '''Table of the summary, slowest spans first'''
+
+        lines = ["{:<40} {:>6} {:>10} {:>10} {:>10} {:>12}".format(
+            "span", "count", "total s", "mean ms", "p95 ms", "bytes")]
+        calls = self.summary()
+        for name in sorted(calls, key=lambda name: -calls[name]["seconds"]):
+            stats = calls[name]
+            lines.append("{:<40} {:>6} {:>10.3f} {:>10.1f} {:>10.1f} {:>12}".format(
+                "{} ({})".format(name, stats["category"]), stats["count"], stats["seconds"],
+                stats["mean_seconds"] * 1000, stats["p95_seconds"] * 1000, stats["bytes"]))
+        lines.append("idle in polling and retries: {:.3f}s of {:.3f}s".format(
+            self.idle_seconds(), monotonic() - self.origin))
+        return "\n".join(lines)
+
+
+def active_recorder():
+    return _recorder
+
+
+@contextmanager
+def recording(recorder=None):
+    '''Records spans in recorder (a new Recorder by default) within the with block'''
+
+    global _recorder
+    previous = _recorder
+    _recorder = recorder if recorder is not None else Recorder()
+    try:
+        yield _recorder
+    finally:
+        _recorder = previous
+
+
+def span(name, category="stage", nbytes=0):
+    '''Context manager timing a block when recording, a no-op otherwise'''
+
+    recorder = _recorder
+    if recorder is None:
+        return _NULL_SPAN
+    return recorder.span(name, category, nbytes)
+
+
+def instrumented(name=None, category="stage"):
+    '''Decorator timing every call of a function when recording'''
+
+    def decorate(func):
+        label = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None:
+                return func(*args, **kwargs)
+            with recorder.span(label, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _upload_bytes(method, args, kwargs):
+    # data.upload(dataset_id, source_path, dest_path=None)
+    if method != "upload":
+        return 0
+    path = kwargs.get("source_path", args[1] if len(args) > 1 else None)
+    return os.path.getsize(path) if path and os.path.isfile(path) else 0
+
+
+class _InstrumentedService(object):
+    '''Proxy of one client service (data, models, ...) timing every method call'''
+
+    def __init__(self, service, prefix):
+        self._service = service
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        attr = getattr(self._service, name)
+        if not callable(attr):
+            return attr
+        label = "{}.{}".format(self._prefix, name)
+
+        def call(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None:
+                return attr(*args, **kwargs)
+            with recorder.span(label, "client", _upload_bytes(name, args, kwargs)):
+                return attr(*args, **kwargs)
+        return call
+
+
+class InstrumentedClient(object):
+    '''CitrinationClient whose data, models, data_views and search calls are timed when recording'''
+
+    SERVICES = ("data", "models", "data_views", "search")
+
+    def __init__(self, client):
+        self.client = client
+        for service in self.SERVICES:
+            setattr(self, service, _InstrumentedService(getattr(client, service), service))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def instrument_client(client):
+    '''The client wrapped in an InstrumentedClient when recording, the client itself otherwise'''
+
+    if _recorder is None or isinstance(client, InstrumentedClient):
+        return client
+    return InstrumentedClient(client)
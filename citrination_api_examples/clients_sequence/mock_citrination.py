@@ -0,0 +1,687 @@
+'''
+A local stand-in for the Citrination endpoints used by the API examples, for offline runs and benchmarks.
+It speaks the same HTTP routes as citrination.com, so the unmodified CitrinationClient, the sequential learning wrappers
+and the notebooks run against it by pointing the client's site at the mock:
+
+    with MockCitrination(latency=0.05, ingest_time=1.0) as mock:
+        client = CitrinationClient(api_key="mock", site=mock.url)
+
+or, for the notebook runner (ci/run_notebooks.py --site http://localhost:8000):
+
+    python mock_citrination.py --port 8000 --latency 0.05
+
+Implemented: dataset creation and updates, versions, uploads and downloads (through a fake S3 that honors Range
+requests and sends an MD5 ETag), file listing, download URLs, PIF retrieval by uid and ingest status; data view
+creation, metadata, service status and retraining; design runs, predictions and t-SNE; and PIF search. Searches honor
+dataset id filters, property name and value filters, extract_as on the chemical formula and property values, and paging.
+Every request waits `latency` seconds, and ingest, training, design runs and predictions stay pending for their configured
+durations, so timings are repeatable. Models are an inverse-distance weighted nearest-neighbor fit of the view's
+outputs on its inputs, trained on the data present at creation or the last retrain.
+'''
+
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import sys
+import threading
+import uuid
+import zlib
+from datetime import datetime
+from time import monotonic, sleep
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import numpy as np
+
+
+class MockError(Exception):
+    '''An error response, with its HTTP status'''
+
+    def __init__(self, status, message):
+        super(MockError, self).__init__(message)
+        self.status = status
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _descriptor_values(system):
+    '''Descriptor key to value of a PIF system, as a data view sees it, e.g. {"Property y": 1.0, "formula": "Al2Cu"}'''
+
+    row = {}
+    if system.get("chemicalFormula") is not None:
+        row["formula"] = system["chemicalFormula"]
+    for prop in system.get("properties") or []:
+        scalars = prop.get("scalars")
+        scalars = scalars[0] if isinstance(scalars, list) and scalars else scalars
+        if isinstance(scalars, dict):
+            scalars = scalars.get("value")
+        if scalars is not None:
+            row["Property {}".format(prop.get("name"))] = scalars
+    return row
+
+
+def _feature(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # strings such as formulas get a stable pseudo-random coordinate
+        return (zlib.crc32(str(value).encode("utf-8")) & 0xffffffff) / float(0xffffffff)
+
+
+class SurrogateModel(object):
+    '''Inverse-distance weighted k-nearest-neighbor regression of outputs on inputs'''
+
+    def __init__(self, inputs, outputs, rows, k=8):
+        self.inputs = inputs
+        self.outputs = outputs
+        rows = [row for row in rows if all(key in row for key in inputs + outputs)]
+        self.x = np.array([[_feature(row[key]) for key in inputs] for row in rows], dtype=np.float64).reshape(-1, len(inputs))
+        self.y = np.array([[_feature(row[key]) for key in outputs] for row in rows], dtype=np.float64).reshape(-1, len(outputs))
+        self.scale = self.x.std(axis=0) if len(self.x) else np.ones(len(inputs))
+        self.scale[self.scale == 0] = 1.0
+        self.k = k
+
+    def predict(self, x):
+        '''(means, uncertainties) of every output, each of shape (n, len(outputs))'''
+
+        x = np.asarray(x, dtype=np.float64).reshape(-1, len(self.inputs))
+        if not len(self.x):
+            return np.zeros((len(x), len(self.outputs))), np.ones((len(x), len(self.outputs)))
+        distances = np.sqrt((((x[:, None, :] - self.x[None, :, :]) / self.scale) ** 2).sum(axis=2))
+        k = min(self.k, len(self.x))
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        d = distances[np.arange(len(x))[:, None], nearest]
+        weights = 1.0 / (d + 1e-9)
+        weights /= weights.sum(axis=1, keepdims=True)
+        neighbors = self.y[nearest]
+        means = (weights[:, :, None] * neighbors).sum(axis=1)
+        spread = np.sqrt((weights[:, :, None] * (neighbors - means[:, None, :]) ** 2).sum(axis=1))
+        # uncertainty grows away from the training data
+        uncertainties = spread + d.mean(axis=1, keepdims=True) * self.y.std(axis=0)
+        return means, uncertainties
+
+    def bounds(self):
+        if not len(self.x):
+            return np.zeros(len(self.inputs)), np.ones(len(self.inputs))
+        low, high = self.x.min(axis=0), self.x.max(axis=0)
+        pad = 0.1 * (high - low) + 1e-9
+        return low - pad, high + pad
+
+
+class MockCitrination(object):
+    '''In-memory Citrination with an HTTP front end on localhost
+
+    :param latency: Seconds every request waits before it is answered
+    :type latency: float
+    :param ingest_time: Seconds a dataset stays "Processing" after an upload
+    :type ingest_time: float
+    :param train_time: Seconds a data view's services stay unready after creation or retraining
+    :type train_time: float
+    :param design_time: Seconds a design run takes
+    :type design_time: float
+    :param predict_time: Seconds a prediction request takes
+    :type predict_time: float
+    :param seed: Seed of the design run candidate sampler
+    :type seed: int
+    :param host: Interface to serve on
+    :type host: str
+    :param port: Port to serve on, 0 for any free port
+    :type port: int
+    '''
+
+    def __init__(self, latency=0.0, ingest_time=0.0, train_time=0.0, design_time=0.0, predict_time=0.0,
+                 seed=0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.ingest_time = ingest_time
+        self.train_time = train_time
+        self.design_time = design_time
+        self.predict_time = predict_time
+        self.seed = seed
+        self.host = host
+        self.port = port
+        self.datasets = {}
+        self.views = {}
+        self.files = {}
+        self.design_runs = {}
+        self.predictions = {}
+        self.calls = []
+        self._lock = threading.RLock()
+        self._server = None
+        self._thread = None
+        self._routes = [
+            ("POST", r"data_sets/create_dataset", self.create_dataset),
+            ("POST", r"data_sets/(\d+)/create_dataset_version", self.create_dataset_version),
+            ("POST", r"data_sets/(\d+)/update", self.update_dataset),
+            ("POST", r"data_sets/(\d+)/upload", self.upload),
+            ("POST", r"data_sets/update_file/([\w-]+)", self.update_file),
+            ("POST", r"datasets/(\d+)/list_filepaths", self.list_files),
+            ("POST", r"datasets/(\d+)/download_files", self.download_files),
+            ("GET", r"datasets/(\d+)/pif/([^/]+)", self.get_pif),
+            ("GET", r"datasets/(\d+)/version/([^/]+)/pif/([^/]+)", self.get_pif_version),
+            ("GET", r"v1/datasets/(\d+)/ingest-status", self.ingest_status),
+            ("POST", r"v1/data_views", self.create_data_view),
+            ("GET", r"v1/data_views/(\d+)", self.get_data_view),
+            ("GET", r"data_views/(\d+)/status", self.data_view_status),
+            ("POST", r"data_views/(\d+)/retrain", self.retrain),
+            ("POST", r"data_views/(\d+)/experimental_design", self.submit_design_run),
+            ("GET", r"data_views/(\d+)/experimental_design/([\w-]+)/status", self.design_run_status),
+            ("GET", r"data_views/(\d+)/experimental_design/([\w-]+)/results", self.design_run_results),
+            ("POST", r"v1/data_views/(\d+)/predict/submit", self.submit_prediction),
+            ("GET", r"v1/data_views/(\d+)/predict/([\w-]+)/status", self.prediction_status),
+            ("GET", r"data_views/(\d+)/data_analysis", self.data_analysis),
+            ("POST", r"search/pif_search", self.pif_search),
+        ]
+
+    # ==== Server ===
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(self.host, self.port)
+
+    def start(self):
+        '''Serves in a background thread and returns the site URL for CitrinationClient'''
+
+        self._server = _ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.mock = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle(self, method, path, body):
+        '''Dispatches one API request and returns (status, JSON-serializable response)'''
+
+        start = monotonic()
+        if self.latency:
+            sleep(self.latency)
+        name = "unknown"
+        try:
+            route = path.split("?", 1)[0].strip("/")
+            if route.startswith("api/"):
+                route = route[4:]
+            for route_method, pattern, handler in self._routes:
+                match = re.match(pattern + "$", route)
+                if match and route_method == method:
+                    name = handler.__name__
+                    with self._lock:
+                        return 200, handler(body, *match.groups())
+            raise MockError(404, "No mock for {} {}".format(method, route))
+        except MockError as e:
+            return e.status, {"message": str(e)}
+        finally:
+            with self._lock:
+                self.calls.append((name, start, monotonic() - start))
+
+    def call_summary(self):
+        '''Endpoint name to (number of calls, seconds spent answering them, latency included)'''
+
+        summary = {}
+        for name, _, seconds in self.calls:
+            count, total = summary.get(name, (0, 0.0))
+            summary[name] = (count + 1, total + seconds)
+        return summary
+
+    def store_file(self, file_id, content):
+        with self._lock:
+            if file_id not in self.files:
+                raise MockError(404, "Unknown file {}".format(file_id))
+            self.files[file_id]["content"] = content
+
+    def file_content(self, file_id):
+        '''Bytes of an uploaded file for the fake S3, logged as an s3_download call after the latency'''
+
+        start = monotonic()
+        if self.latency:
+            sleep(self.latency)
+        with self._lock:
+            self.calls.append(("s3_download", start, monotonic() - start))
+            record = self.files.get(file_id)
+            if record is None or record["content"] is None:
+                raise MockError(404, "Unknown file {}".format(file_id))
+            return record["content"]
+
+    # ==== Data ===
+
+    def _dataset(self, dataset_id):
+        try:
+            return self.datasets[int(dataset_id)]
+        except KeyError:
+            raise MockError(404, "Unknown dataset {}".format(dataset_id))
+
+    def create_dataset(self, body):
+        spec = (body or {}).get("dataset", {})
+        dataset_id = len(self.datasets) + 1
+        self.datasets[dataset_id] = {
+            "id": dataset_id, "name": spec.get("name"), "description": spec.get("description"),
+            "created_at": datetime.utcnow().isoformat(), "version": 1, "files": {}, "file_ids": {},
+            "ingested_at": 0.0,
+        }
+        dataset = self.datasets[dataset_id]
+        return dict((key, dataset[key]) for key in ("id", "name", "description", "created_at"))
+
+    def update_dataset(self, body, dataset_id):
+        dataset = self._dataset(dataset_id)
+        spec = (body or {}).get("dataset", {})
+        for key in ("name", "description"):
+            if spec.get(key):
+                dataset[key] = spec[key]
+        return dict((key, dataset[key]) for key in ("id", "name", "description", "created_at"))
+
+    def create_dataset_version(self, body, dataset_id):
+        dataset = self._dataset(dataset_id)
+        dataset["version"] += 1
+        return {"dataset_scoped_id": dataset["version"]}
+
+    def upload(self, body, dataset_id):
+        self._dataset(dataset_id)
+        file_id = str(uuid.uuid4())
+        self.files[file_id] = {"dataset": int(dataset_id), "path": body["dest_path"], "content": None}
+        # the client PUTs the file to this "presigned S3 URL", which the mock serves too
+        return {
+            "url": {"scheme": "http", "host": "{}:{}".format(self.host, self.port),
+                    "path": "/s3/{}".format(file_id), "query": "signature=mock"},
+            "required_headers": {}, "file_id": file_id, "bucket": "mock",
+        }
+
+    def update_file(self, body, file_id):
+        record = self.files.get(file_id)
+        if record is None or record["content"] is None:
+            raise MockError(404, "File {} was not uploaded".format(file_id))
+        content = record["content"]
+        if content[:2] == b"\x1f\x8b":
+            content = gzip.decompress(content)
+        try:
+            systems = json.loads(content.decode("utf-8"))
+        except ValueError:
+            systems = []  # not a PIF; stored but not searchable
+        dataset = self.datasets[record["dataset"]]
+        dataset["files"][record["path"]] = [s for s in _as_list(systems) if isinstance(s, dict)]
+        dataset["file_ids"][record["path"]] = file_id
+        dataset["ingested_at"] = monotonic() + self.ingest_time
+        return {}
+
+    def list_files(self, body, dataset_id):
+        return {"files": sorted(self._dataset(dataset_id)["files"])}
+
+    def download_files(self, body, dataset_id):
+        # only the latest version is kept, so every request gets its files
+        dataset = self._dataset(dataset_id)
+        request = (body or {}).get("download_request", {})
+        pattern = request.get("glob", ".")
+        if request.get("isDir"):
+            pattern = "^" + re.escape(pattern.rstrip("/")) + "/"
+        files = [{"filename": path, "url": "{}/s3/{}?signature=mock".format(self.url, file_id)}
+                 for path, file_id in sorted(dataset["file_ids"].items()) if re.search(pattern, path)]
+        return {"versions": [{"number": dataset["version"], "files": files}]}
+
+    def get_pif(self, body, dataset_id, uid):
+        for _, _, _, system in self._systems([str(int(dataset_id))]):
+            if system.get("uid") == uid:
+                return system
+        raise MockError(404, "No PIF {} in dataset {}".format(uid, dataset_id))
+
+    def get_pif_version(self, body, dataset_id, uid, version):
+        # DataClient.get_pif puts the uid where the route has the version and vice versa
+        return self.get_pif(body, dataset_id, uid)
+
+    def ingest_status(self, body, dataset_id):
+        ready = monotonic() >= self._dataset(dataset_id)["ingested_at"]
+        return {"data": {"status": "Finished" if ready else "Processing"}}
+
+    def _systems(self, dataset_ids=None):
+        '''(dataset id, version, index, system) of every searchable record'''
+
+        for dataset_id in sorted(self.datasets):
+            if dataset_ids is not None and str(dataset_id) not in dataset_ids:
+                continue
+            dataset = self.datasets[dataset_id]
+            if monotonic() < dataset["ingested_at"]:
+                continue
+            index = 0
+            for path in sorted(dataset["files"]):
+                for system in dataset["files"][path]:
+                    yield dataset_id, dataset["version"], index, system
+                    index += 1
+
+    # ==== Data views ===
+
+    def _view(self, view_id):
+        try:
+            return self.views[int(view_id)]
+        except KeyError:
+            raise MockError(404, "Unknown data view {}".format(view_id))
+
+    def create_data_view(self, body):
+        configuration = body["configuration"]
+        view_id = len(self.views) + 1
+        roles = configuration.get("roles", {})
+        self.views[view_id] = {
+            "name": body.get("name"), "configuration": configuration,
+            "dataset_ids": [str(d) for d in configuration.get("dataset_ids", [])],
+            "inputs": sorted(key for key, role in roles.items() if role == "input"),
+            "outputs": sorted(key for key, role in roles.items() if role == "output"),
+        }
+        self._train(view_id)
+        return {"data": {"id": view_id}}
+
+    def _train(self, view_id):
+        view = self.views[view_id]
+        rows = [_descriptor_values(system) for _, _, _, system in self._systems(view["dataset_ids"])]
+        view["model"] = SurrogateModel(view["inputs"], view["outputs"], rows)
+        view["trained_at"] = monotonic() + self.train_time
+        view["started_at"] = monotonic()
+        # assumed to change on retrain, as batch_predict.view_model_version expects; not documented by Citrination
+        view["updated_at"] = datetime.utcnow().isoformat()
+
+    def get_data_view(self, body, view_id):
+        view = self._view(view_id)
+        return {"data": {"data_view": {"id": int(view_id), "name": view["name"], "updated_at": view["updated_at"],
+                                       "dataset_ids": view["dataset_ids"]}}}
+
+    def retrain(self, body, view_id):
+        self._view(view_id)
+        self._train(int(view_id))
+        return {}
+
+    def data_view_status(self, body, view_id):
+        view = self._view(view_id)
+        span = max(view["trained_at"] - view["started_at"], 1e-9)
+        progress = min(1.0, (monotonic() - view["started_at"]) / span)
+        ready = progress >= 1.0
+
+        def service(title):
+            return {"ready": ready, "reason": "" if ready else "Model is training", "context": "mock",
+                    "event": {"title": title, "normalizedProgress": progress}}
+
+        return {"data": {"status": {
+            "predict": service("Training"), "experimental_design": service("Training"),
+            "data_reports": service("Reports"), "model_reports": service("Reports"),
+        }}}
+
+    def submit_design_run(self, body, view_id):
+        view = self._view(view_id)
+        model = view["model"]
+        target = body.get("target") or {"descriptor": view["outputs"][0], "objective": "Max"}
+        output = model.outputs.index(target["descriptor"])
+        sign = -1.0 if target["objective"] == "Min" else 1.0
+
+        rng = np.random.RandomState(self.seed + len(self.design_runs))
+        low, high = model.bounds()
+        num_candidates = int(body["num_candidates"])
+        pool = rng.uniform(low, high, size=(min(20000, num_candidates * 10 * int(body["effort"])), len(low)))
+        means, uncertainties = model.predict(pool)
+        means, uncertainties = means[:, output], uncertainties[:, output]
+
+        def candidates(scores):
+            best = np.argsort(-scores, kind="mergesort")[:num_candidates]
+            return [{"descriptor_values": dict(
+                [(key, str(pool[i, j])) for j, key in enumerate(model.inputs)] +
+                [(target["descriptor"], str(means[i])),
+                 ("Uncertainty in {}".format(target["descriptor"]), str(uncertainties[i]))])}
+                for i in best]
+
+        run_id = str(uuid.uuid4())
+        self.design_runs[run_id] = {
+            "view": int(view_id), "done_at": monotonic() + self.design_time,
+            "best_material_results": candidates(sign * means),
+            "next_experiment_results": candidates(sign * means + uncertainties),
+        }
+        return {"data": {"design_run": {"uid": run_id}}}
+
+    def _design_run(self, view_id, run_id):
+        run = self.design_runs.get(run_id)
+        if run is None or run["view"] != int(view_id):
+            raise MockError(404, "Unknown design run {}".format(run_id))
+        return run
+
+    def design_run_status(self, body, view_id, run_id):
+        run = self._design_run(view_id, run_id)
+        done = monotonic() >= run["done_at"]
+        return {"data": {"status": "Finished" if done else "Accepted", "progress": 100 if done else 0,
+                         "result": None, "messages": []}}
+
+    def design_run_results(self, body, view_id, run_id):
+        run = self._design_run(view_id, run_id)
+        return {"data": {"best_material_results": run["best_material_results"],
+                         "next_experiment_results": run["next_experiment_results"]}}
+
+    def submit_prediction(self, body, view_id):
+        model = self._view(view_id)["model"]
+        candidates = _as_list(body["candidates"])
+        x = [[_feature(candidate.get(key)) for key in model.inputs] for candidate in candidates]
+        means, uncertainties = model.predict(x)
+        results = {"candidates": [], "loss": []}
+        for i, candidate in enumerate(candidates):
+            values = dict((key, value) for key, value in candidate.items())
+            losses = dict((key, 0.0) for key in candidate)
+            for j, key in enumerate(model.outputs):
+                values[key] = float(means[i, j])
+                losses[key] = float(uncertainties[i, j])
+            results["candidates"].append(values)
+            results["loss"].append(losses)
+        prediction_id = str(uuid.uuid4())
+        self.predictions[prediction_id] = {"done_at": monotonic() + self.predict_time, "results": results}
+        return {"data": {"uid": prediction_id}}
+
+    def prediction_status(self, body, view_id, prediction_id):
+        prediction = self.predictions.get(prediction_id)
+        if prediction is None:
+            raise MockError(404, "Unknown prediction {}".format(prediction_id))
+        if monotonic() < prediction["done_at"]:
+            return {"data": {"status": "Accepted"}}
+        return {"data": {"status": "Finished", "results": prediction["results"]}}
+
+    def data_analysis(self, body, view_id):
+        view = self._view(view_id)
+        model = view["model"]
+        uids = ["{}/{}/{}".format(d, v, i) for d, v, i, system in self._systems(view["dataset_ids"])
+                if all(key in _descriptor_values(system) for key in model.inputs + model.outputs)]
+        # a deterministic 2D embedding: the first two principal components of the standardized inputs
+        x = (model.x - model.x.mean(axis=0)) / model.scale if len(model.x) else model.x
+        if len(x):
+            _, _, components = np.linalg.svd(x, full_matrices=False)
+            xy = x.dot(components[:2].T)
+            xy = np.hstack([xy, np.zeros((len(x), 2 - xy.shape[1]))])
+        else:
+            xy = np.zeros((0, 2))
+        tags = [", ".join(str(value) for value in row) for row in model.x.tolist()]
+        return {"projections": dict(
+            (key, {"x": xy[:, 0].tolist(), "y": xy[:, 1].tolist(), "label": model.y[:, j].tolist(),
+                   "inputs": tags, "uid": uids[:len(xy)]})
+            for j, key in enumerate(model.outputs))}
+
+    # ==== Search ===
+
+    def pif_search(self, body):
+        data_queries = _as_list(body.get("query"))
+        dataset_ids = set()
+        for query in data_queries:
+            for dataset in _as_list(query.get("dataset")):
+                for id_filter in _as_list(dataset.get("id")):
+                    if id_filter.get("equal") is not None:
+                        dataset_ids.add(str(id_filter["equal"]))
+        system_queries = [s for query in data_queries for s in _as_list(query.get("system"))]
+
+        hits = []
+        for dataset_id, version, index, system in self._systems(dataset_ids or None):
+            extracted = {}
+            if all(_match_system(system, query, extracted) for query in system_queries):
+                hits.append({"id": "{}/{}/{}".format(dataset_id, version, index), "dataset": dataset_id,
+                             "datasetVersion": version, "score": 1.0, "system": system, "extracted": extracted})
+        start = body.get("from") or 0
+        size = body.get("size")
+        page = hits[start:] if size is None else hits[start:start + size]
+        return {"results": {"took": 1, "totalNumHits": len(hits), "maxScore": 1.0, "hits": page}}
+
+
+def _match_filters(value, filters):
+    '''Whether a value passes any of the equal/min/max filters; no filters always pass'''
+
+    filters = _as_list(filters)
+    if not filters:
+        return True
+    for f in filters:
+        if f.get("equal") is not None and str(f["equal"]) != str(value):
+            continue
+        try:
+            if f.get("min") is not None and float(value) < float(f["min"]):
+                continue
+            if f.get("max") is not None and float(value) > float(f["max"]):
+                continue
+        except (TypeError, ValueError):
+            continue
+        return True
+    return False
+
+
+def _match_system(system, query, extracted):
+    '''Whether a PIF system matches a PifSystemQuery; fills extracted with its extract_as values'''
+
+    for formula_query in _as_list(query.get("chemicalFormula")):
+        formula = system.get("chemicalFormula")
+        if formula is None or not _match_filters(formula, formula_query.get("filter")):
+            return False
+        if formula_query.get("extractAs"):
+            extracted[formula_query["extractAs"]] = formula
+    for property_query in _as_list(query.get("properties")):
+        name_query = property_query.get("name") or {}
+        value_query = property_query.get("value") or {}
+        for prop in system.get("properties") or []:
+            value = _descriptor_values({"properties": [prop]}).get("Property {}".format(prop.get("name")))
+            if (_match_filters(prop.get("name"), name_query.get("filter")) and
+                    _match_filters(value, value_query.get("filter"))):
+                if name_query.get("extractAs"):
+                    extracted[name_query["extractAs"]] = prop.get("name")
+                if value_query.get("extractAs"):
+                    extracted[value_query["extractAs"]] = str(value)
+                break
+        else:
+            return False
+    return True
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients may hang up mid-response, e.g. bulk_download closing the download of a file it already has
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_file(self, file_id):
+        # a presigned S3 GET: the whole object, or the tail from a "Range: bytes=N-" header, with an MD5 ETag
+        try:
+            content = self.server.mock.file_content(file_id)
+        except MockError as e:
+            return self._reply(e.status, {"message": str(e)})
+        match = re.match(r"bytes=(\d+)-$", self.headers.get("Range") or "")
+        start = int(match.group(1)) if match else 0
+        if match and start >= len(content):
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */{}".format(len(content)))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(206 if match else 200)
+        if match:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, len(content) - 1, len(content)))
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(content) - start))
+        self.send_header("ETag", '"{}"'.format(hashlib.md5(content).hexdigest()))
+        self.end_headers()
+        self.wfile.write(content[start:])
+
+    def _dispatch(self, method):
+        mock = self.server.mock
+        body = self._body()
+        if method == "GET" and self.path.startswith("/s3/"):
+            return self._send_file(self.path.split("?", 1)[0][len("/s3/"):])
+        if method == "PUT" and self.path.startswith("/s3/"):
+            try:
+                mock.store_file(self.path.split("?", 1)[0][len("/s3/"):], body)
+                return self._reply(200, {})
+            except MockError as e:
+                return self._reply(e.status, {"message": str(e)})
+        try:
+            payload = json.loads(body.decode("utf-8")) if body else None
+        except ValueError:
+            return self._reply(400, {"message": "Invalid JSON"})
+        self._reply(*mock.handle(method, self.path, payload))
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock Citrination API on localhost")
+    parser.add_argument("-p", "--port", type=int, default=8000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-l", "--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--ingest_time", type=float, default=0.0, help="seconds an upload takes to ingest")
+    parser.add_argument("--train_time", type=float, default=0.0, help="seconds a data view takes to train")
+    parser.add_argument("--design_time", type=float, default=0.0, help="seconds a design run takes")
+    parser.add_argument("--predict_time", type=float, default=0.0, help="seconds a prediction takes")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the design run sampler")
+    options = parser.parse_args()
+
+    mock = MockCitrination(latency=options.latency, ingest_time=options.ingest_time,
+                           train_time=options.train_time, design_time=options.design_time,
+                           predict_time=options.predict_time, seed=options.seed,
+                           host=options.host, port=options.port)
+    print("Mock Citrination serving at {}".format(mock.start()))
+    try:
+        while True:
+            sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
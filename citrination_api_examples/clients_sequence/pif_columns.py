@@ -0,0 +1,185 @@
+'''
+Columnar extraction of PIF search hits into NumPy arrays or a pandas DataFrame.
+Records are walked once into preallocated columns, and the property name to index lookup is built once per schema
+(the tuple of property names of a record), so datasets whose records share a layout pay for the lookup once rather than
+once per record. Missing properties, scalars and extracted values become NaN instead of raising.
+pandas is only needed for extract_frame.
+
+    columns = extract_columns(query_result.hits, properties=["Band gap"], extracted=["formula"])
+    frame = extract_frame(query_result.hits, properties=["Band gap"], fields=["chemical_formula"])
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+
+_MISSING = float("nan")
+
+
+def _camel(name):
+    parts = name.split("_")
+    return parts[0] + "".join(part.title() for part in parts[1:])
+
+
+def _get(obj, name):
+    # pypif objects use snake_case attributes, raw PIF JSON uses camelCase keys
+    if isinstance(obj, dict):
+        return obj.get(_camel(name), obj.get(name))
+    return getattr(obj, name, None)
+
+
+def _unwrap(record):
+    '''(system, extracted) of a search hit, a pypif System or raw PIF JSON'''
+
+    system = _get(record, "system")
+    if system is not None:
+        return system, _get(record, "extracted")
+    return record, None
+
+
+def _properties(system):
+    '''Properties of a system and the tuple of their names'''
+
+    if isinstance(system, dict):
+        props = system.get("properties") or []
+        return props, tuple([prop.get("name") for prop in props])
+    props = system.properties or []
+    return props, tuple([prop.name for prop in props])
+
+
+def _scalar_value(prop):
+    scalars = prop.get("scalars") if isinstance(prop, dict) else prop.scalars
+    if isinstance(scalars, list):
+        if not scalars:
+            return _MISSING
+        scalars = scalars[0]
+    if scalars is None:
+        return _MISSING
+    if isinstance(scalars, dict):
+        value = scalars.get("value")
+    else:
+        value = getattr(scalars, "value", scalars)
+    return _MISSING if value is None else value
+
+
+def _store_object(columns, key, row, value):
+    '''Turns the float column of key into an object column, at its first value that is not a number'''
+
+    column = columns[key] = columns[key].astype(object)
+    column[row] = value
+
+
+def _floats_where_numbers(column):
+    '''Converts the values of an object column that are numbers to floats in place, like the rows before the switch'''
+
+    for row, value in enumerate(column):
+        try:
+            column[row] = float(value)
+        except (TypeError, ValueError):
+            pass
+
+
+def _field_column(column):
+    '''Float array when no value is a string and every value converts, the object column otherwise'''
+
+    if not any(isinstance(value, str) for value in column):
+        try:
+            return column.astype(np.float64)
+        except (TypeError, ValueError):
+            pass
+    return column
+
+
+def extract_columns(records, properties=(), extracted=(), fields=()):
+    '''Extracts columns from search hits or PIF systems in one pass
+
+    :param records: PifSearchHits, pypif Systems or raw PIF JSON dicts
+    :type records: Iterable
+    :param properties: Property names, or positions such as -1 for the last property; the column holds the first scalar
+    :type properties: Iterable[Union[str, int]]
+    :param extracted: Keys of hit.extracted, from extract_as in the query
+    :type extracted: Iterable[str]
+    :param fields: System attributes, e.g. "uid" or "chemical_formula", kept as strings
+    :type fields: Iterable[str]
+    :return: Column name (the property, key or field as given) to array, in the order requested; a column with values
+        that are not numbers is an object array, holding the others as floats
+    :rtype: OrderedDict
+    '''
+
+    properties = list(properties)
+    extracted = list(extracted)
+    fields = list(fields)
+    # the columns are allocated up front, so a one-shot iterable of records is read into a list first
+    if not hasattr(records, "__len__"):
+        records = list(records)
+    columns = OrderedDict((key, np.full(len(records), _MISSING)) for key in properties + extracted)
+    columns.update((key, np.full(len(records), _MISSING, dtype=object)) for key in fields)
+    lookups = {}
+
+    for row, record in enumerate(records):
+        system, found = _unwrap(record)
+        props, schema = _properties(system)
+        lookup = lookups.get(schema)
+        if lookup is None:
+            # first property with a given name wins, as in next(p for p in props if p.name == name)
+            names = {}
+            for i, name in enumerate(schema):
+                names.setdefault(name, i)
+            lookup = lookups[schema] = [
+                (key, names.get(key) if not isinstance(key, int) else
+                 (key if -len(schema) <= key < len(schema) else None))
+                for key in properties]
+
+        for key, i in lookup:
+            if i is not None:
+                value = _scalar_value(props[i])
+                try:
+                    columns[key][row] = value
+                except (TypeError, ValueError):
+                    _store_object(columns, key, row, value)
+        for key in extracted:
+            value = found.get(key) if found else None
+            if value is not None:
+                try:
+                    columns[key][row] = value
+                except (TypeError, ValueError):
+                    _store_object(columns, key, row, value)
+        for key in fields:
+            value = _get(system, key)
+            if value is not None:
+                columns[key][row] = value
+
+    # scalars and extracted values are often numbers sent as strings, fields such as uid are not
+    for key in properties + extracted:
+        if columns[key].dtype == object:
+            _floats_where_numbers(columns[key])
+    for key in fields:
+        columns[key] = _field_column(columns[key])
+    return columns
+
+
+def extract_frame(records, properties=(), extracted=(), fields=()):
+    '''DataFrame of extract_columns, one row per record; see extract_columns for the arguments
+
+    :rtype: pd.DataFrame
+    '''
+
+    import pandas as pd
+    return pd.DataFrame(extract_columns(records, properties, extracted, fields))
+
+
+def property_column(records, prop):
+    '''Float array of the first scalar of one property, NaN where missing or not a number
+
+    :param records: PifSearchHits, pypif Systems or raw PIF JSON dicts
+    :type records: Iterable
+    :param prop: Property name, or position such as -1 for the last property
+    :type prop: Union[str, int]
+    :rtype: np.ndarray
+    '''
+
+    column = extract_columns(records, properties=[prop])[prop]
+    if column.dtype == object:
+        # every value that converts is already a float, see _floats_where_numbers
+        column = np.array([value if isinstance(value, float) else _MISSING for value in column], dtype=np.float64)
+    return column
@@ -3,74 +3,160 @@ Authors: Eddie Kim, Enze Chen
 This file contains wrapper functions that are used in the sequential learning API tutorial notebook. Detailed docstrings with method fuctions and parameters are given below.
 '''
 
+import gzip
 import json
+import os
 from collections import OrderedDict
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
 
 import numpy as np
 import matplotlib.pyplot as plt
 from citrination_client import (CitrinationClient, DataQuery, DatasetQuery,
                                 Filter, PifSystemReturningQuery,
-                                RealDescriptor)
+                                RealDescriptor, APIVersionMismatchException,
+                                ResourceNotFoundException, UnauthorizedAccessException)
 from citrination_client.models.design import Target
 from citrination_client.views.data_view_builder import DataViewBuilder
 from pypif import pif
 from pypif.obj import *
 
+from acquisition import acquisition_scores, candidate_predictions, top_k
+from pif_columns import property_column
+from async_waiters import (poll, backoff_delays, ingest_finished, data_view_ready,
+                           design_run_finished)
+from instrumentation import instrument_client, instrumented, span
 
-def write_dataset_from_func(test_function, filename, input_vals):
+# upload errors a retry cannot fix: a missing local file, bad credentials, an unknown dataset or an outdated client
+_PERMANENT_UPLOAD_ERRORS = (ValueError, UnauthorizedAccessException, ResourceNotFoundException,
+                            APIVersionMismatchException)
+
+
+@instrumented()
+def write_dataset_from_func(test_function, filename, input_vals, vectorized = False,
+                        indent = 4, num_shards = 1, chunk_size = 10000):
     '''Given a function, write a dataset evaluated on given input values
 
+    Rows are evaluated and written chunk by chunk, so the whole dataset is
+    never held in memory as PIF objects or as one JSON string.
+
     :param test_function: Function for generating dataset
     :type test_function: Callable[[np.ndarray], float]
-    :param filename: Name of file for saving CSV dataset
+    :param filename: Name of file for saving PIF JSON dataset, gzip'd if it ends in .gz
     :type filename: str
     :param input_vals: List of input values to eval function over
     :type input_vals: np.ndarray
-    :return: Doesn't return anything
-    :rtype: None
+    :param vectorized: Whether test_function maps a 2D array of rows to a 1D array of values
+    :type vectorized: bool
+    :param indent: JSON indent, None for compact output
+    :type indent: int
+    :param num_shards: Number of files to split the dataset over, see shard_paths
+    :type num_shards: int
+    :param chunk_size: Rows evaluated and serialized at a time
+    :type chunk_size: int
+    :return: Function values written to the dataset
+    :rtype: List[float]
     '''
 
-    pif_systems = []
-    for i, val_row in enumerate(input_vals):
-        system = System()
-        system.names = '{}_{}'.format(test_function.__name__, i)
-        system.properties =  []
-
-        for j, x_val in enumerate(val_row):
-            func_input = Property()
-            func_input.name = 'x{}'.format(j+1)
-            func_input.scalars = x_val
-            system.properties.append(func_input)
-
-        func_output = Property()
-        func_output.name = 'y'
-        func_output.scalars = test_function(val_row)
-        system.properties.append(func_output)
-        pif_systems.append(system)
-
-    with open(filename, "w") as f:
-        f.write(pif.dumps(pif_systems, indent=4))
-
+    input_vals = np.asarray(input_vals)
+    output_vals = []
+    paths = shard_paths(filename, num_shards)
+    bounds = np.linspace(0, len(input_vals), len(paths) + 1).astype(int)
+
+    for path, shard_start, shard_stop in zip(paths, bounds[:-1], bounds[1:]):
+        with (gzip.open(path, "wt") if path.endswith(".gz") else open(path, "w")) as f:
+            f.write("[")
+            for chunk_start in range(shard_start, shard_stop, chunk_size):
+                chunk = input_vals[chunk_start:min(chunk_start + chunk_size, shard_stop)]
+                chunk_outputs = _evaluate_rows(test_function, chunk, vectorized)
+                output_vals.extend(chunk_outputs)
+                if chunk_start > shard_start:
+                    f.write(",")
+                f.write(_systems_json(test_function.__name__, chunk_start, chunk.tolist(),
+                                      chunk_outputs, indent))
+            f.write("\n]" if indent is not None and shard_stop > shard_start else "]")
+    return output_vals
+
+
+def shard_paths(filename, num_shards = 1):
+    '''File names of a dataset split over several files, e.g. data_0.json, data_1.json
+
+    :param filename: Name of the unsplit dataset file
+    :type filename: str
+    :param num_shards: Number of files
+    :type num_shards: int
+    :return: One file name per shard
+    :rtype: List[str]
+    '''
 
+    if num_shards == 1:
+        return [filename]
+    base, ext = os.path.splitext(filename)
+    if ext == ".gz":
+        base, inner_ext = os.path.splitext(base)
+        ext = inner_ext + ext
+    return ["{}_{}{}".format(base, k, ext) for k in range(num_shards)]
+
+
+def _evaluate_rows(test_function, rows, vectorized):
+    if vectorized:
+        values = np.asarray(test_function(rows))
+        if values.shape != (len(rows),):
+            raise ValueError("A vectorized test_function must return one value per row.")
+        return values.tolist()
+    return [
+        value.item() if isinstance(value, np.generic) else value
+        for value in (test_function(row) for row in rows)
+    ]
+
+
+def _systems_json(func_name, first_index, rows, output_vals, indent):
+    # Same layout as pif.dumps of a list of Systems, without the enclosing brackets
+    systems = []
+    for i, (row, y) in enumerate(zip(rows, output_vals)):
+        properties = [{"name": "x{}".format(j+1), "scalars": x_val}
+                      for j, x_val in enumerate(row)]
+        properties.append({"name": "y", "scalars": y})
+        systems.append({
+            "names": "{}_{}".format(func_name, first_index + i),
+            "properties": properties,
+            "category": "system",
+        })
+    if indent is None:
+        return json.dumps(systems, separators=(",", ":"))[1:-1]
+    return json.dumps(systems, indent=indent)[1:-2]
+
+
+@instrumented()
 def upload_data_and_get_id(client, dataset_name, dataset_local_fpath,
-                        create_new_version = False, given_dataset_id = None):
+                        create_new_version = False, given_dataset_id = None,
+                        max_workers = 4, retries = 3, print_output = False,
+                        relative_to = None):
     '''Uploads data to a new/given dataset and returns its ID
 
     :param client: Client API object to pass in
     :type client: CitrinationClient
     :param dataset_name: Name of dataset
     :type dataset_name: str
-    :param dataset_local_fpath: Local data filepath
-    :type dataset_local_fpath: str
+    :param dataset_local_fpath: Local data filepath, directory or list of filepaths (e.g. shards)
+    :type dataset_local_fpath: Union[str, List[str]]
     :param create_new_version: Whether or not to make a new version
     :param create_new_version: bool
     :param given_dataset_id: ID if using existing dataset, defaults to None
     :param given_dataset_id: int
+    :param max_workers: Files uploaded concurrently
+    :type max_workers: int
+    :param retries: Retries per file after a failed attempt
+    :type retries: int
+    :param print_output: Whether or not to print outputs
+    :type print_output: bool
+    :param relative_to: Store files under their path relative to this directory, see upload_files
+    :type relative_to: str
     :return: ID of the dataset
     :rtype: int
     '''
 
+    client = instrument_client(client)
     if given_dataset_id is None:
         dataset = client.data.create_dataset(dataset_name)
         dataset_id = dataset.id
@@ -79,11 +165,106 @@ def upload_data_and_get_id(client, dataset_name, dataset_local_fpath,
         if create_new_version:
             client.data.create_dataset_version(dataset_id)
 
-    client.data.upload(dataset_id, dataset_local_fpath)
-    assert (client.data.matched_file_count(dataset_id) >= 1), "Upload failed."
+    report = upload_files(client, dataset_id, dataset_local_fpath, max_workers, retries,
+                          relative_to=relative_to)
+    if print_output:
+        print(report)
+    assert not report.failures, "Upload failed: {}".format(report.failures)
+    # check that every uploaded file is listed in the dataset now
+    listed = set(client.data.list_files(dataset_id))
+    missing = [path for path in report.successes if _dest_path(path, relative_to) not in listed]
+    assert not missing, "Upload failed, not in the dataset: {}".format(missing)
+
+    # Searches cached before the upload no longer reflect the dataset
+    search_cache = getattr(client.search, "cache", None)
+    if search_cache is not None:
+        search_cache.invalidate_dataset(dataset_id)
     return dataset_id
 
 
+class UploadReport(object):
+    '''Per-file outcome and throughput of upload_files'''
+
+    def __init__(self, successes, failures, num_bytes, seconds):
+        self.successes = successes
+        self.failures = failures
+        self.num_bytes = num_bytes
+        self.seconds = seconds
+        self.files_per_second = len(successes) / seconds if seconds else 0.0
+        self.mb_per_second = num_bytes / 1e6 / seconds if seconds else 0.0
+
+    def __repr__(self):
+        return "Uploaded {} files ({:.2f} MB) in {:.2f}s: {:.1f} files/s, {:.2f} MB/s, {} failed".format(
+            len(self.successes), self.num_bytes / 1e6, self.seconds,
+            self.files_per_second, self.mb_per_second, len(self.failures))
+
+
+def _dest_path(path, relative_to):
+    # the client stores a file under its source path unless given another one
+    return path if relative_to is None else os.path.relpath(path, relative_to)
+
+
+@instrumented()
+def upload_files(client, dataset_id, paths, max_workers = 4, retries = 3, backoff = 1.0,
+                 relative_to = None):
+    '''Uploads files to a dataset over a bounded thread pool, retrying failed files
+
+    :param client: Client API object to pass in
+    :type client: CitrinationClient
+    :param dataset_id: Dataset to upload to
+    :type dataset_id: int
+    :param paths: Filepath, directory (uploaded recursively) or list of filepaths
+    :type paths: Union[str, List[str]]
+    :param max_workers: Files uploaded concurrently
+    :type max_workers: int
+    :param retries: Retries per file after a failed attempt, except for a missing file or a rejected request
+    :type retries: int
+    :param backoff: Wait in seconds before the first retry, doubling after each
+    :type backoff: float
+    :param relative_to: Store files under their path relative to this directory instead of
+        their source path, e.g. for files written to a temporary directory
+    :type relative_to: str
+    :return: Successful files, failed files with the last error, and throughput
+    :rtype: UploadReport
+    '''
+
+    client = instrument_client(client)
+    if isinstance(paths, str):
+        if os.path.isdir(paths):
+            paths = sorted(os.path.join(root, name)
+                           for root, _, files in os.walk(paths) for name in files)
+        else:
+            paths = [paths]
+
+    def upload_one(path):
+        delays = backoff_delays(backoff, max_interval=backoff * 2 ** retries)
+        for attempt in range(retries + 1):
+            try:
+                if client.data.upload(dataset_id, path, _dest_path(path, relative_to)).successful():
+                    return None
+                error = "Upload failure"
+            except _PERMANENT_UPLOAD_ERRORS as e:
+                return "{}: {}".format(type(e).__name__, e)
+            except Exception as e:
+                error = "{}: {}".format(type(e).__name__, e)
+            if attempt < retries:
+                with span("upload.retry_sleep", "idle"):
+                    sleep(next(delays))
+        return error
+
+    successes, failures, num_bytes = [], OrderedDict(), 0
+    start = monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for path, error in zip(paths, executor.map(upload_one, paths)):
+            if error is None:
+                successes.append(path)
+                num_bytes += os.path.getsize(path)
+            else:
+                failures[path] = error
+    return UploadReport(successes, failures, num_bytes, monotonic() - start)
+
+
+@instrumented()
 def build_view_and_get_id(client, dataset_id, input_keys, output_keys, view_name, view_desc = "",
                         wait_time = 2, print_output = False):
     '''Builds a new data view and returns the view ID
@@ -108,6 +289,7 @@ def build_view_and_get_id(client, dataset_id, input_keys, output_keys, view_name
     :rtype: int
     '''
 
+    client = instrument_client(client)
     dv_builder = DataViewBuilder()
     dv_builder.dataset_ids([str(dataset_id)])
     dv_builder.model_type('default')
@@ -132,15 +314,22 @@ def build_view_and_get_id(client, dataset_id, input_keys, output_keys, view_name
     return dv_id
 
 
+@instrumented()
 def run_sequential_learning(client, view_id, dataset_id,
                         num_candidates_per_iter,
                         design_effort, wait_time,
                         num_sl_iterations, input_properties,
                         target, print_output,
                         true_function,
-                        score_type):
+                        score_type,
+                        verify_measured = False,
+                        acquisition = None,
+                        batch_size = None):
     '''Runs SL design
 
+    The best measured value is read from the dataset once up front and then
+    updated from the candidates evaluated in each iteration.
+
     :param client: Client object
     :type client: CitrinationClient
     :param view_id: View ID
@@ -165,16 +354,24 @@ def run_sequential_learning(client, view_id, dataset_id,
     :type true_function: Callable[[np.ndarray], float]
     :param score_type: MLI or MEI
     :type score_type: str
+    :param verify_measured: Whether to re-read the best measured value from the
+        whole dataset after each upload instead of tracking it locally
+    :type verify_measured: bool
+    :param acquisition: Rescore the design run candidates locally with this method of
+        acquisition.acquisition_scores and keep only the best batch_size, defaults to None
+    :type acquisition: str
+    :param batch_size: Candidates kept per iteration when acquisition is set
+    :type batch_size: int
     :return: 2-tuple: list of predicted scores/uncertainties; list of measured scores/uncertainties
     :rtype: Tuple[List[float], List[float]]
     '''
 
-
-
+    client = instrument_client(client)
     best_sl_pred_vals = []
     best_sl_measured_vals = []
 
     _wait_on_ingest(client, dataset_id, wait_time, print_output)
+    best_measured = _best_measured(_iter_dataset_hits(client, dataset_id), target)
 
     for i in range(num_sl_iterations):
         if print_output:
@@ -198,37 +395,23 @@ def run_sequential_learning(client, view_id, dataset_id,
 
         _wait_on_design_run(client, design_id, view_id, wait_time, print_output)
 
-        # Compute the best values with uncertainties as a list of (value, uncertainty)
-        if score_type == "MEI":
-            candidates = client.models.get_design_run_results(view_id, design_id).best_materials
-        else:
-            candidates = client.models.get_design_run_results(view_id, design_id).next_experiments
-        values_w_uncertainties = [
-            (
-                m["descriptor_values"][target[0]],
-                m["descriptor_values"]["Uncertainty in {}".format(target[0])]
-            ) for m in candidates
-        ]
+        candidates = _design_candidates(
+            client.models.get_design_run_results(view_id, design_id), score_type)
 
         # Find and save the best predicted value
-        if target[1] == "Min":
-            best_value_w_uncertainty = min(values_w_uncertainties, key=lambda x: x[0])
-        else:
-            best_value_w_uncertainty = max(values_w_uncertainties, key=lambda x: x[0])
-
+        best_value_w_uncertainty = _best_predicted(candidates, target)
         best_sl_pred_vals.append(best_value_w_uncertainty)
         if print_output:
             print("SL iter #{}, best predicted (value, uncertainty) = {}".format(i+1, best_value_w_uncertainty))
 
+        if acquisition is not None:
+            candidates = _screen_candidates(candidates, target, best_measured, acquisition, batch_size)
+
         # Update dataset w/ new candidates
-        new_x_vals = []
-        for material in candidates:
-            new_x_vals.append(np.array(
-                [float(material["descriptor_values"][x]) for x in input_properties]
-            ))
+        new_x_vals = _candidate_inputs(candidates, input_properties)
 
         temp_dataset_fpath = "design-{}.json".format(design_id)
-        write_dataset_from_func(true_function, temp_dataset_fpath, new_x_vals)
+        new_y_vals = write_dataset_from_func(true_function, temp_dataset_fpath, new_x_vals)
         upload_data_and_get_id(
             client,
             "", # No name needed for updating a dataset
@@ -241,28 +424,14 @@ def run_sequential_learning(client, view_id, dataset_id,
         if print_output:
             print("Dataset updated: {} candidates added.".format(len(new_x_vals)))
 
-        query_dataset = PifSystemReturningQuery(size=9999,
-                            query=DataQuery(
-                            dataset=DatasetQuery(
-                                id=Filter(equal=str(dataset_id))
-                        )))
-        query_result = client.search.pif_search(query_dataset)
-
-        if print_output:
-            print("New dataset contains {} PIFs.".format(query_result.total_num_hits))
-
         # Update measured values in new dataset
-        dataset_y_values = []
-        for hit in query_result.hits:
-            # Assume last prop is output if following this script
-            dataset_y_values.append(
-                float(hit.system.properties[-1].scalars[0].value)
-            )
-
-        if target[1] == "Min":
-            best_sl_measured_vals.append(min(dataset_y_values))
+        if verify_measured:
+            best_measured = _best_measured(_iter_dataset_hits(client, dataset_id), target)
         else:
-            best_sl_measured_vals.append(max(dataset_y_values))
+            best_measured = _best_value([best_measured] + new_y_vals, target)
+        best_sl_measured_vals.append(best_measured)
+        if print_output:
+            print("SL iter #{}, best measured value = {}".format(i+1, best_measured))
 
         # Retrain model w/ wait times
         client.models.retrain(view_id)
@@ -274,43 +443,92 @@ def run_sequential_learning(client, view_id, dataset_id,
     return (best_sl_pred_vals, best_sl_measured_vals)
 
 
-def _wait_on_ingest(client, dataset_id, wait_time, print_output = True):
+def _design_candidates(design_results, score_type):
+    # MEI exploits the best predicted materials, MLI explores the next experiments
+    if score_type == "MEI":
+        return design_results.best_materials
+    return design_results.next_experiments
+
+
+def _best_predicted(candidates, target):
+    # Compute the best (value, uncertainty) among the candidates
+    means, uncertainties = candidate_predictions(candidates, target[0])
+    best = np.argmin(means) if target[1] == "Min" else np.argmax(means)
+    return (float(means[best]), float(uncertainties[best]))
+
+
+@instrumented("screen_candidates")
+def _screen_candidates(candidates, target, best_measured, acquisition, batch_size):
+    means, uncertainties = candidate_predictions(candidates, target[0])
+    scores = acquisition_scores(means, uncertainties, best_measured, target[1], acquisition)
+    return [candidates[i] for i in top_k(scores, batch_size or len(candidates))]
+
+
+def _candidate_inputs(candidates, input_properties):
+    return [
+        np.array([float(material["descriptor_values"][x]) for x in input_properties])
+        for material in candidates
+    ]
+
+
+def _dataset_query(dataset_id, size=9999, from_index=None):
+    return PifSystemReturningQuery(size=size, from_index=from_index,
+                query=DataQuery(
+                dataset=DatasetQuery(
+                    id=Filter(equal=str(dataset_id))
+            )))
+
+
+def _iter_dataset_hits(client, dataset_id, page_size=1000):
+    # Page through the dataset so no single response holds every record
+    from_index = 0
+    while True:
+        query_result = client.search.pif_search(_dataset_query(dataset_id, page_size, from_index))
+        for hit in query_result.hits:
+            yield hit
+        from_index += len(query_result.hits)
+        if not query_result.hits or from_index >= query_result.total_num_hits:
+            return
+
+
+def _best_value(values, target):
+    # NaN values (e.g. the best of a dataset without numeric outputs) are skipped; NaN if nothing else is left
+    values = np.asarray(values, dtype=np.float64)
+    if not np.any(~np.isnan(values)):
+        return float("nan")
+    return float(np.nanmin(values) if target[1] == "Min" else np.nanmax(values))
+
+
+@instrumented("best_measured")
+def _best_measured(hits, target):
+    # Assume last prop is output if following this script; records without it are skipped
+    return _best_value(property_column(hits, -1), target)
+
+
+# The waits sleep one wait_time before the first check: right after an upload or a retrain, the server can still
+# report the previous ingest as "Finished" or the previous model as ready.
+
+@instrumented()
+def _wait_on_ingest(client, dataset_id, wait_time, print_output = True, timeout = None):
     # Wait for ingest to finish
-    sleep(wait_time)
-    while (client.data.get_ingest_status(dataset_id) != "Finished"):
-        if print_output:
-            print("Waiting for data ingest to complete...")
-        sleep(wait_time)
-
-
-def _wait_on_data_view(client, dataset_id, view_id, wait_time, print_output = True):
-    is_view_ready = False
-    sleep(wait_time)
-    while (not is_view_ready):
-        sleep(wait_time)
-        design_status = client.data_views.get_data_view_service_status(view_id)
-        if (design_status.experimental_design.ready and
-        design_status.predict.event.normalized_progress == 1.0):
-            is_view_ready = True
-            if print_output:
-                print("Design ready")
-        else:
-            print("Waiting for design services...")
+    client = instrument_client(client)
+    poll(lambda: ingest_finished(client, dataset_id, print_output), wait_time, timeout,
+         "ingest of dataset {}".format(dataset_id), initial_delay=wait_time)
 
 
-def _wait_on_design_run(client, design_id, view_id, wait_time, print_output = True):
-    design_processing = True
-    sleep(wait_time)
-    while design_processing:
-        status = client.models.get_design_run_status(view_id, design_id).status
-        if print_output:
-            print("Design run status: {}".format(status))
+@instrumented()
+def _wait_on_data_view(client, dataset_id, view_id, wait_time, print_output = True, timeout = None):
+    client = instrument_client(client)
+    poll(lambda: data_view_ready(client, view_id, print_output), wait_time, timeout,
+         "data view {}".format(view_id), initial_delay=wait_time)
+
+
+@instrumented()
+def _wait_on_design_run(client, design_id, view_id, wait_time, print_output = True, timeout = None):
+    client = instrument_client(client)
+    poll(lambda: design_run_finished(client, view_id, design_id, print_output), wait_time, timeout,
+         "design run {}".format(design_id), initial_delay=wait_time)
 
-        if status != "Finished":
-            sleep(wait_time)
-        else:
-            design_processing = False
-            
 
 def plot_sl_results(measured, predicted, init_best):
 #     plt.rcParams.update({'figure.figsize':(8, 6), 'font.size':18})
@@ -0,0 +1,187 @@
+'''
+Runs many independent sequential learning campaigns at once on one event loop.
+Each campaign follows the same steps as `run_sequential_learning` in sequential_learning_wrappers.py, but every blocking step is awaited,
+so one campaign's local work (evaluating the true function, writing PIFs) overlaps with the other campaigns' remote waits.
+All client calls, including status polls, share a global concurrency limit.
+
+From a notebook cell, which already runs an event loop:
+
+    results = await run_campaigns(client, [dict(view_id=..., dataset_id=..., ...), ...])
+
+and from a script:
+
+    results = asyncio.run(run_campaigns(client, campaigns))
+'''
+
+import asyncio
+import os
+import shutil
+import tempfile
+from functools import partial
+
+from citrination_client.models.design import Target
+
+from async_waiters import wait_on_data_view, wait_on_design_run, wait_on_ingest
+from sequential_learning_wrappers import (_best_measured, _best_predicted, _best_value,
+                                          _candidate_inputs, _design_candidates,
+                                          _iter_dataset_hits, _screen_candidates,
+                                          upload_data_and_get_id,
+                                          write_dataset_from_func)
+
+
+async def run_campaign(client, view_id, dataset_id,
+                       num_candidates_per_iter,
+                       design_effort,
+                       num_sl_iterations, input_properties,
+                       target, true_function,
+                       score_type, wait_time=2,
+                       print_output=False, limit=None,
+                       timeout=None, verify_measured=False,
+                       acquisition=None, batch_size=None):
+    '''Runs SL design for one campaign; the coroutine form of run_sequential_learning
+
+    :param client: Client object
+    :type client: CitrinationClient
+    :param view_id: View ID
+    :type view_id: int
+    :param dataset_id: Dataset ID
+    :type dataset_id: int
+    :param num_candidates_per_iter: Candidates in a batch
+    :type num_candidates_per_iter: int
+    :param design_effort: Effort from 1-30
+    :type design_effort: int
+    :param num_sl_iterations: SL iterations to run
+    :type num_sl_iterations: int
+    :param input_properties: Inputs
+    :type input_properties: List[str]
+    :param target: ("Output property", {"Min", "Max"})
+    :type target: List[str]
+    :param true_function: Actual function for evaluating measured/true values
+    :type true_function: Callable[[np.ndarray], float]
+    :param score_type: MLI or MEI
+    :type score_type: str
+    :param wait_time: First wait in seconds between status polls
+    :type wait_time: int
+    :param print_output: Whether or not to print outputs
+    :type print_output: bool
+    :param limit: Semaphore bounding concurrent API calls, defaults to no bound
+    :type limit: asyncio.Semaphore
+    :param timeout: Time limit in seconds for each wait, defaults to no limit
+    :type timeout: float
+    :param verify_measured: Whether to re-read the best measured value from the
+        whole dataset after each upload instead of tracking it locally
+    :type verify_measured: bool
+    :param acquisition: Rescore the design run candidates locally with this method of
+        acquisition.acquisition_scores and keep only the best batch_size, defaults to None
+    :type acquisition: str
+    :param batch_size: Candidates kept per iteration when acquisition is set
+    :type batch_size: int
+    :return: 2-tuple: list of predicted scores/uncertainties; list of measured scores/uncertainties
+    :rtype: Tuple[List[float], List[float]]
+    '''
+
+    loop = asyncio.get_event_loop()
+    waits = dict(interval=wait_time, timeout=timeout, print_output=print_output, limit=limit)
+
+    async def api(func, *args, **kwargs):
+        if limit is None:
+            return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+        async with limit:
+            return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+    def log(message):
+        if print_output:
+            print("[view {}] {}".format(view_id, message))
+
+    def best_in_dataset():
+        return _best_measured(_iter_dataset_hits(client, dataset_id), target)
+
+    best_sl_pred_vals = []
+    best_sl_measured_vals = []
+
+    await wait_on_ingest(client, dataset_id, **waits)
+    best_measured = await api(best_in_dataset)
+
+    for i in range(num_sl_iterations):
+        log("starting SL iteration #{}".format(i+1))
+
+        await wait_on_ingest(client, dataset_id, **waits)
+        await wait_on_data_view(client, view_id, **waits)
+
+        design_run = await api(client.models.submit_design_run,
+                               data_view_id=view_id,
+                               num_candidates=num_candidates_per_iter,
+                               effort=design_effort,
+                               target=Target(*target),
+                               constraints=[],
+                               sampler="Default")
+        design_id = design_run.uuid
+        log("created design run with ID {}".format(design_id))
+
+        await wait_on_design_run(client, view_id, design_id, **waits)
+
+        candidates = _design_candidates(
+            await api(client.models.get_design_run_results, view_id, design_id), score_type)
+        best_value_w_uncertainty = _best_predicted(candidates, target)
+        best_sl_pred_vals.append(best_value_w_uncertainty)
+        log("SL iter #{}, best predicted (value, uncertainty) = {}".format(i+1, best_value_w_uncertainty))
+
+        # local work runs outside the API limit
+        if acquisition is not None:
+            candidates = _screen_candidates(candidates, target, best_measured, acquisition, batch_size)
+        new_x_vals = _candidate_inputs(candidates, input_properties)
+        # campaigns run in one process, so each writes its designs to a temporary directory of its own
+        temp_dir = tempfile.mkdtemp(prefix="sl_design_")
+        try:
+            temp_dataset_fpath = os.path.join(temp_dir, "design-{}.json".format(design_id))
+            new_y_vals = await loop.run_in_executor(
+                None, write_dataset_from_func, true_function, temp_dataset_fpath, new_x_vals)
+
+            await api(upload_data_and_get_id, client, "", temp_dataset_fpath,
+                      given_dataset_id=dataset_id, relative_to=temp_dir)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        await wait_on_ingest(client, dataset_id, **waits)
+        log("dataset updated: {} candidates added".format(len(new_x_vals)))
+
+        if verify_measured:
+            best_measured = await api(best_in_dataset)
+        else:
+            best_measured = _best_value([best_measured] + new_y_vals, target)
+        best_sl_measured_vals.append(best_measured)
+
+        await api(client.models.retrain, view_id)
+        await wait_on_data_view(client, view_id, **waits)
+
+    log("SL finished")
+    return (best_sl_pred_vals, best_sl_measured_vals)
+
+
+async def run_campaigns(client, campaigns, max_concurrent_calls=8, wait_time=2,
+                        print_output=False, timeout=None):
+    '''Runs many SL campaigns concurrently
+
+    :param client: Client object, shared by all campaigns
+    :type client: CitrinationClient
+    :param campaigns: Keyword arguments of run_campaign for each campaign
+        (view_id, dataset_id, num_candidates_per_iter, design_effort, num_sl_iterations,
+        input_properties, target, true_function, score_type)
+    :type campaigns: List[dict]
+    :param max_concurrent_calls: Global limit on in-flight API calls
+    :type max_concurrent_calls: int
+    :param wait_time: First wait in seconds between status polls
+    :type wait_time: int
+    :param print_output: Whether or not to print outputs
+    :type print_output: bool
+    :param timeout: Time limit in seconds for each wait, defaults to no limit
+    :type timeout: float
+    :return: Result of run_campaign for each campaign, in order; a campaign that
+        failed returns its exception instead, so it does not stop the others
+    :rtype: List[Union[Tuple[List[float], List[float]], Exception]]
+    '''
+
+    limit = asyncio.Semaphore(max_concurrent_calls)
+    settings = dict(wait_time=wait_time, print_output=print_output, limit=limit, timeout=timeout)
+    return await asyncio.gather(
+        *[run_campaign(client, **dict(settings, **campaign)) for campaign in campaigns],
+        return_exceptions=True)
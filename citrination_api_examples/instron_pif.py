@@ -0,0 +1,192 @@
+'''
+Converts Instron/MTS exports to PIFs, as in ImportInstron.ipynb, optionally moving the curves out of the PIF.
+With sidecar set, the displacement, force, strain and stress series go to a binary file next to the PIF, either a
+NumPy .npy with one named field per curve or, with pyarrow installed, a Parquet file. The PIF references that file
+through a FileReference and keeps the elastic modulus, the critical stress and, optionally, a preview of each curve
+decimated with lttb_indices. Upload the sidecar next to the PIF so the relative path resolves.
+
+    system = instron_to_pif("RT-loadtofail_10e-3.txt", "Sample", sidecar="sample_curves.npy", preview_points=200)
+    curves = pif_curves(system)  # memory-mapped arrays keyed on column name
+'''
+
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+from pypif.obj import ChemicalSystem, FileReference, Property, Value
+
+from thermo_mechanical_analysis import Thermo, lttb_indices
+
+COLUMNS = ("displacement", "force", "strain", "stress")
+MIME_TYPES = {".npy": "application/x-npy", ".parquet": "application/x-parquet"}
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_curves(path, curves, dtype=np.float64):
+    '''Writes equal-length curves to a .npy or .parquet file
+
+    :param path: Output file, its extension picks the format
+    :type path: str
+    :param curves: Column name to array
+    :type curves: OrderedDict
+    :param dtype: Floating point type of the stored values, e.g. np.float32 to halve the size
+    :type dtype: np.dtype
+    :return: Path of the written file
+    :rtype: str
+    '''
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        length = len(next(iter(curves.values()))) if curves else 0
+        table = np.empty(length, dtype=[(name, dtype) for name in curves])
+        for name, values in curves.items():
+            table[name] = values
+        np.save(path, table)
+    elif extension == ".parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Writing Parquet needs pyarrow, e.g. pip install pyarrow")
+        pq.write_table(pa.Table.from_arrays([pa.array(np.asarray(values, dtype=dtype)) for values in curves.values()],
+                                            names=list(curves)), path)
+    else:
+        raise ValueError("Unsupported curve file {}, use one of {}".format(path, sorted(MIME_TYPES)))
+    return path
+
+
+def load_curves(path, mmap=True, sha256=None):
+    '''Reads the curves of a .npy or .parquet file written by write_curves
+
+    :param path: Curve file
+    :type path: str
+    :param mmap: Memory-map the file instead of reading it, so only the pages used are loaded
+    :type mmap: bool
+    :param sha256: Expected SHA-256 of the file, checked when given
+    :type sha256: str
+    :return: Column name to array
+    :rtype: OrderedDict
+    :raises ValueError: if the checksum does not match
+    '''
+
+    if sha256 is not None and file_sha256(path) != sha256:
+        raise ValueError("Checksum of {} does not match its FileReference".format(path))
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        table = np.load(path, mmap_mode="r" if mmap else None)
+        return OrderedDict((name, table[name]) for name in table.dtype.names)
+    if extension == ".parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, memory_map=mmap)
+        return OrderedDict((name, table.column(name).to_numpy()) for name in table.column_names)
+    raise ValueError("Unsupported curve file {}, use one of {}".format(path, sorted(MIME_TYPES)))
+
+
+def curve_reference(path, rows, dtype=np.float64):
+    '''FileReference to a curve file, relative to the directory of the PIF it goes into'''
+
+    sha256 = file_sha256(path)
+    # pypif's FileReference constructor drops sha256, also when loading a PIF, so it is repeated in the tags
+    reference = FileReference(relative_path=os.path.basename(path),
+                              mime_type=MIME_TYPES[os.path.splitext(path)[1].lower()],
+                              tags=["rows={}".format(rows), "dtype={}".format(np.dtype(dtype).name),
+                                    "sha256={}".format(sha256)])
+    reference.sha256 = sha256
+    return reference
+
+
+def reference_sha256(reference):
+    '''SHA-256 of a FileReference from curve_reference, None if it has none'''
+
+    if reference.sha256:
+        return reference.sha256
+    for tag in reference.tags or []:
+        if str(tag).startswith("sha256="):
+            return str(tag)[len("sha256="):]
+    return None
+
+
+def _curve_property(name, units, values, condition, condition_units, conditions, preview, files):
+    # the full series inline, or only the preview points (if any) with a reference to the sidecar
+    if files is None:
+        return Property(name=name, units=units, scalars=values.tolist(),
+                        conditions=Value(name=condition, units=condition_units, scalars=conditions.tolist()))
+    if preview is None:
+        return Property(name=name, units=units, files=files)
+    return Property(name=name, units=units, files=files, scalars=values[preview].tolist(),
+                    conditions=Value(name=condition, units=condition_units, scalars=conditions[preview].tolist()))
+
+
+def instron_to_pif(instron_file, material_name, sidecar=None, dtype=np.float64, preview_points=None):
+    '''PIF of one Instron/MTS export with its elastic modulus, critical stress and curves
+
+    :param instron_file: Raw data file
+    :type instron_file: str
+    :param material_name: Name of the ChemicalSystem
+    :type material_name: str
+    :param sidecar: Write the curves to this .npy or .parquet file instead of into the PIF, defaults to inline
+    :type sidecar: str
+    :param dtype: Floating point type of the sidecar values
+    :type dtype: np.dtype
+    :param preview_points: With a sidecar, also keep this many points of each curve in the PIF, decimated
+        with lttb_indices, defaults to none
+    :type preview_points: int
+    :rtype: ChemicalSystem
+    '''
+
+    instron = Thermo(instron_file)
+    instron.extract_data()
+    instron.calc_elastic_modulus()
+    system = ChemicalSystem(name=material_name)
+
+    elastic_modulus = Property(name="Elastic Modulus", units="MPa", scalars=instron.elastic_modulus)
+    critical_stress = Property(name="Critical Stress", units="MPa", scalars=instron.critical_stress)
+    files = stress_preview = force_preview = None
+    if sidecar is not None:
+        curves = OrderedDict((name, getattr(instron, name)) for name in COLUMNS)
+        files = [curve_reference(write_curves(sidecar, curves, dtype), len(instron.stress), dtype)]
+        if preview_points:
+            stress_preview = lttb_indices(instron.strain, instron.stress, preview_points)
+            force_preview = lttb_indices(instron.displacement, instron.force, preview_points)
+
+    stress_strain = _curve_property("Stress", "MPa", instron.stress, "Strain", "mm/mm", instron.strain,
+                                    stress_preview, files)
+    force_displacement = _curve_property("Force", "N", instron.force, "Displacement", "mm", instron.displacement,
+                                         force_preview, files)
+    system.properties = [elastic_modulus, critical_stress, stress_strain, force_displacement]
+    return system
+
+
+def pif_curves(system, base_dir=".", mmap=True, verify=False):
+    '''Loads the curve sidecars referenced by the properties of a PIF system
+
+    :param system: System from instron_to_pif or pif.load
+    :type system: System
+    :param base_dir: Directory the relative paths of the references start from, i.e. that of the PIF file
+    :type base_dir: str
+    :param mmap: See load_curves
+    :type mmap: bool
+    :param verify: Check each file against the SHA-256 of its reference
+    :type verify: bool
+    :return: Column name to array, merged over the referenced files
+    :rtype: OrderedDict
+    '''
+
+    curves = OrderedDict()
+    loaded = set()
+    for prop in system.properties or []:
+        for reference in prop.files or []:
+            path = os.path.join(base_dir, reference.relative_path)
+            if reference.mime_type not in MIME_TYPES.values() or path in loaded:
+                continue
+            loaded.add(path)
+            curves.update(load_curves(path, mmap, reference_sha256(reference) if verify else None))
+    return curves
@@ -0,0 +1,119 @@
+'''
+Neighbor lookups over a t-SNE projection from Citrination, as used in TsneDemo.ipynb.
+The index is built once per `tsne.get_projection(...)`: a k-d tree over the 2D coordinates answers k-nearest-neighbor
+and radius queries in O(log n), and a uid to row map replaces the linear `uids.index` scan.
+Every query accepts a whole array of points or rows, so thousands of lookups go through the tree in one call.
+'''
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class ProjectionIndex(object):
+    '''Spatial and uid index over the points of one t-SNE projection
+
+    :param projection: Projection from tsne.get_projection
+    :type projection: Projection
+    :param leafsize: Leaf size of the k-d tree
+    :type leafsize: int
+    '''
+
+    def __init__(self, projection, leafsize=16):
+        self.coordinates = np.column_stack([np.asarray(projection.xs, dtype=np.float64),
+                                            np.asarray(projection.ys, dtype=np.float64)])
+        self.responses = np.asarray(projection.responses, dtype=np.float64)
+        self.tags = list(projection.tags)
+        self.uids = list(projection.uids)
+        # the first occurrence wins, matching list.index
+        self.rows = {}
+        for row, uid in enumerate(self.uids):
+            self.rows.setdefault(uid, row)
+        self.tree = cKDTree(self.coordinates, leafsize=leafsize)
+
+    def __len__(self):
+        return len(self.uids)
+
+    def row_of(self, uid):
+        '''Row of a record uid
+
+        :param uid: Record uid, dataset_id/version/pif_id
+        :type uid: str
+        :return: Row into the projection arrays
+        :rtype: int
+        :raises KeyError: if the uid is not in the projection
+        '''
+
+        return self.rows[uid]
+
+    def rows_of(self, uids):
+        '''Rows of many record uids, -1 for uids not in the projection
+
+        :param uids: Record uids
+        :type uids: Iterable[str]
+        :return: Rows into the projection arrays
+        :rtype: np.ndarray
+        '''
+
+        return np.array([self.rows.get(uid, -1) for uid in uids], dtype=np.intp)
+
+    def nearest(self, points, k=10):
+        '''k nearest projected materials to arbitrary points
+
+        :param points: One (x, y) point or an (n, 2) array of points
+        :type points: np.ndarray
+        :param k: Neighbors per point
+        :type k: int
+        :return: 2-tuple: distances; rows, nearest first, shaped (k,) or (n, k)
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        '''
+
+        points = np.asarray(points, dtype=np.float64)
+        k = min(k, len(self))
+        distances, rows = self.tree.query(points.reshape(-1, 2), k=k)
+        distances = distances.reshape(-1, k)
+        rows = rows.reshape(-1, k)
+        if points.ndim == 1:
+            return distances[0], rows[0]
+        return distances, rows
+
+    def most_similar(self, rows, n_materials=10):
+        '''n nearest other materials to materials of the projection
+
+        :param rows: One row or an array of rows, e.g. from rows_of
+        :type rows: Union[int, np.ndarray]
+        :param n_materials: Neighbors per material, not counting the material itself
+        :type n_materials: int
+        :return: Rows of the neighbors, nearest first, shaped (n_materials,) or (n, n_materials)
+        :rtype: np.ndarray
+        '''
+
+        rows = np.asarray(rows, dtype=np.intp)
+        n_materials = min(n_materials, len(self) - 1)
+        _, neighbors = self.nearest(self.coordinates[rows.reshape(-1)], k=n_materials + 1)
+        neighbors = neighbors.reshape(-1, n_materials + 1)
+        # drop the material itself; with duplicate coordinates it need not come first
+        is_self = neighbors == rows.reshape(-1, 1)
+        is_self[~is_self.any(axis=1), -1] = True
+        is_self[np.cumsum(is_self, axis=1) > 1] = False
+        similar = neighbors[~is_self].reshape(-1, n_materials)
+        if rows.ndim == 0:
+            return similar[0]
+        return similar
+
+    def within(self, points, radius):
+        '''Projected materials within a distance of arbitrary points
+
+        :param points: One (x, y) point or an (n, 2) array of points
+        :type points: np.ndarray
+        :param radius: Distance in t-SNE coordinates
+        :type radius: float
+        :return: Rows within radius, one array per point for an array of points
+        :rtype: Union[np.ndarray, List[np.ndarray]]
+        '''
+
+        points = np.asarray(points, dtype=np.float64)
+        found = self.tree.query_ball_point(points.reshape(-1, 2), radius)
+        found = [np.array(sorted(rows), dtype=np.intp) for rows in found]
+        if points.ndim == 1:
+            return found[0]
+        return found
@@ -0,0 +1,216 @@
+'''
+Persistent local cache of `pif_search` results, as used in ExperimentalDesign.ipynb.
+Results are stored zlib-compressed in SQLite, keyed on a hash of the serialized query, so re-running an analysis on an
+unchanged dataset does not touch the network. Each entry remembers the version of every dataset it depends on and is
+discarded once a newer version is seen; uploads through `upload_data_and_get_id` invalidate the uploaded dataset.
+Updates made elsewhere are only seen in the hits of new searches, so results also expire after max_age (an hour by
+default). The cache is bounded in bytes and evicts the least recently used results first.
+
+Put it in front of an existing client with:
+
+    client.search = CachedSearchClient(client.search, SearchCache("searches.sqlite"))
+'''
+
+import hashlib
+import json
+import sqlite3
+import zlib
+from time import time
+
+from citrination_client.search.pif.result.pif_search_result import PifSearchResult
+from pypif.util.case import keys_to_snake_case
+
+
+class SearchCache(object):
+    '''On-disk store of search results, backed by SQLite
+
+    :param path: SQLite file, created if missing
+    :type path: str
+    :param max_bytes: Compressed size of all results kept; least recently used results are evicted beyond this
+    :type max_bytes: int
+    :param max_age: Seconds after which a result expires, None for never; bounds how long changes to a dataset by
+        other users go unnoticed
+    :type max_age: float
+    '''
+
+    def __init__(self, path, max_bytes=256 * 1024 ** 2, max_age=3600):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS searches "
+                             "(key TEXT PRIMARY KEY, versions TEXT NOT NULL, result BLOB NOT NULL, "
+                             "size INTEGER NOT NULL, created REAL NOT NULL, used REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS searches_used ON searches (used)")
+            # generation counts local invalidations, which the server version does not reflect
+            self._db.execute("CREATE TABLE IF NOT EXISTS dataset_versions "
+                             "(dataset TEXT PRIMARY KEY, version TEXT, generation INTEGER NOT NULL)")
+
+    def get(self, key):
+        '''Serialized result stored under key, None if missing, expired or stale
+
+        :param key: Key from query_key
+        :type key: str
+        :rtype: dict
+        '''
+
+        row = self._db.execute("SELECT versions, result, created FROM searches WHERE key = ?",
+                               (key,)).fetchone()
+        if row is None:
+            return None
+        versions, result, created = row
+        if ((self.max_age is not None and time() - created > self.max_age) or
+                any(self.dataset_version(dataset) != version
+                    for dataset, version in json.loads(versions).items())):
+            with self._db:
+                self._db.execute("DELETE FROM searches WHERE key = ?", (key,))
+            return None
+        with self._db:
+            self._db.execute("UPDATE searches SET used = ? WHERE key = ?", (time(), key))
+        return json.loads(zlib.decompress(result).decode("utf-8"))
+
+    def put(self, key, result, datasets=()):
+        '''Stores a serialized result and evicts results over max_bytes
+
+        :param key: Key from query_key
+        :type key: str
+        :param result: Serialized search result
+        :type result: dict
+        :param datasets: Datasets the result depends on besides those of its hits
+        :type datasets: Iterable[str]
+        '''
+
+        # newer versions seen in the hits invalidate older entries
+        for hit in result.get("hits") or ():
+            if hit.get("dataset") is not None and hit.get("datasetVersion") is not None:
+                self.set_dataset_version(hit["dataset"], hit["datasetVersion"])
+        datasets = set(str(d) for d in datasets)
+        datasets.update(str(hit["dataset"]) for hit in result.get("hits") or () if hit.get("dataset") is not None)
+        versions = {dataset: self.dataset_version(dataset) for dataset in datasets}
+
+        blob = zlib.compress(json.dumps(result, separators=(",", ":")).encode("utf-8"))
+        now = time()
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, json.dumps(versions), blob, len(blob), now, now))
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM searches").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM searches ORDER BY used").fetchall():
+            self._db.execute("DELETE FROM searches WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                return
+
+    def dataset_version(self, dataset_id):
+        '''Latest known version and local generation of a dataset, "None:0" if never seen'''
+
+        row = self._db.execute("SELECT version, generation FROM dataset_versions WHERE dataset = ?",
+                               (str(dataset_id),)).fetchone()
+        return "{}:{}".format(*(row or (None, 0)))
+
+    def set_dataset_version(self, dataset_id, version):
+        '''Records the current version of a dataset, making results from other versions stale'''
+
+        with self._db:
+            self._db.execute("INSERT OR IGNORE INTO dataset_versions VALUES (?, NULL, 0)", (str(dataset_id),))
+            self._db.execute("UPDATE dataset_versions SET version = ? WHERE dataset = ?",
+                             (str(version), str(dataset_id)))
+
+    def invalidate_dataset(self, dataset_id):
+        '''Makes every result depending on a dataset stale, e.g. after uploading to it'''
+
+        with self._db:
+            self._db.execute("INSERT OR IGNORE INTO dataset_versions VALUES (?, NULL, 0)", (str(dataset_id),))
+            self._db.execute("UPDATE dataset_versions SET generation = generation + 1 WHERE dataset = ?",
+                             (str(dataset_id),))
+
+    def clear(self):
+        with self._db:
+            self._db.execute("DELETE FROM searches")
+            self._db.execute("DELETE FROM dataset_versions")
+
+    def close(self):
+        self._db.close()
+
+
+def query_key(query):
+    '''Hash of a query serialized with sorted keys'''
+
+    if hasattr(query, "as_dictionary"):
+        query = query.as_dictionary()
+    canonical = json.dumps(query, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def query_datasets(query):
+    '''Dataset IDs a serialized query filters on with equal, e.g. DatasetQuery(id=Filter(equal="1160"))
+
+    :param query: Serialized query
+    :type query: dict
+    :rtype: Set[str]
+    '''
+
+    found = set()
+    pending = [query]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(node)
+        elif isinstance(node, dict):
+            for dataset in _as_list(node.get("dataset")):
+                if isinstance(dataset, dict):
+                    for id_filter in _as_list(dataset.get("id")):
+                        if isinstance(id_filter, dict) and id_filter.get("equal") is not None:
+                            found.add(str(id_filter["equal"]))
+            pending.extend(node.values())
+    return found
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class CachedSearchClient(object):
+    '''Search client that answers pif_search from a SearchCache; other calls go to the wrapped client
+
+    :param search_client: Client to forward cache misses to, e.g. client.search
+    :type search_client: SearchClient
+    :param cache: Cache to read from and write to
+    :type cache: SearchCache
+    '''
+
+    def __init__(self, search_client, cache):
+        self.search_client = search_client
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        return getattr(self.search_client, name)
+
+    def pif_search(self, pif_system_returning_query):
+        '''pif_search of the wrapped client, served from the cache when possible
+
+        :param pif_system_returning_query: The query to execute
+        :type pif_system_returning_query: PifSystemReturningQuery
+        :return: Search result
+        :rtype: PifSearchResult
+        '''
+
+        serialized = pif_system_returning_query.as_dictionary()
+        key = query_key(serialized)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            # stored in the camelCase of as_dictionary, rebuilt the way SearchClient parses responses
+            return PifSearchResult(**keys_to_snake_case(cached))
+        self.misses += 1
+        result = self.search_client.pif_search(pif_system_returning_query)
+        self.cache.put(key, result.as_dictionary(), query_datasets(serialized))
+        return result
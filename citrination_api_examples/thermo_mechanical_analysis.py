@@ -1,10 +1,38 @@
 from __future__ import print_function
-import re, os, sys, argparse
+import os, re, sys, argparse, csv, gzip, io, warnings
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from timeit import default_timer
 import numpy as np
 from scipy import stats
 from math import *
-#import plotly.plotly as py
-#import plotly.graph_objs as go
+try:
+    from functools import lru_cache
+except ImportError:  # Python 2
+    from collections import OrderedDict
+
+    def lru_cache(maxsize=128):
+        """ minimal stand-in for functools.lru_cache on hashable positional args,
+            dropping the least recently used entry once maxsize are held """
+        def decorator(func):
+            cache = OrderedDict()
+
+            def wrapper(*args):
+                try:
+                    # re-inserted below, which moves it to the recent end
+                    result = cache.pop(args)
+                except KeyError:
+                    result = func(*args)
+                    if len(cache) >= maxsize:
+                        cache.popitem(last=False)
+                cache[args] = result
+                return result
+            return wrapper
+        return decorator
+try:
+    from html import escape
+except ImportError:  # Python 2
+    from cgi import escape
 __author__ = 'saurabh'
 
 
@@ -22,8 +50,17 @@ def get_options():
                         dest="out_dir", default=os.getcwd())
     parser.add_argument("-gzip", help="gzip the output",
                         dest="gzip_bool",action="store_true")
-    parser.add_argument("-ho", help="HTML out file path",
+    parser.add_argument("-ho", help="HTML out file path, one combined report in directory mode",
                         dest="html_file_path_out", default=None)
+    parser.add_argument("-p", "--plot_points", type=int,
+                        help="most samples drawn per curve in the HTML report",
+                        dest="plot_points", default=1000)
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="number of worker processes for directory mode",
+                        dest="jobs", default=cpu_count())
+    parser.add_argument("-w", "--modulus_window", type=int,
+                        help="fit the elastic modulus on the most linear window of this many samples",
+                        dest="modulus_window", default=None)
 
     options = parser.parse_args()
     try: # check that both options are not blank
@@ -36,81 +73,599 @@ def get_options():
     return options
 
 
-def plot_graphs(list1, list2, graph_title, x_title, y_title):
-    """
-        DESCRIPTION: This function plots the plotly graphs and generates the link to the graph
-        INPUTS  : list1 - x axis data
-                  list2 - y axis data
-                  graphTitle - Title of the graph
-                  xAxisTitle - Label for x-axis
-                  yAxisTitie - Label of y-axis
-        OUTPUTS : link to plotly graph
-        DEPENDENCIES: (extract_data()) lists of data for axes
-    """
-    trace = go.Scatter(
-        x=list1,
-        y=list2,
-        name='Trace'
-    )
-    data = [trace]
-
-    layout = go.Layout(
-        title=graph_title,
-        shapes=[
-            dict(
-                type='line',
-                x0=list1[1],
-                y0=list2[1],
-                x1=list1[6],
-                y1=list2[6],
-                opacity=0.7,
-                line=dict(
-                    color='red',
-                    width=2.5
-                ),
-            )],
-        xaxis=dict(
-            title=x_title
-        ),
-        yaxis=dict(
-            title=y_title
-        ), showlegend=True, legend=dict(
-            x=1,
-            y=1
-        )
-    )
-    fig = go.Figure(data=data, layout=layout)
-    return py.plot(fig, filename=graph_title, auto_open=False)
-
-
-def smooth_spline(y, window_size, order, deriv=0, rate=1):
+def savgol_coeffs(window_size, order, deriv=0, rate=1):
     """
-        DESCRIPTION: This function applies the savitzky golay algorithm
-                     for smoothing out the data points of the cycle
-        INPUTS  : y - list of data elements
-                  window_size - size of filter window i.e, coefficients
+        DESCRIPTION: This function returns the savitzky golay filter coefficients
+                     for a window, memoized per (window_size, order, deriv, rate)
+        INPUTS  : window_size - size of filter window i.e, coefficients
                   order - the order of polynomial equation of the fit line
                   deriv - order of the derivative
                   rate: spacing of the samples for which the filtering is applied
-        OUTPUTS : numPy array of filtered points forming the smoother curve
+        OUTPUTS : read-only numPy array of window_size coefficients
     """
-    window_size = np.abs(np.int(window_size))
-    order = np.abs(np.int(order))
+    window_size = abs(int(window_size))
+    order = abs(int(order))
     if window_size % 2 != 1 or window_size < 1:
         raise TypeError("window_size size must be a positive odd number")
     if window_size < order + 2:
         raise TypeError("window_size is too small for the polynomials order")
-    order_range = range(order + 1)
+    return _savgol_coeffs(window_size, order, int(deriv), rate)
+
+
+@lru_cache(maxsize=64)
+def _savgol_coeffs(window_size, order, deriv, rate):
     half_window = (window_size - 1) // 2
-    # precompute coefficients
-    b = np.mat([[k ** i for i in order_range] for k in range(-half_window, half_window + 1)])
-    m = np.linalg.pinv(b).A[deriv] * rate ** deriv * factorial(deriv)
-    # pad the signal at the extremes with
-    # values taken from the signal itself
-    firstvals = y[0] - np.abs(y[1:half_window + 1][::-1] - y[0])
-    lastvals = y[-1] + np.abs(y[-half_window - 1:-1][::-1] - y[-1])
-    y = np.concatenate((firstvals, y, lastvals))
-    return np.convolve(m[::-1], y, mode='valid')
+    b = np.vander(np.arange(-half_window, half_window + 1), order + 1, increasing=True)
+    m = np.linalg.pinv(b)[deriv] * rate ** deriv * factorial(deriv)
+    m.flags.writeable = False
+    return m
+
+
+def _first_pad(y, half_window):
+    """ values mirrored about the first sample, taken from the signal itself """
+    return y[..., :1] - np.abs(y[..., half_window:0:-1] - y[..., :1])
+
+
+def _last_pad(y, half_window):
+    """ values mirrored about the last sample, taken from the signal itself """
+    return y[..., -1:] + np.abs(y[..., -2:-half_window - 2:-1] - y[..., -1:])
+
+
+def _too_short(n, half_window):
+    """ error for a signal with too few samples to mirror half a window at its ends """
+    return ValueError("the signal has {} samples, a window of {} needs more than {}".format(
+        n, 2 * half_window + 1, half_window))
+
+
+def _convolve_valid(kernel, y):
+    """ 'valid' convolution along the last axis, one channel at a time """
+    if y.ndim == 1:
+        return np.convolve(kernel, y, mode='valid')
+    out = np.empty(y.shape[:-1] + (y.shape[-1] - len(kernel) + 1,))
+    for idx in np.ndindex(*y.shape[:-1]):
+        out[idx] = np.convolve(kernel, y[idx], mode='valid')
+    return out
+
+
+def smooth_spline(y, window_size, order, deriv=0, rate=1, axis=-1, chunk_size=None):
+    """
+        DESCRIPTION: This function applies the savitzky golay algorithm
+                     for smoothing out the data points of the cycle
+        INPUTS  : y - list or array of data elements, 2-D arrays hold one
+                      channel per row (see axis)
+                  window_size - size of filter window i.e, coefficients
+                  order - the order of polynomial equation of the fit line
+                  deriv - order of the derivative
+                  rate: spacing of the samples for which the filtering is applied
+                  axis - axis of y running along the samples
+                  chunk_size - filter in blocks of this many samples through
+                               smooth_spline_stream instead of in one pass
+        OUTPUTS : numPy array of filtered points forming the smoother curve
+        RAISES  : ValueError if the signal has no more samples than half the window
+    """
+    kernel = savgol_coeffs(window_size, order, deriv, rate)[::-1]
+    half_window = (len(kernel) - 1) // 2
+    y = np.moveaxis(np.asarray(y, dtype=np.float64), axis, -1)
+    n = y.shape[-1]
+    if n <= half_window:
+        raise _too_short(n, half_window)
+
+    if chunk_size is not None:
+        out = np.empty_like(y)
+        blocks = (y[..., i:i + chunk_size] for i in range(0, n, chunk_size))
+        pos = 0
+        for block in smooth_spline_stream(blocks, window_size, order, deriv, rate):
+            out[..., pos:pos + block.shape[-1]] = block
+            pos += block.shape[-1]
+    elif n <= 2 * half_window:
+        # too short for an interior, pad the whole signal
+        out = _convolve_valid(kernel, np.concatenate(
+            (_first_pad(y, half_window), y, _last_pad(y, half_window)), axis=-1))
+    else:
+        # filter the interior in place and only pad the two edge windows
+        out = np.empty_like(y)
+        out[..., half_window:n - half_window] = _convolve_valid(kernel, y)
+        out[..., :half_window] = _convolve_valid(kernel, np.concatenate(
+            (_first_pad(y, half_window), y[..., :2 * half_window]), axis=-1))
+        out[..., n - half_window:] = _convolve_valid(kernel, np.concatenate(
+            (y[..., n - 2 * half_window:], _last_pad(y, half_window)), axis=-1))
+    return np.moveaxis(out, -1, axis)
+
+
+def smooth_spline_stream(chunks, window_size, order, deriv=0, rate=1):
+    """
+        DESCRIPTION: This function applies the savitzky golay algorithm to a
+                     signal delivered in consecutive chunks, holding only the
+                     current chunk and 2 * half window samples of context
+        INPUTS  : chunks - iterable of arrays, samples along the last axis
+                  window_size - size of filter window i.e, coefficients
+                  order - the order of polynomial equation of the fit line
+                  deriv - order of the derivative
+                  rate: spacing of the samples for which the filtering is applied
+        OUTPUTS : generator of filtered blocks which concatenate to the output
+                  of smooth_spline on the whole signal
+        RAISES  : ValueError if the signal has no more samples than half the window
+    """
+    kernel = savgol_coeffs(window_size, order, deriv, rate)[::-1]
+    half_window = (len(kernel) - 1) // 2
+    pending = None
+    started = False
+    for chunk in chunks:
+        chunk = np.asarray(chunk, dtype=np.float64)
+        pending = chunk if pending is None else np.concatenate((pending, chunk), axis=-1)
+        if not started:
+            # the leading pad needs the first half_window + 1 samples
+            if pending.shape[-1] <= half_window:
+                continue
+            pending = np.concatenate((_first_pad(pending, half_window), pending), axis=-1)
+            started = True
+        if pending.shape[-1] > 2 * half_window:
+            yield _convolve_valid(kernel, pending)
+            pending = pending[..., -2 * half_window:]
+
+    if not started:
+        # the leading pad never got its samples
+        raise _too_short(0 if pending is None else pending.shape[-1], half_window)
+    yield _convolve_valid(kernel, np.concatenate(
+        (pending, _last_pad(pending, half_window)), axis=-1))
+
+
+def _find_data_offset(f):
+    """
+        DESCRIPTION: This function skips the header block of an Instron/MTS export
+                     (title, acquisition info, column names and units lines)
+        INPUTS  : f - file object opened in binary mode
+        OUTPUTS : byte offset of the first numeric row
+    """
+    offset = 0
+    for line in iter(f.readline, b''):
+        fields = line.split()
+        try:
+            if len(fields) >= 4:
+                [float(x) for x in fields[:4]]
+                return offset
+        except ValueError:
+            pass
+        offset += len(line)
+    return offset
+
+
+def _split_fields(buf):
+    """
+        DESCRIPTION: This function locates the non-blank lines of the numeric body
+                     and the whitespace separated fields on each of them
+        INPUTS  : buf - uint8 array of the numeric body of the file
+        OUTPUTS : 4-tuple: offset of each non-blank line; number of fields on it;
+                  offsets of all fields; index of the first field of each line
+                  among those
+    """
+    if not len(buf):
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty, empty, empty
+    # bytes up to the space are separators: space, tab, CR, LF and other control characters
+    space = buf <= ord(' ')
+    field_starts = np.flatnonzero(~space & np.concatenate(([True], space[:-1])))
+    newlines = np.flatnonzero(buf == ord('\n'))
+    line_starts = np.concatenate(([0], newlines + 1))
+    line_ends = np.concatenate((newlines, [len(buf)]))
+    first = np.searchsorted(field_starts, line_starts)
+    counts = np.searchsorted(field_starts, line_ends) - first
+    filled = counts > 0
+    return line_starts[filled], counts[filled], field_starts, first[filled]
+
+
+def _decimal_row_mask(buf, line_starts, field_starts, first):
+    """
+        DESCRIPTION: This function flags the rows whose first three columns are all
+                     written as plain decimals, i.e. the rows the original regex
+                     parser accepted. Rows with exponent notation were skipped.
+        INPUTS  : buf - uint8 array of the numeric body of the file
+                  line_starts, field_starts, first - see _split_fields, for rows
+                  of at least four fields
+        OUTPUTS : boolean numPy array with one entry per row
+    """
+    # the first three columns end where the fourth one starts
+    field_ends = field_starts[first + 3]
+
+    def count_in_fields(positions):
+        return np.searchsorted(positions, field_ends) - np.searchsorted(positions, line_starts)
+
+    exponents = np.flatnonzero((buf == ord('e')) | (buf == ord('E')))
+    dots = np.flatnonzero(buf == ord('.'))
+    return (count_in_fields(exponents) == 0) & (count_in_fields(dots) == 3)
+
+
+def _line_text(body, line_start):
+    end = body.find(b'\n', line_start)
+    return body[line_start:end if end != -1 else len(body)]
+
+
+def _line_error(file_path, offset, body, line_start, message):
+    # line numbers count the header lines skipped by _find_data_offset as well
+    with open(file_path, 'rb') as f:
+        header_lines = f.read(offset).count(b'\n')
+    number = header_lines + body.count(b'\n', 0, line_start) + 1
+    text = _line_text(body, line_start).decode('ascii', 'replace').strip()
+    return ValueError("{}, line {}: {}: '{}'".format(file_path, number, message, text))
+
+
+def load_curve(file_path, all_rows=False):
+    """
+        DESCRIPTION: This function parses the displacement, force, strain and time
+                     columns of an Instron/MTS text export with a C-level reader
+        INPUTS  : file_path - path of the raw data file
+                  all_rows - keep rows written in exponent notation as well
+        OUTPUTS : contiguous float64 numPy array with the columns displacement,
+                  force, strain, time and stress (force over the 3 mm^2 section)
+        RAISES  : ValueError naming the line, if a row has fewer than four fields,
+                  another number of fields than the first row, or a field that is
+                  not a number
+    """
+    with open(file_path, 'rb') as f:
+        offset = _find_data_offset(f)
+        f.seek(offset)
+        body = f.read()
+
+    buf = np.frombuffer(body, dtype=np.uint8)
+    line_starts, counts, field_starts, first = _split_fields(buf)
+    n_cols = max(4, counts[0]) if len(counts) else 4
+    # every row must have the columns of the first one, or the values of the
+    # following rows would shift into the wrong columns
+    bad = np.flatnonzero(counts != n_cols)
+    if len(bad):
+        raise _line_error(file_path, offset, body, line_starts[bad[0]],
+                          "{} fields instead of {}".format(counts[bad[0]], n_cols))
+
+    # the reader stops at the first field that is not a number, with a warning
+    # on older numPy versions and with an error naming no line on newer ones
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        try:
+            values = np.fromstring(body, dtype=np.float64, sep=' ')
+        except ValueError:
+            values = None
+    if values is None or len(values) != len(field_starts):
+        for line_start in line_starts:
+            try:
+                [float(field) for field in _line_text(body, line_start).split()]
+            except ValueError:
+                raise _line_error(file_path, offset, body, line_start, "not a number")
+        raise ValueError("{}: the data could not be read".format(file_path))
+    values = values.reshape(len(line_starts), n_cols)[:, :4]
+    if not all_rows and len(values):
+        values = values[_decimal_row_mask(buf, line_starts, field_starts, first)]
+
+    data = np.empty((len(values), 5))
+    data[:, :4] = values
+    data[:, 4] = values[:, 1] / 3
+    return data
+
+
+def sliding_modulus(strain, stress, window, start=0, stop=None, criterion="r2", min_slope_fraction=0.5):
+    """
+        DESCRIPTION: This function slides a fixed size least squares window along
+                     the stress-strain curve and keeps the most linear one. The
+                     window sums are differences of running sums, so each step
+                     costs O(1) instead of a refit.
+        INPUTS  : strain - array of strain values
+                  stress - array of stress values
+                  window - number of samples in the fit window
+                  start, stop - sample range to search
+                  criterion - "r2" for the highest r squared or "stderr" for
+                              the lowest standard error relative to the
+                              slope (which ranks windows of one size like r2)
+                  min_slope_fraction - only windows at least this fraction as
+                                       steep as the steepest one qualify, so
+                                       flat toe or plastic windows cannot win
+        OUTPUTS : (slope, intercept, r_value, std_err, window_start, window_stop)
+                  of the chosen window
+    """
+    x = np.asarray(strain, dtype=np.float64)[start:stop]
+    y = np.asarray(stress, dtype=np.float64)[start:stop]
+    n = int(window)
+    if n < 3 or n > len(x):
+        raise ValueError("window must hold between 3 and {} samples".format(len(x)))
+    # center first so the running sums of squares keep their precision
+    x_ref, y_ref = x.mean(), y.mean()
+    x, y = x - x_ref, y - y_ref
+
+    def window_sums(values):
+        running = np.concatenate(([0.0], np.cumsum(values)))
+        return running[n:] - running[:-n]
+
+    sx, sy = window_sums(x), window_sums(y)
+    ssxm = n * window_sums(x * x) - sx * sx
+    ssym = n * window_sums(y * y) - sy * sy
+    ssxym = n * window_sums(x * y) - sx * sy
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = ssxym / ssxm
+        r_squared = np.clip(ssxym * ssxym / (ssxm * ssym), 0.0, 1.0)
+        std_err = np.sqrt((1 - r_squared) * ssym / ssxm / (n - 2))
+
+    # an elastic region rises, so falling windows past the yield never qualify,
+    # and it is the steepest part of the curve, so neither do plateaus
+    valid = np.isfinite(std_err) & (slope > 0)
+    if not valid.any():
+        valid = np.isfinite(std_err)
+    elif min_slope_fraction:
+        valid &= slope >= min_slope_fraction * slope[valid].max()
+    if criterion == "r2":
+        best = int(np.argmax(np.where(valid, r_squared, -1)))
+    elif criterion == "stderr":
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative_err = std_err / np.abs(slope)
+        best = int(np.argmin(np.where(valid & np.isfinite(relative_err), relative_err, np.inf)))
+    else:
+        raise ValueError("unknown criterion: {}".format(criterion))
+
+    intercept = y_ref + (sy[best] - slope[best] * sx[best]) / n - slope[best] * x_ref
+    r_value = np.sign(slope[best]) * np.sqrt(r_squared[best])
+    return (slope[best], intercept, r_value, std_err[best],
+            start + best, start + best + n)
+
+
+def turnover_index(stress, start=0, step=4, tolerance=1.002):
+    """
+        DESCRIPTION: This function finds where the stress curve turns over, i.e.
+                     the first sample i (from start, every step samples) whose
+                     stress times tolerance is no longer below the next sample
+        INPUTS  : stress - array of stress values
+                  start - index to start the search from
+                  step - stride between the compared samples
+                  tolerance - multiplier applied to the earlier sample
+        OUTPUTS : index of the turnover sample, -1 if the curve never turns over
+    """
+    strided = np.asarray(stress)[start::step]
+    scaled = strided[:-1] * tolerance
+    turned = ~(scaled < strided[1:])
+    if not turned.any():
+        return -1
+    return start + step * int(np.argmax(turned))
+
+
+def offset_yield_index(strain, stress, modulus, intercept=0.0, offset=0.002, start=0):
+    """
+        DESCRIPTION: This function finds the offset yield point, where the curve
+                     first drops below the elastic line shifted by offset strain
+        INPUTS  : strain - array of strain values
+                  stress - array of stress values
+                  modulus - slope of the elastic line
+                  intercept - intercept of the elastic line
+                  offset - strain offset of the line, 0.2% by default
+                  start - index to start the search from
+        OUTPUTS : index of the yield sample, -1 if the curve never crosses the line
+    """
+    strain = np.asarray(strain)[start:]
+    stress = np.asarray(stress)[start:]
+    below = stress <= modulus * (strain - offset) + intercept
+    if not below.any():
+        return -1
+    return start + int(np.argmax(below))
+
+
+def max_curvature_index(strain, stress, start=0):
+    """
+        DESCRIPTION: This function finds the sample of maximum curvature of the
+                     stress-strain curve, the knee between elastic and plastic
+        INPUTS  : strain - array of strain values
+                  stress - array of stress values
+                  start - index to start the search from
+        OUTPUTS : index of the maximum curvature sample, -1 if there are fewer
+                  than three samples to differentiate
+    """
+    strain = np.asarray(strain)[start:]
+    stress = np.asarray(stress)[start:]
+    if len(stress) < 3:
+        return -1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.gradient(stress) / np.gradient(strain)
+        curvature = np.abs(np.gradient(slope) / np.gradient(strain)) / (1 + slope ** 2) ** 1.5
+    curvature[~np.isfinite(curvature)] = -1
+    return start + int(np.argmax(curvature))
+
+
+def lttb_indices(x, y, max_points):
+    """
+        DESCRIPTION: This function decimates a curve with the Largest-Triangle-
+                     Three-Buckets algorithm: the first and last samples are kept
+                     and every bucket in between keeps the sample that forms the
+                     largest triangle with the previously kept sample and the mean
+                     of the next bucket, which preserves peaks and knees
+        INPUTS  : x - array of x values
+                  y - array of y values
+                  max_points - number of samples to keep, at least 3
+        OUTPUTS : sorted numPy array of the indices of the kept samples
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        raise ValueError("max_points must be at least 3")
+
+    # buckets split the samples between the first and the last
+    n_buckets = max_points - 2
+    edges = np.linspace(1, n - 1, n_buckets + 1).astype(np.intp)
+    counts = edges[1:] - edges[:-1]
+    # for each bucket, the mean of the bucket after it, and the last sample after the last bucket
+    next_x = np.append((np.add.reduceat(x[:n - 1], edges[:-1]) / counts)[1:], x[-1])
+    next_y = np.append((np.add.reduceat(y[:n - 1], edges[:-1]) / counts)[1:], y[-1])
+
+    kept = np.empty(max_points, dtype=np.intp)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_buckets):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        # twice the triangle area, up to the sign
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def _nice_ticks(low, high, count=5):
+    """
+        DESCRIPTION: This function picks round tick values (1, 2 or 5 times a
+                     power of ten apart) covering an axis range
+        INPUTS  : low, high - axis range
+                  count - approximate number of ticks
+        OUTPUTS : numPy array of tick values within the range
+    """
+    if not high > low:
+        return np.array([low])
+    raw = (high - low) / count
+    magnitude = 10 ** floor(log10(raw))
+    step = magnitude * min((m for m in (1, 2, 5, 10) if m * magnitude >= raw))
+    return np.arange(ceil(low / step), floor(high / step) + 1) * step
+
+
+SVG_WIDTH, SVG_HEIGHT, SVG_MARGIN = 600, 350, 55
+
+
+def svg_plot(x, y, x_title, y_title, max_points=1000, lines=(), points=()):
+    """
+        DESCRIPTION: This function draws a curve as a self-contained inline SVG
+                     chart, decimated with lttb_indices so the markup stays small
+                     however many samples the curve has
+        INPUTS  : x, y - arrays of x and y values
+                  x_title, y_title - axis labels
+                  max_points - most samples drawn, see lttb_indices
+                  lines - ((x0, y0, x1, y1), ...) segments drawn in red over the
+                          curve, e.g. the elastic fit
+                  points - ((x, y, label), ...) points marked over the curve,
+                           e.g. the critical stress
+        OUTPUTS : SVG markup string
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.all():
+        x, y = x[finite], y[finite]
+    if len(x) > max_points:
+        kept = lttb_indices(x, y, max_points)
+        x, y = x[kept], y[kept]
+
+    x_low, x_high = (x.min(), x.max()) if len(x) else (0.0, 1.0)
+    y_low, y_high = (y.min(), y.max()) if len(y) else (0.0, 1.0)
+    x_span = (x_high - x_low) or 1.0
+    y_span = (y_high - y_low) or 1.0
+    plot_w = SVG_WIDTH - 2 * SVG_MARGIN
+    plot_h = SVG_HEIGHT - 2 * SVG_MARGIN
+
+    def px(values):
+        return SVG_MARGIN + (np.asarray(values, dtype=np.float64) - x_low) * (plot_w / x_span)
+
+    def py(values):
+        return SVG_HEIGHT - SVG_MARGIN - (np.asarray(values, dtype=np.float64) - y_low) * (plot_h / y_span)
+
+    parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" viewBox="0 0 {0} {1}" '
+             'font-family="Helvetica" font-size="11">'.format(SVG_WIDTH, SVG_HEIGHT),
+             '<rect x="{0}" y="{0}" width="{1}" height="{2}" fill="none" stroke="#999"/>'.format(
+                 SVG_MARGIN, plot_w, plot_h)]
+    for tick in _nice_ticks(x_low, x_high):
+        parts.append('<text x="{:.1f}" y="{}" text-anchor="middle">{:g}</text>'.format(
+            float(px(tick)), SVG_HEIGHT - SVG_MARGIN + 15, tick))
+    for tick in _nice_ticks(y_low, y_high):
+        parts.append('<text x="{}" y="{:.1f}" text-anchor="end">{:g}</text>'.format(
+            SVG_MARGIN - 5, float(py(tick)) + 4, tick))
+    parts.append('<text x="{}" y="{}" text-anchor="middle">{}</text>'.format(
+        SVG_MARGIN + plot_w // 2, SVG_HEIGHT - 12, escape(x_title)))
+    parts.append('<text transform="translate(14 {}) rotate(-90)" text-anchor="middle">{}</text>'.format(
+        SVG_MARGIN + plot_h // 2, escape(y_title)))
+
+    coordinates = np.round(np.column_stack((px(x), py(y))), 1)
+    parts.append('<polyline fill="none" stroke="#1f77b4" stroke-width="1.5" points="{}"/>'.format(
+        " ".join("{:g},{:g}".format(u, v) for u, v in coordinates.tolist())))
+    for x0, y0, x1, y1 in lines:
+        parts.append('<line x1="{:.1f}" y1="{:.1f}" x2="{:.1f}" y2="{:.1f}" stroke="red" '
+                     'stroke-width="2.5" opacity="0.7"/>'.format(
+                         float(px(x0)), float(py(y0)), float(px(x1)), float(py(y1))))
+    for x0, y0, label in points:
+        parts.append('<circle cx="{:.1f}" cy="{:.1f}" r="4" fill="red"><title>{}</title></circle>'.format(
+            float(px(x0)), float(py(y0)), escape(label)))
+    parts.append('</svg>')
+    return "\n".join(parts)
+
+
+def _format_value(value):
+    return "n/a" if value is None or value == "" else "{:.2f}".format(value)
+
+
+HTML_PAGE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <meta charset="UTF-8">
+    <title>Thermo Mechanical Analysis</title>
+    <style>
+        body {{ margin-left: 21%; font-family: 'Helvetica' }}
+        table {{ border-collapse: collapse }}
+        td, th {{ padding: 2px 10px; text-align: left }}
+    </style>
+</head>
+<body>
+    <h1 style="margin-top:25px;">Thermo Mechanical Analysis</h1>
+{0}
+</body>
+</html>
+'''
+
+HTML_SECTION = '''    <div class="test" id="{anchor}">
+        <h2>{name}</h2>
+        <hr width="80%" align="left">
+        <h3>Force vs Displacement</h3>
+        <p>The chart depicting force vs displacement of material is plotted here.</p>
+        {force_plot}
+        <hr width="80%" align="left">
+        <h3>Stress vs Strain</h3>
+        <p>The chart of Stress v/s Strain is plotted here, with the elastic fit in red.</p>
+        {stress_plot}
+        <h4>Elastic Modulus of the curve: {modulus}</h4>
+        <h4>Critical Stress for the material: {critical}</h4>
+    </div>
+'''
+
+
+def report_anchor(file_path):
+    """ HTML id of the report section of a test, derived from its file path """
+    return "test-" + re.sub(r"[^\w-]", "-", file_path)
+
+
+def html_summary(results):
+    """
+        DESCRIPTION: This function renders the table of contents of a combined
+                     report, one row per test linking to its section
+        INPUTS  : results - list of dicts keyed on RESULT_FIELDS
+        OUTPUTS : HTML string
+    """
+    rows = []
+    for result in results:
+        name = escape(os.path.basename(result["file"]))
+        if not result["error"]:
+            # failed tests have no section to link to
+            name = '<a href="#{}">{}</a>'.format(report_anchor(result["file"]), name)
+        rows.append('        <tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>'.format(
+            name, _format_value(result["elastic_modulus"]), _format_value(result["critical_stress"]),
+            result["rows"], escape(result["error"] or "")))
+    return ('    <table>\n        <tr><th>Test</th><th>Elastic Modulus</th><th>Critical Stress</th>'
+            '<th>Rows</th><th>Error</th></tr>\n' + "\n".join(rows) + '\n    </table>\n')
+
+
+def write_html_report(sections, html_file, summary=""):
+    """
+        DESCRIPTION: This function writes a self-contained HTML report, with no
+                     scripts or external resources, from rendered test sections
+        INPUTS  : sections - HTML strings from Thermo.html_section
+                  html_file - html file path
+                  summary - HTML placed before the sections, e.g. html_summary
+        OUTPUTS : path of the written report
+    """
+    with io.open(html_file, "w", encoding="utf-8") as f:
+        f.write(HTML_PAGE.format(summary + "".join(sections)))
+    return html_file
 
 
 class Thermo:
@@ -126,112 +681,237 @@ class Thermo:
         self.file = file
         self.elastic_modulus = None
         self.critical_stress = None
+        self.critical_index = None
+        self.modulus_window = None
+        self.modulus_intercept = None
 
-    def extract_data(self):
+    def extract_data(self, all_rows=False):
         """
-            DESCRIPTION: The function extracts data based on pattern matching
-                         with the raw data file and create various lists based
-                         on further data processing requirements
-            INPUTS  : N/A
+            DESCRIPTION: The function bulk loads the numeric body of the raw data
+                         file into a single float64 array and exposes the
+                         displacement, force, strain and stress columns as views
+            INPUTS  : all_rows - also keep rows written in exponent notation,
+                                 which the original line parser skipped
             OUTPUTS : N/A
             DEPENDENCIES : txt
         """
-        regex = "([-+]?\d*\.\d+)\s([-+]?\d*\.\d+)\s([-+]?\d*\.\d+)\s([-+]?\d*\.\d+)"
-
-        with open(self.file, 'r+') as f:
-            for line in f.readlines():
-                data = re.match(regex, line)
-                
-                if data is not None:
-                    self.displacement.append(float(data.group(1)))
-                    self.force.append(float(data.group(2)))
-                    self.strain.append(float(data.group(3)))
-                    self.stress.append(float(data.group(2))/3)
-
-    def generate_html(self, html_file):
+        self.data = load_curve(self.file, all_rows=all_rows)
+        if not len(self.data):
+            raise ValueError("{}: no data rows found".format(self.file))
+        self.displacement = self.data[:, 0]
+        self.force = self.data[:, 1]
+        self.strain = self.data[:, 2]
+        self.stress = self.data[:, 4]
+
+    def html_section(self, anchor=None, max_points=1000):
+        """
+            DESCRIPTION: This function renders the report section of this test: the
+                         force/displacement and stress/strain curves as inline SVG,
+                         decimated to max_points samples each, and the calculated values
+            INPUTS  : anchor - HTML id of the section, see report_anchor by default
+                      max_points - most samples drawn per curve, see lttb_indices
+            OUTPUTS : HTML string
+            DEPENDENCIES : extract_data(), and calc_elastic_modulus() for the
+                           elastic fit and the values
         """
-            DESCRIPTION: This function generates the HTML file by embedding the plotly links
-                         and calculated variables in the string which represent the entire HTML page
+        fit, critical = (), ()
+        if self.elastic_modulus is not None:
+            start, stop = self.modulus_window
+            x0, x1 = self.strain[start], self.strain[stop - 1]
+            fit = ((x0, self.elastic_modulus * x0 + self.modulus_intercept,
+                    x1, self.elastic_modulus * x1 + self.modulus_intercept),)
+            if self.critical_index is not None and self.critical_index >= 0:
+                critical = ((self.strain[self.critical_index], self.stress[self.critical_index],
+                             "Critical stress {:.2f}".format(self.critical_stress)),)
+        return HTML_SECTION.format(
+            anchor=anchor or report_anchor(self.file), name=escape(os.path.basename(self.file)),
+            force_plot=svg_plot(self.displacement, self.force, "Displacement", "Force", max_points),
+            stress_plot=svg_plot(self.strain, self.stress, "Strain", "Stress", max_points, fit, critical),
+            modulus=_format_value(self.elastic_modulus), critical=_format_value(self.critical_stress))
+
+    def generate_html(self, html_file, max_points=1000):
+        """
+            DESCRIPTION: This function generates a self-contained HTML file with the
+                         curves and the calculated values of this test, without the
+                         online plotting service
             INPUTS  : html_file - html file path
+                      max_points - most samples drawn per curve, see lttb_indices
             OUTPUTS : HTML file
-            DEPENDENCIES : (extract_data() & calc_elastic_modulus) links to plotly graphs
+            DEPENDENCIES : (extract_data() & calc_elastic_modulus) data lists
                             and elastic modulus & critical stress values
         """
-        fd_plot = plot_graphs(list1=self.displacement, list2=self.force,
-                              graph_title='Force vs Displacement', x_title='Displacement', y_title='Force')
-        ss_plot = plot_graphs(list1=self.strain, list2=self.stress,
-                              graph_title='Stress vs Strain', x_title='Strain', y_title='Stress')
-
-        html_string = '''
-                <!DOCTYPE html>
-                <html lang="en">
-                <head>
-                    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                    <meta charset="UTF-8">
-                    <title>Thermo Mechanical Analysis</title>
-                </head>
-                <body style="margin-left: 21%; font-family: 'Helvetica'" >
-                    <div class="header">
-                        <h1 style="margin-top:25px;" >Thermo Mechanical Analysis</h1>
-                        <p style="margin-top: 10px">This is an HTML file for the Thermo-Mechanical data. Please feel free to hover the mouse on the curves to get more info on the DSC curves</p>
-                        <hr width="80%" align="left">
-                        <div class="container">
-                            <h3 style="margin-top:50px">Force vs Displacement</h3>
-                            <p style="margin-top: 10px">The chart depicting force vs displacement of material is plotted here.</p>
-                            <div style="margin:0 auto 50 auto">
-                                <iframe width="600" height="350" frameborder="0" seamless="seamless" scrolling="no"
-                                src="{0}.embed?width=600&height=350"></iframe>
-                            </div>
-                        </div>
-                        <hr width="80%" align="left">
-                        <div class="container">
-                            <h3 style="margin-top:50px">Stress vs Strain</h3>
-                            <p style="margin-top: 10px">The chart of Stress v/s Strain is plotted here.</p>
-                            <div style="margin:0 auto 50 auto">
-                                <iframe width="600" height="350" frameborder="0" seamless="seamless" scrolling="no"
-                                src="{1}.embed?width=600&height=350"></iframe>
-                            </div>
-                        </div>
-                        </br>
-                        <h4>Elastic Modulus of the curve: {2:.2f}</h4>
-                        </br>
-                        <h4>Critical Stress for the material: {3:.2f}</h4>
-                    </div>
-                </body>
-                </html>'''.format(fd_plot, ss_plot, self.elastic_modulus, self.critical_stress)
-
-        file = open(html_file, "w")
-        file.write(html_string)
-        file.close()
-
-    def calc_elastic_modulus(self):
+        return write_html_report([self.html_section(max_points=max_points)], html_file)
+
+    def calc_elastic_modulus(self, yield_method="turnover", modulus_window=None, modulus_criterion="r2"):
         """
             DESCRIPTION: The function calculates values of elastic modulus
                          and critical stress based on the extracted data lists
-            INPUTS  : N/A
-            OUTPUTS : N/A
+            INPUTS  : yield_method - definition of the critical stress, one of
+                                     "turnover" (stress stops rising),
+                                     "offset" (0.2% offset yield) or
+                                     "curvature" (maximum curvature)
+                      modulus_window - fit the modulus on the most linear window
+                                       of this many samples instead of the third
+                                       tenth of the curve
+                      modulus_criterion - "r2" or "stderr", see sliding_modulus
+            OUTPUTS : (elastic modulus, critical stress), also kept as
+                      attributes; nothing is printed, so pool workers stay quiet
             DEPENDENCEIES : extract_data() data lists for stress and strain
         """
         data_quadrant = int(len(self.strain)/10)
 
-        self.strain = smooth_spline(np.array(self.strain), 51, 3).tolist()
-
-        x = np.array(self.strain[data_quadrant*2:data_quadrant*3])
-        y = np.array(self.stress[data_quadrant*2:data_quadrant*3])
+        self.strain = smooth_spline(self.strain, 51, 3)
 
-        slope, intercept, r_value, p_value, std_err = stats.linregress(x, y)
+        if modulus_window is None:
+            self.modulus_window = (data_quadrant*2, data_quadrant*3)
+            x = self.strain[data_quadrant*2:data_quadrant*3]
+            y = self.stress[data_quadrant*2:data_quadrant*3]
+            slope, intercept, r_value, p_value, std_err = stats.linregress(x, y)
+        else:
+            fit = sliding_modulus(self.strain, self.stress, modulus_window, criterion=modulus_criterion)
+            slope, intercept, r_value, std_err = fit[:4]
+            self.modulus_window = fit[4:]
         self.elastic_modulus = slope
-        print("Elastic Modulus:" + str(self.elastic_modulus))
+        self.modulus_intercept = intercept
+
+        # look for the critical stress past the end of the fit window
+        start = self.modulus_window[1]
+        if yield_method == "turnover":
+            self.critical_index = turnover_index(self.stress, start)
+            scale = 1.002
+        elif yield_method == "offset":
+            self.critical_index = offset_yield_index(self.strain, self.stress, slope, intercept, start=start)
+            scale = 1
+        elif yield_method == "curvature":
+            self.critical_index = max_curvature_index(self.strain, self.stress, start)
+            scale = 1
+        else:
+            raise ValueError("unknown yield_method: {}".format(yield_method))
+
+        if self.critical_index < 0:
+            self.critical_stress = float('nan')
+        else:
+            self.critical_stress = self.stress[self.critical_index] * scale
+        return self.elastic_modulus, self.critical_stress
 
-        prev_stress, curr_stress = 0, 1
-        cntr = data_quadrant * 3
-        while prev_stress < curr_stress:
-            prev_stress = self.stress[cntr] * 1.002
-            cntr += 4
-            curr_stress = self.stress[cntr]
 
-        self.critical_stress = prev_stress
-        print("Critical Stress:" + str(self.critical_stress))
+RESULT_FIELDS = ("file", "elastic_modulus", "critical_stress", "modulus_start", "modulus_stop",
+                 "rows", "parse_time", "error")
+
+
+def find_data_files(txt_file_dir, extension=".txt"):
+    """
+        DESCRIPTION: This function walks a directory tree and collects the
+                     Instron/MTS text exports found in it
+        INPUTS  : txt_file_dir - root directory of the exports
+                  extension - file extension of the exports
+        OUTPUTS : sorted list of file paths
+    """
+    paths = []
+    for root, _, files in os.walk(txt_file_dir):
+        paths.extend(os.path.join(root, name) for name in files
+                     if name.lower().endswith(extension))
+    return sorted(paths)
+
+
+def analyze_file(file_path, modulus_window=None, report_points=None):
+    """
+        DESCRIPTION: This function runs the extraction and elastic modulus analysis
+                     on a single file. Failures are recorded instead of raised so
+                     one bad export does not abort a batch.
+        INPUTS  : file_path - path of the raw data file
+                  modulus_window - see Thermo.calc_elastic_modulus
+                  report_points - also render the report section of the test,
+                                  drawing at most this many samples per curve
+        OUTPUTS : dict keyed on RESULT_FIELDS, plus "section" with the rendered
+                  report section when report_points is given
+    """
+    result = dict.fromkeys(RESULT_FIELDS, "")
+    result["file"] = file_path
+    try:
+        experiment = Thermo(file=file_path)
+        start = default_timer()
+        experiment.extract_data()
+        result["parse_time"] = default_timer() - start
+        result["rows"] = len(experiment.data)
+        experiment.calc_elastic_modulus(modulus_window=modulus_window)
+        result["elastic_modulus"] = experiment.elastic_modulus
+        result["critical_stress"] = experiment.critical_stress
+        result["modulus_start"], result["modulus_stop"] = experiment.modulus_window
+        if report_points:
+            # rendered here, so only the decimated curves leave a worker process
+            result["section"] = experiment.html_section(max_points=report_points)
+    except Exception as e:
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+    return result
+
+
+def write_results(results, out_dir, gzip_bool=False, name="thermo_results.csv"):
+    """
+        DESCRIPTION: This function writes the consolidated results table of a batch
+        INPUTS  : results - list of dicts returned by analyze_file
+                  out_dir - output directory
+                  gzip_bool - gzip the table
+                  name - file name of the table
+        OUTPUTS : path of the written table
+    """
+    buf = io.StringIO() if sys.version_info[0] >= 3 else io.BytesIO()
+    writer = csv.DictWriter(buf, fieldnames=RESULT_FIELDS, lineterminator="\n", extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(results)
+    content = buf.getvalue()
+    if not isinstance(content, bytes):
+        content = content.encode("utf-8")
+
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    out_path = os.path.join(out_dir, name)
+    if gzip_bool:
+        out_path += ".gz"
+        with gzip.open(out_path, "wb") as f:
+            f.write(content)
+    else:
+        with open(out_path, "wb") as f:
+            f.write(content)
+    return out_path
+
+
+def run_directory(txt_file_dir, out_dir, jobs=None, gzip_bool=False, modulus_window=None,
+                  html_file=None, report_points=1000):
+    """
+        DESCRIPTION: This function analyzes every export under a directory across
+                     a pool of worker processes and writes one results table
+        INPUTS  : txt_file_dir - root directory of the exports
+                  out_dir - output directory
+                  jobs - number of worker processes, defaults to the CPU count
+                  gzip_bool - gzip the results table
+                  modulus_window - see Thermo.calc_elastic_modulus
+                  html_file - also write one combined HTML report of all tests here
+                  report_points - most samples drawn per curve in the report
+        OUTPUTS : path of the written table
+    """
+    paths = find_data_files(txt_file_dir)
+    analyze = partial(analyze_file, modulus_window=modulus_window,
+                      report_points=report_points if html_file else None)
+    jobs = max(1, min(jobs or cpu_count(), len(paths) or 1))
+    if jobs == 1:
+        results = [analyze(path) for path in paths]
+    else:
+        pool = Pool(processes=jobs)
+        try:
+            # results come back in the order of paths
+            results = pool.map(analyze, paths, chunksize=max(1, len(paths) // (jobs * 4)))
+        finally:
+            pool.close()
+            pool.join()
+    for result in results:
+        if result["error"]:
+            # the table records the error as well, the batch goes on with the other files
+            sys.stderr.write("Skipped {}: {}\n".format(result["file"], result["error"]))
+    if html_file:
+        write_html_report([result["section"] for result in results if "section" in result],
+                          html_file, html_summary(results))
+    return write_results(results, out_dir, gzip_bool=gzip_bool)
 
 
 def main():
@@ -241,10 +921,24 @@ def main():
                      It spawns new objects for each experiment file.
     """
     options = get_options()
+    if options.txt_file_dir is not None:
+        out_path = run_directory(options.txt_file_dir, options.out_dir,
+                                 jobs=options.jobs, gzip_bool=options.gzip_bool,
+                                 modulus_window=options.modulus_window,
+                                 html_file=options.html_file_path_out,
+                                 report_points=options.plot_points)
+        print("Results written to " + out_path)
+        if options.html_file_path_out:
+            print("Report written to " + options.html_file_path_out)
+        return
+
     experiment = Thermo(file=options.txt_file_path)
     experiment.extract_data()
-    experiment.calc_elastic_modulus()
-    #experiment.generate_html(html_file=options.html_file_path_out)
+    elastic_modulus, critical_stress = experiment.calc_elastic_modulus(modulus_window=options.modulus_window)
+    print("Elastic Modulus:" + str(elastic_modulus))
+    print("Critical Stress:" + str(critical_stress))
+    if options.html_file_path_out:
+        experiment.generate_html(html_file=options.html_file_path_out, max_points=options.plot_points)
 
 if __name__ == '__main__':
     """
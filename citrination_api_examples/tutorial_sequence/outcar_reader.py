@@ -0,0 +1,167 @@
+'''
+Reads a few quantities straight from VASP output without building PIFs, as an alternative to directory_to_pif when an
+analysis only needs the final total energy, stoichiometry or pressure (e.g. the enthalpy of formation in 2_WorkingWithPIFs).
+The OUTCAR is memory-mapped and searched backwards from the end for the last occurrence of each marker, so the cost does
+not depend on how long the relaxation ran; only the first lines of the POSCAR are read.
+Values follow the conventions of dfttopif: the energy is the last "free energy TOTEN" in eV, the pressure the last
+"external pressure" in kbar (None when ISIF = 0) and the formula lists elements alphabetically, omitting counts of 1.
+'''
+
+import mmap
+import os
+from collections import Counter
+
+QUANTITIES = ("energy", "composition", "pressure")
+
+_ENERGY = b"free  energy   TOTEN"
+_PRESSURE = b"external pressure"
+_ISIF = b"ISIF   ="
+_TITEL = b"TITEL  ="
+_UNITS = {"kB": "kbar"}
+
+
+def _line_at(data, start):
+    end = data.find(b"\n", start)
+    return data[start:end if end != -1 else len(data)].decode("ascii", "replace")
+
+
+def _last_line(data, marker):
+    start = data.rfind(marker)
+    return None if start == -1 else _line_at(data, start)
+
+
+def _mapped(path):
+    '''Read-only memory map of a file, or its bytes if it is empty and cannot be mapped'''
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_outcar(path, quantities=("energy", "pressure")):
+    '''Final total energy and pressure from an OUTCAR
+
+    :param path: OUTCAR file
+    :type path: str
+    :param quantities: Any of "energy" and "pressure"
+    :type quantities: Iterable[str]
+    :return: Requested quantity to value, None where the OUTCAR does not have it
+    :rtype: dict
+    '''
+
+    data = _mapped(path)
+    try:
+        found = {}
+        if "energy" in quantities:
+            line = _last_line(data, _ENERGY)
+            found["energy"] = None if line is None else float(line.split()[-2])
+        if "pressure" in quantities:
+            # ISIF is echoed once near the top, so the forward search stops early
+            isif = data.find(_ISIF)
+            line = _last_line(data, _PRESSURE)
+            if line is None or (isif != -1 and _line_at(data, isif).split()[2] == "0"):
+                found["pressure"] = None
+            else:
+                words = line.split()
+                found["pressure"] = float(words[3])
+                found["pressure_units"] = _UNITS.get(words[4], words[4])
+        return found
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def outcar_species(path):
+    '''Element of each POTCAR in an OUTCAR header, in POSCAR order'''
+
+    data = _mapped(path)
+    try:
+        species = []
+        start = data.find(_TITEL)
+        while start != -1:
+            # e.g. "   TITEL  = PAW_PBE Al 04Jan2001"
+            species.append(_line_at(data, start).split()[3].split("_")[0])
+            start = data.find(_TITEL, start + len(_TITEL))
+        return species
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def read_poscar_composition(path, outcar_path=None):
+    '''Number of atoms of each element in a POSCAR
+
+    VASP 5 files name the elements on line 6. For VASP 4 files, which do not,
+    the elements are taken from the POTCAR titles in outcar_path.
+
+    :param path: POSCAR file
+    :type path: str
+    :param outcar_path: OUTCAR of the same run, for VASP 4 POSCARs
+    :type outcar_path: str
+    :return: Element to count
+    :rtype: Counter
+    :raises ValueError: if the elements cannot be determined
+    '''
+
+    with open(path) as f:
+        header = [next(f, "") for _ in range(7)]
+    symbols = header[5].split()
+    counts = header[6].split()
+    if symbols and all(s.isdigit() for s in symbols):
+        counts = symbols
+        symbols = outcar_species(outcar_path) if outcar_path else []
+    if len(symbols) != len(counts):
+        raise ValueError("Cannot determine the elements of {}".format(path))
+    composition = Counter()
+    for symbol, count in zip(symbols, counts):
+        # VASP appends hashes to the symbols in some files, e.g. "Al/3a1b"
+        composition[symbol.split("/")[0].split("_")[0]] += int(count)
+    return composition
+
+
+def composition_formula(composition):
+    '''Formula of a composition as written by dfttopif, e.g. Al8Cu4'''
+
+    return "".join(k if composition[k] == 1 else "{}{}".format(k, composition[k]) for k in sorted(composition))
+
+
+def read_run(run_dir, quantities=QUANTITIES):
+    '''Requested quantities of one VASP run directory
+
+    :param run_dir: Directory with an OUTCAR and, for the composition, a POSCAR
+    :type run_dir: str
+    :param quantities: Any of QUANTITIES
+    :type quantities: Iterable[str]
+    :return: Quantity to value; "composition" also adds "formula" and "num_atoms", "pressure" adds "pressure_units"
+    :rtype: dict
+    '''
+
+    outcar = os.path.join(run_dir, "OUTCAR")
+    found = {"run_dir": run_dir}
+    found.update(read_outcar(outcar, [q for q in quantities if q != "composition"]))
+    if "composition" in quantities:
+        composition = read_poscar_composition(os.path.join(run_dir, "POSCAR"), outcar)
+        found["composition"] = dict(composition)
+        found["formula"] = composition_formula(composition)
+        found["num_atoms"] = sum(composition.values())
+    return found
+
+
+def read_runs(run_dirs, quantities=QUANTITIES):
+    '''read_run over many run directories; a run that cannot be read gets an "error" entry instead of raising
+
+    :param run_dirs: Run directories
+    :type run_dirs: Iterable[str]
+    :param quantities: Any of QUANTITIES
+    :type quantities: Iterable[str]
+    :rtype: List[dict]
+    '''
+
+    results = []
+    for run_dir in run_dirs:
+        try:
+            results.append(read_run(run_dir, quantities))
+        except (IOError, OSError, ValueError, IndexError) as e:
+            results.append({"run_dir": run_dir, "error": "{}: {}".format(type(e).__name__, e)})
+    return results
@@ -0,0 +1,275 @@
+'''
+Converts a tree of VASP run directories to PIFs across a pool of worker processes, as in 1_ImportVASP and 2_WorkingWithPIFs.
+Each converted PIF is cached in SQLite under a fingerprint of the run's input files (names, sizes and modification times),
+so unchanged runs are skipped on the next pass. Results are streamed into sharded PIF JSON files ready for upload, and a
+failing run is reported instead of aborting the batch.
+
+    report = convert_tree("./example_data", "vasp_pifs.json", cache_path="vasp_pifs.sqlite")
+    client.data.upload(dataset_id, report.shards[0])
+
+or from a shell:
+
+    python vasp_to_pif.py ./example_data -o vasp_pifs.json -j 8
+'''
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import traceback
+from multiprocessing import Pool, cpu_count
+from timeit import default_timer
+
+from dfttopif import directory_to_pif
+from pypif import pif
+
+# files written next to the inputs by the tutorials, which do not change the parsed result
+IGNORED_FILES = ("pif.json",)
+
+
+def find_run_directories(root, markers=("OUTCAR",)):
+    '''Directories under root holding a VASP run, in sorted order
+
+    :param root: Top of the tree
+    :type root: str
+    :param markers: File names any of which marks a run directory
+    :type markers: Tuple[str]
+    :rtype: List[str]
+    '''
+
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if any(marker in filenames for marker in markers):
+            found.append(dirpath)
+    return found
+
+
+def input_fingerprint(run_dir, quality_report=False):
+    '''Hash of the name, size and modification time of every input file of a run
+
+    :param run_dir: Run directory
+    :type run_dir: str
+    :param quality_report: Part of the key, since it changes the converted PIF
+    :type quality_report: bool
+    :rtype: str
+    '''
+
+    digest = hashlib.sha1(repr(bool(quality_report)).encode("utf-8"))
+    for name in sorted(os.listdir(run_dir)):
+        path = os.path.join(run_dir, name)
+        if name in IGNORED_FILES or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        digest.update("{}\0{}\0{}\0".format(name, stat.st_size, stat.st_mtime).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PifCache(object):
+    '''Converted PIFs keyed on run directory and input fingerprint, backed by SQLite
+
+    :param path: SQLite file, created if missing
+    :type path: str
+    '''
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS pifs "
+                             "(run_dir TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, pif TEXT NOT NULL)")
+
+    def get(self, run_dir, fingerprint):
+        '''PIF JSON of a run, None unless cached with the same fingerprint'''
+
+        row = self._db.execute("SELECT fingerprint, pif FROM pifs WHERE run_dir = ?",
+                               (os.path.abspath(run_dir),)).fetchone()
+        if row is None or row[0] != fingerprint:
+            return None
+        return row[1]
+
+    def put(self, run_dir, fingerprint, pif_json):
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO pifs VALUES (?, ?, ?)",
+                             (os.path.abspath(run_dir), fingerprint, pif_json))
+
+    def close(self):
+        self._db.close()
+
+
+def _convert(args):
+    # runs in a worker process; returns JSON rather than PIF objects to keep pickling cheap
+    run_dir, quality_report = args
+    start = default_timer()
+    try:
+        pif_json = pif.dumps(directory_to_pif(run_dir, quality_report=quality_report))
+        error = None
+    except Exception:
+        pif_json = None
+        error = traceback.format_exc().strip().splitlines()[-1]
+    return run_dir, pif_json, error, default_timer() - start
+
+
+class RunResult(object):
+    '''Outcome of converting one run directory'''
+
+    def __init__(self, run_dir, seconds, cached=False, error=None):
+        self.run_dir = run_dir
+        self.seconds = seconds
+        self.cached = cached
+        self.error = error
+
+    def __repr__(self):
+        status = "failed: {}".format(self.error) if self.error else ("cached" if self.cached else "converted")
+        return "{} {} in {:.3f}s".format(self.run_dir, status, self.seconds)
+
+
+def convert_directories(run_dirs, jobs=None, cache=None, quality_report=False):
+    '''Converts run directories across a process pool, reusing cached PIFs
+
+    :param run_dirs: Run directories
+    :type run_dirs: List[str]
+    :param jobs: Worker processes, defaults to the CPU count
+    :type jobs: int
+    :param cache: Cache to read from and write to, defaults to no caching
+    :type cache: PifCache
+    :param quality_report: Passed on to directory_to_pif
+    :type quality_report: bool
+    :return: Generator of (PIF JSON or None on failure, RunResult), cached runs first, the rest as they finish
+    :rtype: Iterator[Tuple[str, RunResult]]
+    '''
+
+    pending = []
+    fingerprints = {}
+    for run_dir in run_dirs:
+        if cache is not None:
+            fingerprints[run_dir] = input_fingerprint(run_dir, quality_report)
+            pif_json = cache.get(run_dir, fingerprints[run_dir])
+            if pif_json is not None:
+                yield pif_json, RunResult(run_dir, 0.0, cached=True)
+                continue
+        pending.append((run_dir, quality_report))
+
+    jobs = max(1, min(jobs or cpu_count(), len(pending) or 1))
+    pool = Pool(processes=jobs) if jobs > 1 else None
+    try:
+        converted = pool.imap_unordered(_convert, pending) if pool else map(_convert, pending)
+        for run_dir, pif_json, error, seconds in converted:
+            if cache is not None and pif_json is not None:
+                cache.put(run_dir, fingerprints[run_dir], pif_json)
+            yield pif_json, RunResult(run_dir, seconds, error=error)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def directories_to_pifs(run_dirs, jobs=None, cache=None, quality_report=False):
+    '''Parallel directory_to_pif over many run directories; see convert_directories for the arguments
+
+    :return: One PIF per run directory, in order, None for runs that failed
+    :rtype: List[System]
+    '''
+
+    converted = {result.run_dir: pif_json
+                 for pif_json, result in convert_directories(run_dirs, jobs, cache, quality_report)}
+    return [None if converted[run_dir] is None else pif.loads(converted[run_dir]) for run_dir in run_dirs]
+
+
+def _shard_path(out_path, k):
+    base, ext = os.path.splitext(out_path)
+    return "{}_{}{}".format(base, k, ext)
+
+
+class ConversionReport(object):
+    '''Per-directory results and written shards of convert_tree'''
+
+    def __init__(self, results, shards, seconds):
+        self.results = results
+        self.shards = shards
+        self.seconds = seconds
+        self.failures = [r for r in results if r.error]
+        self.num_cached = sum(r.cached for r in results)
+
+    def __repr__(self):
+        return "{} runs in {:.2f}s: {} converted, {} cached, {} failed, {} shards".format(
+            len(self.results), self.seconds, len(self.results) - self.num_cached - len(self.failures),
+            self.num_cached, len(self.failures), len(self.shards))
+
+
+def convert_tree(root, out_path, jobs=None, cache_path=None, shard_size=1000, quality_report=False,
+                 print_output=False):
+    '''Converts every run directory under root and streams the PIFs into sharded JSON files
+
+    :param root: Top of the tree, see find_run_directories
+    :type root: str
+    :param out_path: Output name; shards are written as <name>_0.json, <name>_1.json, ...
+    :type out_path: str
+    :param jobs: Worker processes, defaults to the CPU count
+    :type jobs: int
+    :param cache_path: SQLite file caching converted PIFs, defaults to no caching
+    :type cache_path: str
+    :param shard_size: PIFs per shard
+    :type shard_size: int
+    :param quality_report: Passed on to directory_to_pif
+    :type quality_report: bool
+    :param print_output: Whether or not to print each run as it finishes
+    :type print_output: bool
+    :return: Per-directory results and shard paths
+    :rtype: ConversionReport
+    '''
+
+    start = default_timer()
+    cache = PifCache(cache_path) if cache_path else None
+    results = []
+    shards = []
+    shard = None
+    in_shard = 0
+    try:
+        for pif_json, result in convert_directories(find_run_directories(root), jobs, cache, quality_report):
+            results.append(result)
+            if print_output:
+                print(result)
+            if pif_json is None:
+                continue
+            if shard is None:
+                shards.append(_shard_path(out_path, len(shards)))
+                shard = open(shards[-1], "w")
+                shard.write("[")
+                in_shard = 0
+            shard.write(("," if in_shard else "") + pif_json)
+            in_shard += 1
+            if in_shard == shard_size:
+                shard.write("]")
+                shard.close()
+                shard = None
+    finally:
+        if shard is not None:
+            shard.write("]")
+            shard.close()
+        if cache is not None:
+            cache.close()
+    return ConversionReport(results, shards, default_timer() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a tree of VASP runs to sharded PIF JSON")
+    parser.add_argument("root", help="top of the tree of run directories")
+    parser.add_argument("-o", "--out", dest="out_path", default="pifs.json",
+                        help="output name, shards get a _<k> suffix")
+    parser.add_argument("-j", "--jobs", type=int, default=cpu_count(), help="number of worker processes")
+    parser.add_argument("-c", "--cache", dest="cache_path", default=None,
+                        help="SQLite file caching converted PIFs between runs")
+    parser.add_argument("-s", "--shard_size", type=int, default=1000, help="PIFs per output file")
+    parser.add_argument("-q", "--quality_report", action="store_true", help="add the quality report")
+    options = parser.parse_args()
+
+    report = convert_tree(options.root, options.out_path, jobs=options.jobs, cache_path=options.cache_path,
+                          shard_size=options.shard_size, quality_report=options.quality_report,
+                          print_output=True)
+    print(report)
+    for failure in report.failures:
+        print(failure)
+
+
+if __name__ == "__main__":
+    main()
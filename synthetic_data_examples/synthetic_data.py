@@ -0,0 +1,307 @@
+'''
+Generates the clustered synthetic datasets of SyntheticDataDemo.ipynb at any size.
+Points are written into preallocated arrays, and large datasets are produced and written in fixed-size chunks,
+so a 10^8-row file needs the memory of one chunk. Each chunk draws from its own random stream derived from the seed,
+so chunks can be generated across a process pool and the output only depends on the seed and the chunk size.
+
+    x, y = create_clusters(1000, 4, seed=0)
+    write_clusters("cluster_data.csv", 10**8, num_features=4, chunk_size=10**6, jobs=4, seed=0)
+
+Output formats are CSV, PIF JSON and, with pyarrow installed, Parquet.
+'''
+
+import io
+import json
+import os
+from collections import deque
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+
+FORMATS = ("csv", "json", "parquet")
+
+
+class ClusterSpec(object):
+    '''Gaussian clusters: cluster i has mean centers[i] and the given covariance, and output value i
+
+    :param num_features: Input dimensionality
+    :type num_features: int
+    :param num_clusters: Number of clusters
+    :type num_clusters: int
+    :param centers: (num_clusters, num_features) cluster means, defaults to i in every feature for cluster i
+    :type centers: np.ndarray
+    :param cov: Covariance shared by the clusters: a variance, a vector of per-feature variances or a full
+        (num_features, num_features) matrix, defaults to a standard deviation of 1/6
+    :type cov: float or np.ndarray
+    '''
+
+    def __init__(self, num_features=2, num_clusters=4, centers=None, cov=None):
+        self.num_features = int(num_features)
+        self.num_clusters = int(num_clusters)
+        if centers is None:
+            centers = np.repeat(np.arange(self.num_clusters, dtype=np.float64)[:, None], self.num_features, axis=1)
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(self.num_clusters, self.num_features)
+
+        cov = np.asarray((1 / 6.0) ** 2 if cov is None else cov, dtype=np.float64)
+        # the samples are scaled by scale (0-d or 1-d) or multiplied by the Cholesky factor (2-d)
+        if cov.ndim == 2:
+            if cov.shape != (self.num_features, self.num_features):
+                raise ValueError("cov must be ({0}, {0}), got {1}".format(self.num_features, cov.shape))
+            self.scale = None
+            self.factor = np.linalg.cholesky(cov).T
+        else:
+            self.scale = np.sqrt(cov)
+            self.factor = None
+
+    def cluster_bounds(self, num_points):
+        '''First row of each cluster and the end, spreading a remainder over the first clusters'''
+
+        sizes = np.full(self.num_clusters, num_points // self.num_clusters, dtype=np.int64)
+        sizes[:num_points % self.num_clusters] += 1
+        return np.concatenate(([0], np.cumsum(sizes)))
+
+
+def resolve_seed(seed=None):
+    '''An integer seed, drawn from the OS when seed is None, so that every chunk stream derives from it'''
+
+    if seed is not None:
+        return int(seed)
+    return int(np.random.RandomState().randint(2**31))
+
+
+def chunk_stream(seed, chunk):
+    '''Independent random stream of one chunk
+
+    Uses np.random.Generator with a spawned SeedSequence where numpy has them (1.17+), and a RandomState
+    seeded with (seed, chunk) otherwise.
+    '''
+
+    if hasattr(np.random, "SeedSequence"):
+        return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk,)))
+    return np.random.RandomState([seed, chunk])
+
+
+def _standard_normal(rng, out):
+    if hasattr(rng, "bit_generator"):
+        rng.standard_normal(out=out)
+    else:
+        out[...] = rng.standard_normal(out.shape)
+
+
+def fill_clusters(x, y, start, num_points, spec, rng):
+    '''Fills x and y with rows start to start + len(x) of a clustered dataset of num_points rows
+
+    :param x: (n, num_features) float64 array to fill with inputs
+    :type x: np.ndarray
+    :param y: (n,) or (n, 1) array to fill with the cluster of each row
+    :type y: np.ndarray
+    :param start: Row of the dataset that x[0] holds
+    :type start: int
+    :param num_points: Rows of the whole dataset
+    :type num_points: int
+    :param spec: Cluster layout
+    :type spec: ClusterSpec
+    :param rng: Random stream, see chunk_stream
+    '''
+
+    _standard_normal(rng, x)
+    if spec.factor is not None:
+        x[...] = x.dot(spec.factor)
+    else:
+        x *= spec.scale
+    stop = start + len(x)
+    bounds = spec.cluster_bounds(num_points)
+    y = y.reshape(len(y))
+    for i in range(spec.num_clusters):
+        lo, hi = max(bounds[i], start) - start, min(bounds[i + 1], stop) - start
+        if lo < hi:
+            x[lo:hi] += spec.centers[i]
+            y[lo:hi] = i
+
+
+def create_clusters(num_points=1000, num_features=2, num_clusters=4, centers=None, cov=None, seed=None):
+    '''Clustered synthetic dataset in memory, the rows of cluster 0 first
+
+    :param num_points: Total rows, spread as evenly as possible over the clusters
+    :type num_points: int
+    :param num_features: Input dimensionality
+    :type num_features: int
+    :param num_clusters: Number of clusters, see ClusterSpec for centers and cov
+    :type num_clusters: int
+    :param seed: Seed, defaults to fresh entropy
+    :type seed: int
+    :return: (num_points, num_features) inputs and (num_points, 1) outputs
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    '''
+
+    spec = ClusterSpec(num_features, num_clusters, centers, cov)
+    x = np.empty((num_points, spec.num_features))
+    y = np.empty((num_points, 1))
+    fill_clusters(x, y, 0, num_points, spec, chunk_stream(resolve_seed(seed), 0))
+    return x, y
+
+
+def _chunk_tasks(num_points, spec, seed, chunk_size, encode=None):
+    return ((k, start, min(start + chunk_size, num_points), num_points, spec, seed, encode)
+            for k, start in enumerate(range(0, num_points, chunk_size)))
+
+
+def _chunk(task):
+    # runs in a worker process when jobs > 1, where encode also formats the chunk for writing
+    k, start, stop, num_points, spec, seed, encode = task
+    x = np.empty((stop - start, spec.num_features))
+    y = np.empty(stop - start)
+    fill_clusters(x, y, start, num_points, spec, chunk_stream(seed, k))
+    if encode is None:
+        return start, x, y
+    return start, stop - start, encode(x, y, start)
+
+
+def _ordered_map(func, tasks, jobs):
+    # like Pool.imap, but with at most 2 * jobs results waiting, so memory stays bounded when the consumer is slower
+    if jobs <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+    pool = Pool(processes=jobs)
+    try:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(func, (task,)))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def iter_clusters(num_points, num_features=2, num_clusters=4, centers=None, cov=None, seed=None,
+                  chunk_size=10**6, jobs=1):
+    '''Clustered synthetic dataset in chunks of rows, in order
+
+    See create_clusters for the dataset arguments. At most 2 * jobs chunks are in memory at a time.
+
+    :param chunk_size: Rows per chunk
+    :type chunk_size: int
+    :param jobs: Worker processes generating chunks
+    :type jobs: int
+    :return: Generator of (first row, (n, num_features) inputs, (n,) outputs)
+    :rtype: Iterator[Tuple[int, np.ndarray, np.ndarray]]
+    '''
+
+    spec = ClusterSpec(num_features, num_clusters, centers, cov)
+    return _ordered_map(_chunk, _chunk_tasks(num_points, spec, resolve_seed(seed), chunk_size), jobs)
+
+
+def column_names(num_features):
+    return ["x{}".format(i) for i in range(num_features)] + ["y"]
+
+
+def _csv_text(x, y, start, fmt="%.5e"):
+    rows = np.empty((len(x), x.shape[1] + 1))
+    rows[:, :-1] = x
+    rows[:, -1] = y.reshape(len(y))
+    text = io.StringIO()
+    np.savetxt(text, rows, delimiter=",", fmt=fmt)
+    return text.getvalue()
+
+
+def _pif_text(x, y, start, names):
+    # same layout as write_dataset_from_func in clients_sequence, one System per row, without the brackets
+    systems = [{
+        "names": "cluster_{}".format(start + i),
+        "properties": [{"name": name, "scalars": value} for name, value in zip(names, row + [label])],
+        "category": "system",
+    } for i, (row, label) in enumerate(zip(x.tolist(), y.reshape(len(y)).tolist()))]
+    return json.dumps(systems, separators=(",", ":"))[1:-1]
+
+
+def write_cluster_csv(filename, x, y, fmt="%.5e", block_size=10000):
+    '''Writes inputs and outputs to a CSV with columns x0, x1, ..., y
+
+    Rows are copied side by side through one reused block instead of stacking a copy of the whole dataset.
+
+    :param filename: CSV file
+    :type filename: str
+    :param x: (n, num_features) inputs
+    :type x: np.ndarray
+    :param y: (n,) or (n, 1) outputs
+    :type y: np.ndarray
+    :param fmt: Number format
+    :type fmt: str
+    :param block_size: Rows formatted at a time
+    :type block_size: int
+    '''
+
+    y = y.reshape(len(y))
+    block = np.empty((min(block_size, len(x)), x.shape[1] + 1))
+    with open(filename, "w") as f:
+        f.write(",".join(column_names(x.shape[1])) + "\n")
+        for start in range(0, len(x), block_size):
+            rows = block[:min(block_size, len(x) - start)]
+            rows[:, :-1] = x[start:start + len(rows)]
+            rows[:, -1] = y[start:start + len(rows)]
+            np.savetxt(f, rows, delimiter=",", fmt=fmt)
+
+
+def _write_parquet(path, chunks, num_features):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Writing Parquet needs pyarrow, e.g. pip install pyarrow")
+    names = column_names(num_features)
+    writer = pq.ParquetWriter(path, pa.schema([(name, pa.float64()) for name in names]))
+    rows = 0
+    try:
+        for start, x, y in chunks:
+            columns = [pa.array(x[:, j]) for j in range(num_features)] + [pa.array(y)]
+            writer.write_table(pa.Table.from_arrays(columns, names=names))
+            rows += len(x)
+    finally:
+        writer.close()
+    return rows
+
+
+def write_clusters(path, num_points, num_features=2, num_clusters=4, centers=None, cov=None, seed=None,
+                   chunk_size=10**6, jobs=1, file_format=None, fmt="%.5e"):
+    '''Generates a clustered synthetic dataset and writes it chunk by chunk
+
+    See create_clusters and iter_clusters for the dataset, chunk_size and jobs arguments.
+    With jobs > 1, the workers format CSV and PIF chunks as well, which is most of the cost.
+
+    :param path: Output file
+    :type path: str
+    :param file_format: One of FORMATS, defaults to the extension of path
+    :type file_format: str
+    :param fmt: Number format of CSV output
+    :type fmt: str
+    :return: Rows written
+    :rtype: int
+    '''
+
+    file_format = file_format or os.path.splitext(path)[1].lstrip(".").lower()
+    if file_format not in FORMATS:
+        raise ValueError("file_format must be one of {}, got {!r}".format(FORMATS, file_format))
+    spec = ClusterSpec(num_features, num_clusters, centers, cov)
+    seed = resolve_seed(seed)
+    if file_format == "parquet":
+        return _write_parquet(path, _ordered_map(_chunk, _chunk_tasks(num_points, spec, seed, chunk_size), jobs),
+                              spec.num_features)
+
+    names = column_names(spec.num_features)
+    if file_format == "csv":
+        encode, head, separator, tail = partial(_csv_text, fmt=fmt), ",".join(names) + "\n", "", ""
+    else:
+        encode, head, separator, tail = partial(_pif_text, names=names), "[", ",", "]"
+    rows = 0
+    with open(path, "w") as f:
+        f.write(head)
+        for start, n, text in _ordered_map(_chunk, _chunk_tasks(num_points, spec, seed, chunk_size, encode), jobs):
+            f.write((separator if start else "") + text)
+            rows += n
+        f.write(tail)
+    return rows